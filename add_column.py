@@ -1,34 +1,13 @@
-import sqlite3
-import os
+"""
+Brings a local database up to date.
 
-DB_FILE = "amblyocare_v2.db"
-
-def add_column():
-    if not os.path.exists(DB_FILE):
-        print(f"Error: {DB_FILE} not found.")
-        return
-
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    try:
-        print("Checking users table schema...")
-        cursor.execute("PRAGMA table_info(users)")
-        columns = [row[1] for row in cursor.fetchall()]
-        print(f"Current columns: {columns}")
-        
-        if "is_active" not in columns:
-            print("Adding 'is_active' column...")
-            cursor.execute("ALTER TABLE users ADD COLUMN is_active BOOLEAN DEFAULT 1")
-            conn.commit()
-            print("Column added successfully.")
-        else:
-            print("'is_active' column already exists.")
-            
-    except Exception as e:
-        print(f"Error: {e}")
-    finally:
-        conn.close()
+Columns used to be added here by hand with ALTER TABLE; schema changes are
+now Alembic migrations (backend/migrations), and large-table data changes
+are chunked backfills (backend/backfill.py). This script is kept as a
+shortcut for: python -m backend.migrate
+"""
+from backend import migrate
 
 if __name__ == "__main__":
-    add_column()
+    migrate.upgrade()
+    print("Database is up to date.")
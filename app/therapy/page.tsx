@@ -86,25 +86,46 @@ export default function TherapyPage() {
 
     // Ghost Mode (WebSocket)
     const targetGaze = useRef({ x: 0.5, y: 0.5 });
+    // Read live values through refs so the socket isn't reopened on every score tick
+    const liveStats = useRef({ score, duration: sessionDuration });
+    liveStats.current = { score, duration: sessionDuration };
     useEffect(() => {
         if (!selectedGame) return;
         const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
         const wsUrl = apiUrl.replace(/^http/, 'ws');
         const ws = new WebSocket(`${wsUrl}/ws/patient/${userId}`);
 
+        // Server tells us whether anyone is watching and at what rate
+        let paused = false;
+        let minIntervalMs = 0;
+        let lastSent = 0;
+        ws.onmessage = (event) => {
+            try {
+                const msg = JSON.parse(event.data);
+                if (msg.type !== "control") return;
+                paused = msg.action === "pause";
+                minIntervalMs = msg.fps ? 1000 / msg.fps : 0;
+            } catch (e) {
+                console.warn("Ignoring malformed ghost mode control message", e);
+            }
+        };
+
         const interval = setInterval(() => {
+            const now = Date.now();
+            if (paused || now - lastSent < minIntervalMs) return;
             if (ws.readyState === WebSocket.OPEN) {
+                lastSent = now;
                 ws.send(JSON.stringify({
                     type: "stats_update",
                     game: selectedGame,
                     gaze: targetGaze.current,
-                    score: score,
-                    duration: sessionDuration
+                    score: liveStats.current.score,
+                    duration: liveStats.current.duration
                 }));
             }
         }, 100);
         return () => { clearInterval(interval); ws.close(); };
-    }, [selectedGame, userId, score, sessionDuration]);
+    }, [selectedGame, userId]);
 
     // Smooth Gaze
     const handleGazeUpdate = useCallback((x: number, y: number) => {
@@ -0,0 +1,258 @@
+"""
+Online, resumable backfills for large tables.
+
+Schema changes to big tables (therapy_sessions) follow expand / backfill /
+contract:
+
+1. an Alembic migration adds the new column as nullable (no table rewrite,
+   no long lock) and the application starts writing it on insert;
+2. a registered Backfill fills in existing rows, out of band:
+       python -m backend.backfill run <name>
+3. a later migration adds constraints or drops what the column replaced.
+
+A backfill walks the table in primary-key order, CHUNK_SIZE rows at a time.
+Each chunk is one short transaction that updates the rows and advances the
+checkpoint in `backfill_progress`, so a run can be stopped at any point
+(Ctrl-C, deploy, crash) and resumed without redoing or skipping rows. Between
+chunks it sleeps max(SLEEP, chunk_time * SLEEP_RATIO), which caps its share
+of database time; on PostgreSQL each chunk sets a lock_timeout so it yields
+to application traffic instead of queueing behind it. Rows inserted after a
+run starts are above its max_id and are expected to be written correctly by
+the application.
+
+    python -m backend.backfill list
+    python -m backend.backfill status
+    python -m backend.backfill run <name> [--chunk-size N] [--sleep S] [--max-chunks N]
+    python -m backend.backfill reset <name>
+"""
+import argparse
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import Table, select, update, func, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from . import models
+from .game_metadata import json_from_text
+from .database import SessionLocal
+
+CHUNK_SIZE = int(os.getenv("BACKFILL_CHUNK_SIZE", "1000"))
+SLEEP = float(os.getenv("BACKFILL_SLEEP", "0.05"))
+SLEEP_RATIO = float(os.getenv("BACKFILL_SLEEP_RATIO", "1.0"))
+LOCK_TIMEOUT_MS = int(os.getenv("BACKFILL_LOCK_TIMEOUT_MS", "2000"))
+MAX_RETRIES = 5
+REPORT_EVERY = 20 # chunks
+
+
+class Backfill:
+    """
+    Sets `values` (column name -> SQL expression, e.g. a correlated subquery)
+    on every row of `table` matching `pending`.
+    """
+    def __init__(self, name: str, table: Table, values: dict, pending=None, description: str = ""):
+        self.name = name
+        self.table = table
+        self.values = values
+        self.pending = pending
+        self.description = description
+        self.pk = table.primary_key.columns.values()[0]
+
+
+BACKFILLS: Dict[str, Backfill] = {}
+
+
+def register(backfill: Backfill) -> Backfill:
+    BACKFILLS[backfill.name] = backfill
+    return backfill
+
+
+def _progress(db: Session, name: str) -> models.BackfillProgress:
+    progress = db.get(models.BackfillProgress, name)
+    if progress is None:
+        progress = models.BackfillProgress(name=name, status="pending", last_id=0, rows_updated=0, chunks=0)
+        db.add(progress)
+    return progress
+
+
+def _limit_lock_wait(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"SET LOCAL lock_timeout = {int(LOCK_TIMEOUT_MS)}"))
+
+
+def run_chunk(db: Session, backfill: Backfill, chunk_size: int = CHUNK_SIZE) -> Optional[int]:
+    """
+    Processes the next chunk and commits it with the checkpoint. Returns the
+    number of rows updated, or None once the backfill is complete.
+    """
+    _limit_lock_wait(db)
+    progress = _progress(db, backfill.name)
+    now = datetime.utcnow()
+    if progress.max_id is None:
+        progress.max_id = db.execute(select(func.max(backfill.pk))).scalar() or 0
+        progress.started_at = now
+    if progress.last_id >= progress.max_id:
+        progress.status = "done"
+        progress.finished_at = progress.finished_at or now
+        db.commit()
+        return None
+
+    pk = backfill.pk
+    # Upper bound of this chunk: the chunk_size-th key after the checkpoint
+    hi = db.execute(
+        select(pk).where(pk > progress.last_id, pk <= progress.max_id)
+        .order_by(pk).offset(chunk_size - 1).limit(1)
+    ).scalar()
+    hi = progress.max_id if hi is None else hi
+
+    stmt = update(backfill.table).where(pk > progress.last_id, pk <= hi).values(backfill.values)
+    if backfill.pending is not None:
+        stmt = stmt.where(backfill.pending)
+    updated = db.execute(stmt).rowcount
+
+    progress.last_id = hi
+    progress.rows_updated += updated
+    progress.chunks += 1
+    progress.status = "running"
+    progress.updated_at = now
+    progress.last_error = None
+    db.commit()
+    return updated
+
+
+def run(backfill, session_factory=SessionLocal, chunk_size: int = CHUNK_SIZE, sleep: float = SLEEP,
+        sleep_ratio: float = SLEEP_RATIO, max_chunks: int = None, report=print) -> dict:
+    """Runs (or resumes) a backfill until done or max_chunks. Returns its status."""
+    if isinstance(backfill, str):
+        backfill = BACKFILLS[backfill]
+    started = time.monotonic()
+    chunks = rows = retries = 0
+    while max_chunks is None or chunks < max_chunks:
+        db = session_factory()
+        try:
+            t = time.monotonic()
+            try:
+                updated = run_chunk(db, backfill, chunk_size)
+            except OperationalError as e:
+                # Lock timeout or a busy database: back off and retry the same chunk
+                db.rollback()
+                retries += 1
+                if retries > MAX_RETRIES:
+                    progress = _progress(db, backfill.name)
+                    progress.status = "paused"
+                    progress.last_error = repr(e)
+                    db.commit()
+                    raise
+                time.sleep(min(30.0, sleep * 2 ** retries + 0.5))
+                continue
+            retries = 0
+            if updated is None:
+                break
+            chunks += 1
+            rows += updated
+            elapsed = time.monotonic() - t
+            if report and chunks % REPORT_EVERY == 0:
+                report(_format(status(db, backfill.name), rows / max(time.monotonic() - started, 1e-9)))
+        finally:
+            db.close()
+        if max_chunks is None or chunks < max_chunks:
+            time.sleep(max(sleep, elapsed * sleep_ratio))
+
+    db = session_factory()
+    try:
+        result = status(db, backfill.name)
+    finally:
+        db.close()
+    if report:
+        report(_format(result, rows / max(time.monotonic() - started, 1e-9)))
+    return result
+
+
+def status(db: Session, name: str = None):
+    """Progress of one backfill (dict) or of all known ones (list)."""
+    def describe(p):
+        span = p.max_id or 0
+        return {
+            "name": p.name, "status": p.status, "last_id": p.last_id, "max_id": p.max_id,
+            "percent": round(100.0 * min(p.last_id, span) / span, 1) if span else (100.0 if p.status == "done" else 0.0),
+            "rows_updated": p.rows_updated, "chunks": p.chunks,
+            "started_at": p.started_at, "updated_at": p.updated_at, "finished_at": p.finished_at,
+            "last_error": p.last_error,
+        }
+    if name is not None:
+        progress = db.get(models.BackfillProgress, name)
+        return describe(progress) if progress else {"name": name, "status": "pending", "percent": 0.0}
+    return [describe(p) for p in db.query(models.BackfillProgress).order_by(models.BackfillProgress.name)]
+
+
+def reset(db: Session, name: str):
+    db.query(models.BackfillProgress).filter(models.BackfillProgress.name == name).delete()
+    db.commit()
+
+
+def _format(s: dict, rate: float = None) -> str:
+    line = f"[BACKFILL] {s['name']}: {s['status']} {s['percent']}% " \
+           f"(id {s.get('last_id')}/{s.get('max_id')}, {s.get('rows_updated', 0)} rows updated"
+    return line + (f", {rate:.0f} rows/s)" if rate is not None else ")")
+
+
+# --- Registered backfills ---
+
+_sessions = models.TherapySession.__table__
+_profiles = models.PatientProfile.__table__
+
+register(Backfill(
+    "therapy_sessions_user_id", _sessions,
+    {"user_id": select(_profiles.c.user_id).where(_profiles.c.id == _sessions.c.patient_id).scalar_subquery()},
+    pending=_sessions.c.user_id.is_(None),
+    description="copy patient_profiles.user_id onto therapy_sessions (migration 0003)",
+))
+
+register(Backfill(
+    "therapy_sessions_game_data", _sessions,
+    {"game_data": json_from_text(_sessions.c.game_metadata)},
+    pending=_sessions.c.game_data.is_(None) & _sessions.c.game_metadata.not_in(["", "{}"]),
+    description="parse legacy game_metadata text into the game_data JSON column (migration 0006)",
+))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AmblyoCare online backfills")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="registered backfills")
+    sub.add_parser("status", help="progress of started backfills")
+    run_parser = sub.add_parser("run", help="run or resume a backfill")
+    run_parser.add_argument("name")
+    run_parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    run_parser.add_argument("--sleep", type=float, default=SLEEP)
+    run_parser.add_argument("--sleep-ratio", type=float, default=SLEEP_RATIO)
+    run_parser.add_argument("--max-chunks", type=int)
+    reset_parser = sub.add_parser("reset", help="forget a backfill's checkpoint so it starts over")
+    reset_parser.add_argument("name")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for backfill in BACKFILLS.values():
+            print(f"{backfill.name}: {backfill.description}")
+    elif args.command == "run":
+        if args.name not in BACKFILLS:
+            parser.error(f"unknown backfill '{args.name}' (see: list)")
+        run(args.name, chunk_size=args.chunk_size, sleep=args.sleep, sleep_ratio=args.sleep_ratio,
+            max_chunks=args.max_chunks)
+    else:
+        db = SessionLocal()
+        try:
+            if args.command == "status":
+                for s in status(db):
+                    print(_format(s))
+            else:
+                reset(db, args.name)
+                print(f"Reset {args.name}")
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
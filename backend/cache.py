@@ -0,0 +1,276 @@
+"""
+Response cache for read-mostly endpoints.
+
+Endpoints wrap their computation in get_or_set(namespace, key, compute) with
+a per-namespace TTL (TTLS, overridable with CACHE_TTL_<NAMESPACE>). Writes in
+crud.py call invalidate(namespace) after committing.
+
+Invalidation is by generation: every namespace ("doctors", "stats:42", ...)
+has a counter that is part of each cache key, and invalidating bumps it, so
+all older entries become unreachable at once and age out through their TTL
+or LRU eviction. Nothing has to enumerate keys.
+
+Backends (CACHE_BACKEND):
+- "memory" (default): in-process LRU, bounded by CACHE_MAX_ENTRIES. Each
+  worker has its own copy; invalidations only reach the worker that made
+  the write, and the other workers catch up within the TTL.
+- "redis": shared by all workers (CACHE_URL, e.g. redis://localhost:6379/0),
+  so an invalidation is seen everywhere. Any client with get/set(ex=)/incr
+  works, and a local `redis-server` (or `docker run -p 6379:6379 redis`)
+  is enough to try it.
+- "none": caching disabled.
+
+Concurrent misses for the same key are coalesced (backend/singleflight.py):
+one request computes and stores the value, the others wait for it, so a
+popular entry expiring costs one query instead of a stampede. "coalesced" in
+the metrics counts the requests that were served this way.
+
+Values must be JSON-serializable (the shared backend stores JSON).
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from . import singleflight
+
+BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+KEY_PREFIX = "amblyocare:"
+
+# Seconds; the namespace is the part before the first ":"
+TTLS = {
+    "doctors": 300,
+    "doctor_patients": 60,
+    "leaderboard": 30,
+    "stats": 60,
+    "cohort": 300,  # TTL only: cohort comparisons tolerate a few minutes' lag
+}
+DEFAULT_TTL = 60
+
+
+def ttl_for(namespace: str) -> int:
+    name = namespace.split(":", 1)[0]
+    return int(os.getenv(f"CACHE_TTL_{name.upper()}", TTLS.get(name, DEFAULT_TTL)))
+
+
+class LocalLRU:
+    """Thread-safe in-process LRU with per-entry expiry."""
+
+    blocking = False
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        # Counters (namespace generations) are kept apart so eviction can't reset them
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: Optional[int] = None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = self._counters.get(key, 0) + 1
+            self._counters[key] = value
+            return value
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._counters.clear()
+
+
+class SharedBackend:
+    """Cache shared between processes through a Redis-compatible client."""
+
+    blocking = True
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str):
+        import redis  # optional dependency, only needed for this backend
+        return cls(redis.Redis.from_url(url, socket_timeout=0.5))
+
+    def get(self, key: str):
+        raw = self.client.get(KEY_PREFIX + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value, ttl: Optional[int] = None):
+        self.client.set(KEY_PREFIX + key, json.dumps(value), ex=ttl)
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(KEY_PREFIX + key))
+
+
+class NullBackend:
+    blocking = False
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def incr(self, key):
+        return 0
+
+
+def make_backend(name: str = BACKEND):
+    if name == "memory":
+        return LocalLRU()
+    if name == "redis":
+        return SharedBackend.from_url(CACHE_URL)
+    if name == "none":
+        return NullBackend()
+    raise ValueError(f"Unknown CACHE_BACKEND '{name}'")
+
+
+class Cache:
+    def __init__(self, backend):
+        self.backend = backend
+        self._stats = defaultdict(lambda: {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0, "invalidations": 0})
+        self._flights = singleflight.Group()
+        self._async_flights = singleflight.AsyncGroup()
+
+    def _count(self, namespace: str, field: str):
+        self._stats[namespace.split(":", 1)[0]][field] += 1
+
+    def _generation(self, namespace: str):
+        return self.backend.get(f"gen:{namespace}") or 0
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{namespace}:v{self._generation(namespace)}:{key}"
+
+    def lookup(self, namespace: str, key: str = ""):
+        """(full_key, value); value is None on a miss. Backend errors count as misses."""
+        try:
+            full_key = self._key(namespace, key)
+            value = self.backend.get(full_key)
+        except Exception:
+            self._count(namespace, "errors")
+            return None, None
+        self._count(namespace, "hits" if value is not None else "misses")
+        return full_key, value
+
+    def store(self, namespace: str, full_key: Optional[str], value, ttl: int = None):
+        if full_key is None:
+            return
+        try:
+            self.backend.set(full_key, value, ttl or ttl_for(namespace))
+        except Exception:
+            self._count(namespace, "errors")
+
+    def _peek(self, full_key: Optional[str]):
+        """Uncounted re-check, for a flight that starts just after another one stored the value."""
+        if full_key is None:
+            return None
+        try:
+            return self.backend.get(full_key)
+        except Exception:
+            return None
+
+    def get_or_set(self, namespace: str, key: str, compute: Callable[[], Any], ttl: int = None):
+        full_key, value = self.lookup(namespace, key)
+        if value is not None:
+            return value
+
+        def fill():
+            value = self._peek(full_key)
+            if value is None:
+                value = compute()
+                self.store(namespace, full_key, value, ttl)
+            return value
+
+        # Concurrent misses for the same key share one computation
+        value, shared = self._flights.do(full_key or f"{namespace}:{key}", fill)
+        if shared:
+            self._count(namespace, "coalesced")
+        return value
+
+    async def get_or_set_async(self, namespace: str, key: str, compute, ttl: int = None):
+        """Async variant; `compute` is a coroutine function. Blocking backends run in the threadpool."""
+        blocking = self.backend.blocking
+        if blocking:
+            full_key, value = await run_in_threadpool(self.lookup, namespace, key)
+        else:
+            full_key, value = self.lookup(namespace, key)
+        if value is not None:
+            return value
+
+        async def fill():
+            value = await run_in_threadpool(self._peek, full_key) if blocking else self._peek(full_key)
+            if value is None:
+                value = await compute()
+                if blocking:
+                    await run_in_threadpool(self.store, namespace, full_key, value, ttl)
+                else:
+                    self.store(namespace, full_key, value, ttl)
+            return value
+
+        value, shared = await self._async_flights.do(full_key or f"{namespace}:{key}", fill)
+        if shared:
+            self._count(namespace, "coalesced")
+        return value
+
+    def invalidate(self, *namespaces: str):
+        for namespace in namespaces:
+            try:
+                self.backend.incr(f"gen:{namespace}")
+            except Exception:
+                self._count(namespace, "errors")
+                print(f"[CACHE] Invalidation of {namespace} failed; entries expire within {ttl_for(namespace)}s")
+                continue
+            self._count(namespace, "invalidations")
+
+    def clear(self):
+        """Drops all entries (local backend) and resets the metrics."""
+        if isinstance(self.backend, LocalLRU):
+            self.backend.clear()
+        self._stats.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        namespaces = {}
+        for name, counts in self._stats.items():
+            lookups = counts["hits"] + counts["misses"]
+            namespaces[name] = {**counts, "hit_rate": round(counts["hits"] / lookups, 3) if lookups else None}
+        result = {
+            "backend": type(self.backend).__name__,
+            "namespaces": namespaces,
+            "in_flight": self._flights.in_flight() + self._async_flights.in_flight(),
+        }
+        if isinstance(self.backend, LocalLRU):
+            result["entries"] = len(self.backend)
+        return result
+
+
+cache = Cache(make_backend())
@@ -0,0 +1,33 @@
+"""
+Batch claiming for database-backed work tables (notification outbox, job queue).
+
+A claim stamps up to `limit` due rows with a unique token in one UPDATE whose
+row set comes from a `SELECT ... FOR UPDATE SKIP LOCKED` subquery, so
+concurrent workers on PostgreSQL skip each other's rows instead of blocking.
+SQLite has no row locks and renders no lock clause, but it serializes
+writers, so the single UPDATE is already atomic there.
+"""
+import uuid
+
+from sqlalchemy import Table, select, update
+from sqlalchemy.orm import Session
+
+
+def claim_rows(db: Session, table: Table, due, limit: int, token_column: str, values: dict):
+    """Claims due rows, commits, and returns the claimed rows ordered by id."""
+    token = uuid.uuid4().hex
+    ids = (
+        select(table.c.id)
+        .where(due)
+        .order_by(table.c.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    db.execute(
+        update(table)
+        .where(table.c.id.in_(ids))
+        .values({token_column: token, **values})
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return db.execute(select(table).where(table.c[token_column] == token).order_by(table.c.id)).all()
@@ -0,0 +1,181 @@
+"""
+Cohort analytics: how a patient's trajectory compares with a caseload.
+
+load() pulls every completed session of a cohort (one doctor's patients, or
+all patients of the doctor's clinic) in a single query, ordered by patient
+and time, into column arrays. compute() then works on whole arrays: patients
+are contiguous runs, so per-patient sums are np.add.reduceat over the run
+starts and no Python loop touches individual sessions. Per patient:
+
+- score_slope / accuracy_slope: least-squares trend per week of therapy,
+  from the closed form (n*Sxy - Sx*Sy) / (n*Sxx - Sx^2);
+- improvement_rate: mean score of the last quarter of sessions relative to
+  the first quarter (0.25 = 25% better);
+- sessions_per_week over the patient's active span;
+
+and, for each of these, the patient's percentile within the cohort plus the
+cohort's p10..p90.
+
+compute() is a pure function of picklable arrays. Large cohorts (at least
+PROCESS_POOL_MIN_ROWS sessions) run in a process pool so the work neither
+blocks the event loop nor holds the GIL; small ones are cheaper in the
+threadpool than the pickling round trip.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+
+PROCESS_POOL_WORKERS = int(os.getenv("COHORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PROCESS_POOL_MIN_ROWS = int(os.getenv("COHORT_PROCESS_POOL_MIN_ROWS", "20000"))
+MIN_SESSIONS_FOR_TREND = 3
+METRICS = ("score_slope", "accuracy_slope", "improvement_rate", "sessions_per_week")
+PERCENTILES = (10, 25, 50, 75, 90)
+SECONDS_PER_WEEK = 7 * 24 * 3600
+EPOCH = datetime(1970, 1, 1)  # start_time is naive UTC
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+async def load(db: AsyncSession, doctor_id: int = None, clinic_name: str = None) -> Dict[str, np.ndarray]:
+    """Completed sessions of a doctor's (or a clinic's) patients as column arrays, grouped by patient."""
+    sessions, profiles = models.TherapySession, models.PatientProfile
+    stmt = (
+        select(sessions.user_id, sessions.start_time, sessions.score, sessions.accuracy)
+        .join(profiles, profiles.id == sessions.patient_id)
+        .where(sessions.scheduled_date.is_(None), sessions.user_id.is_not(None), sessions.start_time.is_not(None))
+        .order_by(sessions.user_id, sessions.start_time)
+    )
+    if clinic_name is not None:
+        doctors = select(models.DoctorProfile.id).where(models.DoctorProfile.clinic_name == clinic_name)
+        stmt = stmt.where(profiles.doctor_id.in_(doctors))
+    else:
+        stmt = stmt.where(profiles.doctor_id == doctor_id)
+
+    rows = (await db.execute(stmt)).all()
+    user_id, start, score, accuracy = zip(*rows) if rows else ((), (), (), ())
+    return {
+        "user_id": np.array(user_id, dtype=np.int64),
+        "t": np.array([(s - EPOCH).total_seconds() for s in start], dtype=np.float64),
+        "score": np.array([v if v is not None else np.nan for v in score], dtype=np.float64),
+        "accuracy": np.array([v if v is not None else np.nan for v in accuracy], dtype=np.float64),
+    }
+
+
+async def player_names(db: AsyncSession, user_ids) -> Dict[int, str]:
+    ids = [int(i) for i in user_ids]
+    if not ids:
+        return {}
+    result = await db.execute(select(models.User.id, models.User.full_name).where(models.User.id.in_(ids)))
+    return dict(result.all())
+
+
+def _group_slopes(x: np.ndarray, y: np.ndarray, starts: np.ndarray, n: np.ndarray) -> np.ndarray:
+    """Least-squares slope of y over x for each contiguous group; NaN y values are ignored."""
+    valid = ~np.isnan(y)
+    x, y = np.where(valid, x, 0.0), np.where(valid, y, 0.0)
+    count = np.add.reduceat(valid.astype(np.float64), starts)
+    sx, sy = np.add.reduceat(x, starts), np.add.reduceat(y, starts)
+    sxx, sxy = np.add.reduceat(x * x, starts), np.add.reduceat(x * y, starts)
+    denominator = count * sxx - sx * sx
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (count * sxy - sx * sy) / denominator
+    return np.where((count >= MIN_SESSIONS_FOR_TREND) & (np.abs(denominator) > 1e-12), slope, np.nan)
+
+
+def _percentile_ranks(values: np.ndarray) -> np.ndarray:
+    """Each value's percentile within the non-NaN values (ties share their average rank)."""
+    ranks = np.full(values.shape, np.nan)
+    present = ~np.isnan(values)
+    finite = values[present]
+    if finite.size:
+        ordered = np.sort(finite)
+        below = np.searchsorted(ordered, finite, side="left")
+        at_or_below = np.searchsorted(ordered, finite, side="right")
+        ranks[present] = 100.0 * (below + at_or_below) / (2 * finite.size)
+    return ranks
+
+
+def compute(arrays: Dict[str, np.ndarray]) -> dict:
+    user_id = arrays["user_id"]
+    if user_id.size == 0:
+        return {"patients": [], "cohort": {"patients": 0, "sessions": 0, "distribution": {}}}
+
+    starts = np.flatnonzero(np.r_[True, user_id[1:] != user_id[:-1]])
+    n = np.diff(np.r_[starts, user_id.size])
+    group = np.repeat(np.arange(starts.size), n)
+
+    # Weeks since each patient's first session (keeps the sums well conditioned)
+    weeks = (arrays["t"] - arrays["t"][starts][group]) / SECONDS_PER_WEEK
+    score, accuracy = arrays["score"], arrays["accuracy"]
+    span_weeks = weeks[starts + n - 1]
+
+    # First and last quarter of each patient's sessions, by position within the group
+    position = np.arange(user_id.size) - starts[group]
+    k = np.maximum(1, n // 4)
+    score0 = np.nan_to_num(score)
+    first = np.add.reduceat(np.where(position < k[group], score0, 0.0), starts) / k
+    last = np.add.reduceat(np.where(position >= (n - k)[group], score0, 0.0), starts) / k
+    with np.errstate(divide="ignore", invalid="ignore"):
+        improvement = np.where((n >= 2) & (first > 0), (last - first) / first, np.nan)
+        per_week = np.where(span_weeks > 0, n / np.maximum(span_weeks, 1.0 / 7), np.nan)
+
+    metrics = {
+        "score_slope": _group_slopes(weeks, score, starts, n),
+        "accuracy_slope": _group_slopes(weeks, accuracy, starts, n),
+        "improvement_rate": improvement,
+        "sessions_per_week": per_week,
+    }
+    ranks = {name: _percentile_ranks(values) for name, values in metrics.items()}
+
+    def clean(value):
+        return None if np.isnan(value) else round(float(value), 4)
+
+    patients = [
+        {
+            "user_id": int(user_id[starts[i]]),
+            "sessions": int(n[i]),
+            **{name: clean(metrics[name][i]) for name in METRICS},
+            "percentiles": {name: clean(ranks[name][i]) for name in METRICS},
+        }
+        for i in range(starts.size)
+    ]
+    distribution = {}
+    for name, values in metrics.items():
+        finite = values[~np.isnan(values)]
+        distribution[name] = (
+            dict(zip((f"p{p}" for p in PERCENTILES), np.round(np.percentile(finite, PERCENTILES), 4).tolist()))
+            if finite.size else None
+        )
+    return {
+        "patients": patients,
+        "cohort": {"patients": int(starts.size), "sessions": int(user_id.size), "distribution": distribution},
+    }
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PROCESS_POOL_WORKERS)
+    return _pool
+
+
+async def compute_async(arrays: Dict[str, np.ndarray], min_rows_for_pool: int = PROCESS_POOL_MIN_ROWS) -> dict:
+    if arrays["user_id"].size < min_rows_for_pool:
+        return await run_in_threadpool(compute, arrays)
+    return await asyncio.get_running_loop().run_in_executor(_get_pool(), compute, arrays)
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
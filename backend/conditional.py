@@ -0,0 +1,76 @@
+"""
+Conditional GET for per-patient read endpoints.
+
+Dashboards poll stats, session history and notes far more often than they
+change. Each of these resources has a cheap validator, (row count, max id,
+latest timestamp) read from an index, and a weak ETag built from it. When the
+client's If-None-Match (or If-Modified-Since) still matches, the endpoint
+answers 304 before it runs the real query or serializes anything.
+
+Rows in these tables are only ever inserted, so count + max id change with
+every write that affects session history and notes. Stats also depend on
+the date (streak_days counts back from today), so their validator includes
+today's UTC date and their Last-Modified is never earlier than midnight:
+the response changes at midnight without any write.
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+CACHE_CONTROL = "private, no-cache"  # may be stored, but must be revalidated
+
+
+class Validator:
+    def __init__(self, resource: str, count: int, max_id: Optional[int], last_modified: Optional[datetime]):
+        self.etag = f'W/"{resource}-{count}-{max_id or 0}"'
+        self.last_modified = last_modified
+
+    @property
+    def last_modified_header(self) -> Optional[str]:
+        if self.last_modified is None:
+            return None
+        # Stored as naive UTC; HTTP dates have whole-second precision
+        when = self.last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+        return format_datetime(when, usegmt=True)
+
+    def headers(self) -> dict:
+        headers = {"ETag": self.etag, "Cache-Control": CACHE_CONTROL}
+        if self.last_modified_header:
+            headers["Last-Modified"] = self.last_modified_header
+        return headers
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Weak comparison (RFC 9110 8.8.3.2): W/ prefixes are ignored
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def _not_modified_since(header: str, validator: Validator) -> bool:
+    if validator.last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    return validator.last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+def not_modified(request: Request, validator: Validator) -> Optional[Response]:
+    """A 304 response if the client's copy is current, else None."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, validator.etag)
+    else:
+        # If-Modified-Since is only consulted without If-None-Match
+        if_modified_since = request.headers.get("if-modified-since")
+        fresh = if_modified_since is not None and _not_modified_since(if_modified_since, validator)
+    return Response(status_code=304, headers=validator.headers()) if fresh else None
+
+
+def set_validators(response: Response, validator: Validator):
+    response.headers.update(validator.headers())
@@ -1,16 +1,12 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from . import models, schemas
-# pwd_context removed, handled in main or via import
-# To avoid circular import, we can move security logic to a separate file, but for now let's duplicate or refactor.
-# Refactoring is safer: Move security logic to security.py
-# But simpler fix: Import get_password_hash? No, circular import (main imports crud).
-# SOLUTION: Use bcrypt directly here too.
+from . import models, schemas, jobqueue, leaderboard, game_metadata, sketches, trends
+from .cache import cache
+from .security import get_password_hash
 
-import bcrypt
-
-def get_password_hash(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# Writes invalidate the cached reads they affect (see cache.py), always after
+# commit so a concurrent reader can't re-cache the old state.
 
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
@@ -26,8 +22,17 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    if db_user.role == models.UserRole.DOCTOR:
+        cache.invalidate("doctors")
     return db_user
 
+def create_doctor_profile(db: Session, user_id: int, clinic_name: str = "Unassigned Clinic", license_number: str = "PENDING"):
+    db_doc = models.DoctorProfile(user_id=user_id, clinic_name=clinic_name, license_number=license_number)
+    db.add(db_doc)
+    db.commit()
+    cache.invalidate("doctors")
+    return db_doc
+
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.User).offset(skip).limit(limit).all()
 
@@ -42,6 +47,10 @@ def get_children_for_parent(db: Session, parent_id: int):
         models.PatientProfile.parent_id == parent_id
     ).all()
 
+def get_doctor_id_for_patient(db: Session, user_id: int):
+    profile = db.query(models.PatientProfile.doctor_id).filter(models.PatientProfile.user_id == user_id).first()
+    return profile.doctor_id if profile else None
+
 def get_all_doctors(db: Session):
     return db.query(models.User).filter(models.User.role == "doctor").all()
 
@@ -55,8 +64,24 @@ def create_patient_profile(db: Session, profile: schemas.PatientProfileCreate, u
     db.add(db_profile)
     db.commit()
     db.refresh(db_profile)
+    if doctor_id:
+        cache.invalidate(f"doctor_patients:{doctor_id}")
     return db_profile
 
+def assign_doctor(db: Session, profile: models.PatientProfile, doctor_id: int):
+    previous = profile.doctor_id
+    profile.doctor_id = doctor_id
+    db.commit()
+    cache.invalidate(*{f"doctor_patients:{d}" for d in (previous, doctor_id) if d})
+    return profile
+
+def link_parent(db: Session, profile: models.PatientProfile, parent_id: int):
+    profile.parent_id = parent_id
+    db.commit()
+    if profile.doctor_id:
+        cache.invalidate(f"doctor_patients:{profile.doctor_id}")
+    return profile
+
 def create_therapy_session(db: Session, session: schemas.SessionCreate):
     # Ensure patient profile exists, or create/link. 
     # For simplicity, we'll try to find a patient profile for this user.
@@ -71,6 +96,7 @@ def create_therapy_session(db: Session, session: schemas.SessionCreate):
     
     db_session = models.TherapySession(
         patient_id=patient.id,
+        user_id=session.user_id,
         game_type=session.game_type,
         difficulty=session.difficulty,
         duration_seconds=session.duration_seconds,
@@ -81,96 +107,158 @@ def create_therapy_session(db: Session, session: schemas.SessionCreate):
         avg_response_time=session.avg_response_time,
         dichoptic_contrast_level=session.dichoptic_contrast_level,
         completion_rate=session.completion_rate,
-        game_metadata=session.game_metadata
+        game_data=session.game_metadata
     )
     db.add(db_session)
+    db.flush()
+    if session.trials and session.trials.t_ms:
+        store_session_trials(db, db_session.id, session.trials)
+    # Achievement evaluation runs off the request path, committed atomically with the session
+    jobqueue.enqueue(db, "evaluate_achievements", {"user_id": session.user_id, "session_id": db_session.id})
+    boards = leaderboard.record_session(db, db_session)
+    trends.record_session(db, db_session)
     db.commit()
+    leaderboard.store.apply(db_session.user_id, boards)
+    sketches.store.record(db_session)
+    cache.invalidate(f"stats:{session.user_id}", "leaderboard")
     db.refresh(db_session)
     return db_session
 
+def schedule_therapy_session(db: Session, patient: models.PatientProfile, date: datetime,
+                             game_type: str = "space", difficulty: str = "medium"):
+    # In real app, we might have a separate 'Schedule' table, but using TherapySession with future date works for MVP
+    db_session = models.TherapySession(
+        patient_id=patient.id,
+        user_id=patient.user_id,
+        scheduled_date=date,
+        game_type=game_type,
+        difficulty=difficulty,
+        duration_seconds=0,
+        score=0
+    )
+    db.add(db_session)
+    db.commit()
+    db.refresh(db_session)
+    cache.invalidate(f"stats:{patient.user_id}")
+    return db_session
+
+def store_session_trials(db: Session, session_id: int, upload: schemas.TrialsUpload):
+    """Encodes a session's trials and their metrics (not committed; part of the session's transaction)."""
+    from . import trials  # numpy, imported on first use
+    arrays = trials.to_arrays(upload.t_ms, upload.x, upload.y, upload.hit, upload.rt_ms)
+    row = models.SessionTrials(session_id=session_id, n_trials=len(upload.t_ms),
+                               data=trials.encode(arrays), metrics=trials.compute_metrics(arrays))
+    db.add(row)
+    return row
+
+def get_session_trials(db: Session, session_id: int):
+    return db.get(models.SessionTrials, session_id)
+
 def get_user_sessions(db: Session, user_id: int):
-    # Join Payload: We need sessions linked to the user's patient profile
+    # therapy_sessions.user_id is denormalized from the patient profile (no join needed)
     return db.query(models.TherapySession)\
-        .join(models.PatientProfile)\
-        .filter(models.PatientProfile.user_id == user_id)\
+        .filter(models.TherapySession.user_id == user_id)\
         .order_by(models.TherapySession.start_time.desc())\
         .all()
 
-def get_patient_stats(db: Session, user_id: int):
+def search_sessions(db: Session, game_type: str = None, filters=(), doctor_id: int = None, limit: int = 100):
     """
-    Aggregates session data to return high-level stats:
+    Sessions matching game_metadata filters ((key, op, value) from
+    game_metadata.parse_filter), newest first. Filters apply to the promoted
+    meta_* columns, so each is served by its (game_type, meta_<key>) index.
+    """
+    sessions = models.TherapySession
+    query = db.query(sessions)
+    if game_type:
+        query = query.filter(sessions.game_type == game_type)
+    for key, op, value in filters:
+        query = query.filter(game_metadata.OPERATORS[op](getattr(sessions, f"meta_{key}"), value))
+    if doctor_id is not None:
+        query = query.join(models.PatientProfile, models.PatientProfile.id == sessions.patient_id)\
+            .filter(models.PatientProfile.doctor_id == doctor_id)
+    return query.order_by(sessions.start_time.desc()).limit(limit).all()
+
+def summarize_sessions(sessions):
+    """
+    Aggregates session rows to return high-level stats:
     - total_sessions
     - total_duration_minutes
     - average_accuracy
     - current_streak_days
+    Pure function shared by the sync and async (crud_async) paths.
     """
-    print(f"DEBUG: get_patient_stats for user_id={user_id}")
-    try:
-        sessions = get_user_sessions(db, user_id)
-        print(f"DEBUG: Found {len(sessions)} sessions")
-        
-        total_sessions = len(sessions)
-        if total_sessions == 0:
-            return {
-                "total_sessions": 0,
-                "total_duration_minutes": 0,
-                "average_accuracy": 0,
-                "balloons_popped": 0,
-                "streak_days": 0
-            }
-            
-        total_seconds = sum(s.duration_seconds for s in sessions)
-        total_balloons = sum(s.balloons_popped for s in sessions)
-        avg_acc = sum(s.accuracy for s in sessions) / total_sessions
-        
-        # Calculate Streak (naive implementation)
-        # Sort by date desc
-        sorted_sessions = sorted(sessions, key=lambda x: x.start_time, reverse=True)
-        current_streak = 0
-        today = datetime.utcnow().date()
-        # Check if played today
-        if not sorted_sessions or not sorted_sessions[0].start_time:
-             # Fallback if start_time missing
-             return {
-                "total_sessions": total_sessions,
-                "total_duration_minutes": int(total_seconds / 60),
-                "average_accuracy": round(avg_acc, 2),
-                "balloons_popped": total_balloons,
-                "streak_days": 0
-            }
-
-        last_play_date = sorted_sessions[0].start_time.date()
-        
-        if last_play_date == today:
-            current_streak = 1
-            check_date = today - timedelta(days=1)
-        elif last_play_date == today - timedelta(days=1):
-            current_streak = 1
-            check_date = today - timedelta(days=2)
-        else:
-            return {
-                "total_sessions": total_sessions,
-                "total_duration_minutes": int(total_seconds / 60),
-                "average_accuracy": round(avg_acc, 2),
-                "balloons_popped": total_balloons,
-                "streak_days": 0
-            }
-
-        # Iterate backwards to find consecutive days
-        # (Simple logic, could be optimized with SQL window functions)
-        dates_played = {s.start_time.date() for s in sorted_sessions if s.start_time}
-        
-        while check_date in dates_played:
-            current_streak += 1
-            check_date -= timedelta(days=1)
-            
+    total_sessions = len(sessions)
+    if total_sessions == 0:
+        return {
+            "total_sessions": 0,
+            "total_duration_minutes": 0,
+            "average_accuracy": 0,
+            "balloons_popped": 0,
+            "streak_days": 0
+        }
+
+    total_seconds = sum(s.duration_seconds for s in sessions)
+    total_balloons = sum(s.balloons_popped for s in sessions)
+    avg_acc = sum(s.accuracy for s in sessions) / total_sessions
+
+    # Calculate Streak (naive implementation)
+    # Sort by date desc
+    sorted_sessions = sorted(sessions, key=lambda x: x.start_time, reverse=True)
+    current_streak = 0
+    today = datetime.utcnow().date()
+    # Check if played today
+    if not sorted_sessions or not sorted_sessions[0].start_time:
+         # Fallback if start_time missing
+         return {
+            "total_sessions": total_sessions,
+            "total_duration_minutes": int(total_seconds / 60),
+            "average_accuracy": round(avg_acc, 2),
+            "balloons_popped": total_balloons,
+            "streak_days": 0
+        }
+
+    last_play_date = sorted_sessions[0].start_time.date()
+
+    if last_play_date == today:
+        current_streak = 1
+        check_date = today - timedelta(days=1)
+    elif last_play_date == today - timedelta(days=1):
+        current_streak = 1
+        check_date = today - timedelta(days=2)
+    else:
         return {
             "total_sessions": total_sessions,
             "total_duration_minutes": int(total_seconds / 60),
             "average_accuracy": round(avg_acc, 2),
             "balloons_popped": total_balloons,
-            "streak_days": current_streak
+            "streak_days": 0
         }
+
+    # Iterate backwards to find consecutive days
+    # (Simple logic, could be optimized with SQL window functions)
+    dates_played = {s.start_time.date() for s in sorted_sessions if s.start_time}
+
+    while check_date in dates_played:
+        current_streak += 1
+        check_date -= timedelta(days=1)
+
+    return {
+        "total_sessions": total_sessions,
+        "total_duration_minutes": int(total_seconds / 60),
+        "average_accuracy": round(avg_acc, 2),
+        "balloons_popped": total_balloons,
+        "streak_days": current_streak
+    }
+
+def get_patient_stats(db: Session, user_id: int):
+    """
+    Aggregates a patient's sessions (see summarize_sessions).
+    """
+    print(f"DEBUG: get_patient_stats for user_id={user_id}")
+    try:
+        sessions = get_user_sessions(db, user_id)
+        print(f"DEBUG: Found {len(sessions)} sessions")
+        return summarize_sessions(sessions)
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -188,5 +276,11 @@ def create_doctor_note(db: Session, note: schemas.DoctorNoteCreate, doctor_id: i
     db.refresh(db_note)
     return db_note
 
+def note_validator(db: Session, patient_id: int):
+    """(count, max id, latest created_at) of a patient's notes, from ix_doctor_notes_patient_created."""
+    notes = models.DoctorNote
+    return tuple(db.query(func.count(notes.id), func.max(notes.id), func.max(notes.created_at))
+                 .filter(notes.patient_id == patient_id).one())
+
 def get_doctor_notes(db: Session, patient_id: int):
     return db.query(models.DoctorNote).filter(models.DoctorNote.patient_id == patient_id).order_by(models.DoctorNote.created_at.desc()).all()
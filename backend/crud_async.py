@@ -0,0 +1,75 @@
+"""
+Async variants of the hot crud.py reads, for endpoints on the AsyncSession path.
+
+Objects returned here outlive their session, so relationships that callers
+touch are eager-loaded (lazy loads are not possible on the async path).
+"""
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from . import models
+from .crud import summarize_sessions
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    # Profiles are read by the auth dependency's callers (role checks, /users/me).
+    # Both are one-to-one, so they come in as LEFT JOINs of this one query:
+    # this runs on every authenticated request.
+    result = await db.execute(
+        select(models.User)
+        .options(joinedload(models.User.doctor_profile), joinedload(models.User.patient_profile))
+        .where(models.User.email == email)
+    )
+    return result.scalars().first()
+
+async def get_user_sessions(db: AsyncSession, user_id: int):
+    result = await db.execute(
+        select(models.TherapySession)
+        .where(models.TherapySession.user_id == user_id)
+        .order_by(models.TherapySession.start_time.desc())
+    )
+    return result.scalars().all()
+
+async def get_session_history(db: AsyncSession, user_id: int):
+    """
+    A user's sessions as SessionResponse-shaped dicts, newest first. Selects
+    columns rather than entities, so large histories skip ORM identity-map
+    bookkeeping.
+    """
+    s = models.TherapySession
+    result = await db.execute(
+        select(s.id, s.game_type, s.difficulty, s.duration_seconds, s.score, s.balloons_popped, s.start_time,
+               s.fixation_accuracy, s.avg_response_time, s.scheduled_date, s.game_data)
+        .where(s.user_id == user_id)
+        .order_by(s.start_time.desc())
+    )
+    return [
+        {
+            "id": row.id,
+            "user_id": user_id,
+            "game_type": row.game_type,
+            "difficulty": row.difficulty,
+            "duration_seconds": row.duration_seconds or 0,
+            "score": row.score or 0,
+            "balloons_popped": row.balloons_popped or 0,
+            "start_time": row.start_time,
+            "fixation_accuracy": row.fixation_accuracy,
+            "avg_response_time": row.avg_response_time,
+            "scheduled_date": row.scheduled_date,
+            "created_at": row.start_time,
+            "game_metadata": row.game_data,
+        }
+        for row in result
+    ]
+
+async def session_validator(db: AsyncSession, user_id: int):
+    """(count, max id, latest start_time) of a user's sessions; an index-only read on ix_therapy_sessions_user_start."""
+    sessions = models.TherapySession
+    result = await db.execute(
+        select(func.count(), func.max(sessions.id), func.max(sessions.start_time)).where(sessions.user_id == user_id)
+    )
+    return tuple(result.one())
+
+async def get_patient_stats(db: AsyncSession, user_id: int):
+    return summarize_sessions(await get_user_sessions(db, user_id))
@@ -1,5 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
 import os
 
 # Use PostgreSQL in production (from DATABASE_URL env var), SQLite for local dev
@@ -9,10 +10,82 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./amblyocare_v2.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-# SQLite needs check_same_thread=False, PostgreSQL doesn't
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+# Engine tuning profile: "tuned" (default) applies the settings below,
+# "default" leaves SQLAlchemy/driver defaults (kept for benchmarking).
+DB_PROFILE = os.getenv("DB_PROFILE", "tuned")
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+# Connection pool (PostgreSQL, and file-based SQLite which also pools)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # seconds; below typical server idle timeouts
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+# SQLite: WAL lets readers proceed while a writer commits; NORMAL sync is
+# durable across app crashes in WAL mode; busy_timeout waits for the write
+# lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+}
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
+def engine_options(url: str, profile: str = DB_PROFILE) -> dict:
+    """create_engine() keyword arguments for a URL under the given profile."""
+    options = {}
+    if is_sqlite(url):
+        # SQLite needs check_same_thread=False, PostgreSQL doesn't
+        options["connect_args"] = {"check_same_thread": False}
+    if profile != "tuned" or _is_memory_sqlite(url):
+        return options
+    options.update(
+        poolclass=QueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=POOL_PRE_PING,
+    )
+    return options
+
+def apply_sqlite_pragmas(engine, pragmas: dict = None):
+    """Runs the PRAGMAs on every new pooled SQLite connection."""
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def make_engine(url: str, profile: str = DB_PROFILE):
+    engine = create_engine(url, **engine_options(url, profile))
+    if profile == "tuned" and is_sqlite(url) and not _is_memory_sqlite(url):
+        apply_sqlite_pragmas(engine)
+    return engine
+
+def pool_status(engine=None) -> dict:
+    """Current pool occupancy, for the metrics endpoint."""
+    pool = (engine or globals()["engine"]).pool
+    stats = {"class": type(pool).__name__, "status": pool.status()}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    return stats
+
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -23,3 +96,43 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# --- Async path (aiosqlite / asyncpg) ---
+# Used by the hot endpoints so DB waits don't tie up threadpool workers.
+# Created lazily: the driver is only imported when first needed.
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+def make_async_engine(url: str, profile: str = DB_PROFILE, **overrides):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    options = engine_options(url, profile)
+    options.pop("poolclass", None) # async engines use the async-adapted pool
+    options.update(overrides)
+    async_engine = create_async_engine(async_url(url), **options)
+    if profile == "tuned" and is_sqlite(url) and not _is_memory_sqlite(url):
+        apply_sqlite_pragmas(async_engine.sync_engine)
+    return async_engine
+
+_async_engine = None
+_async_sessionmaker = None
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = make_async_engine(DATABASE_URL)
+    return _async_engine
+
+def AsyncSessionLocal():
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        _async_sessionmaker = async_sessionmaker(bind=get_async_engine(), autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
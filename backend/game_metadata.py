@@ -0,0 +1,203 @@
+"""
+Per-game session metadata: schemas, promoted keys and filters.
+
+therapy_sessions.game_data holds game-specific results as native JSON (JSONB
+on PostgreSQL). Each game_type registers a pydantic schema in SCHEMAS;
+incoming metadata is validated against it, and unknown keys are kept.
+
+A few keys that analytics filter on are PROMOTED to generated columns
+(meta_<key>) with a partial index on (game_type, meta_<key>), so a question
+like "neural sessions with more than 20 stars connected" is an index range
+scan instead of a json.loads of every row:
+
+    GET /api/analytics/sessions?game_type=neural&where=stars_connected>20
+
+Promoting a key means adding it to PROMOTED, a matching column and index on
+TherapySession (built with json_field) and a migration. Migrations never
+import application code, so the migration spells out the SQL json_field
+compiles to for each dialect.
+"""
+import json
+import re
+from typing import Any, Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy import JSON, Computed, Integer
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.type_api import to_instance
+from sqlalchemy.sql.visitors import InternalTraversal
+
+
+class GameMetadata(BaseModel):
+    """Base schema. Promoted keys are typed for every game, since they back typed columns."""
+    model_config = ConfigDict(extra="allow")
+
+    stars_connected: Optional[int] = Field(None, ge=0)
+    max_combo: Optional[int] = Field(None, ge=0)
+    targets_hit: Optional[int] = Field(None, ge=0)
+
+
+class NeuralMetadata(GameMetadata):
+    pathways_completed: Optional[int] = Field(None, ge=0)
+    longest_chain: Optional[int] = Field(None, ge=0)
+
+
+class BalloonMetadata(GameMetadata):
+    balloons_missed: Optional[int] = Field(None, ge=0)
+
+
+class SpaceMetadata(GameMetadata):
+    targets_missed: Optional[int] = Field(None, ge=0)
+
+
+class QuizMetadata(GameMetadata):
+    questions_answered: Optional[int] = Field(None, ge=0)
+    correct_answers: Optional[int] = Field(None, ge=0)
+
+
+class VRMetadata(GameMetadata):
+    targets_missed: Optional[int] = Field(None, ge=0)
+    head_turns: Optional[int] = Field(None, ge=0)
+
+
+SCHEMAS: Dict[str, Type[GameMetadata]] = {
+    "neural": NeuralMetadata,
+    "balloon": BalloonMetadata,
+    "space": SpaceMetadata,
+    "quiz": QuizMetadata,
+    "eye_quest_vr": VRMetadata,
+}
+
+# key -> SQL type of its generated column (TherapySession.meta_<key>)
+PROMOTED = {
+    "stars_connected": Integer,
+    "max_combo": Integer,
+    "targets_hit": Integer,
+}
+
+
+def validate(game_type: str, raw: Any) -> Optional[dict]:
+    """
+    Parses (legacy clients send a JSON string) and validates a session's
+    metadata. Returns a dict ready for game_data, or None if empty.
+    Raises ValueError on invalid metadata.
+    """
+    if raw is None or raw == "":
+        return None
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"game_metadata is not valid JSON: {e.msg}")
+    if not isinstance(raw, dict):
+        raise ValueError("game_metadata must be a JSON object")
+    schema = SCHEMAS.get(game_type, GameMetadata)
+    data = schema.model_validate(raw).model_dump(exclude_unset=True)
+    return data or None
+
+
+# --- SQL ---
+
+_KEY = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+class json_field(ColumnElement):
+    """
+    `column`'s JSON value at `key` as `type_`, in the dialect's syntax. Used
+    as the expression of the promoted keys' generated columns.
+    """
+    inherit_cache = True
+    _traverse_internals = [
+        ("column", InternalTraversal.dp_string),
+        ("key", InternalTraversal.dp_string),
+    ]
+
+    def __init__(self, column: str, key: str, type_=Integer):
+        if not _KEY.match(key):
+            raise ValueError(f"Invalid metadata key '{key}'")
+        self.column = column
+        self.key = key
+        self.type = to_instance(type_)
+
+
+@compiles(json_field)
+def _json_field_sqlite(element, compiler, **kw):
+    column, path = compiler.preparer.quote(element.column), f"'$.{element.key}'"
+    value = f"json_extract({column}, {path})"
+    if isinstance(element.type, Integer):
+        # A string or fractional value would otherwise be stored as-is and
+        # compare as greater than every number; whole reals (12.0) are kept
+        return (f"CASE WHEN json_type({column}, {path}) IN ('integer', 'real') "
+                f"AND {value} = CAST({value} AS INTEGER) THEN CAST({value} AS INTEGER) END")
+    return f"CASE WHEN json_type({column}, {path}) IN ('integer', 'real') THEN {value} END"
+
+
+@compiles(json_field, "postgresql")
+def _json_field_postgresql(element, compiler, **kw):
+    column, key = compiler.preparer.quote(element.column), element.key
+    text = f"({column} ->> '{key}')"
+    is_number = f"jsonb_typeof({column} -> '{key}') = 'number'"
+    if isinstance(element.type, Integer):
+        # CAST('12.0' AS INTEGER) raises, and in a STORED column that fails
+        # the whole write; anything but a whole number in range is NULL
+        return (f"CASE WHEN {is_number} AND {text} ~ '^-?[0-9]{{1,9}}(\\.0+)?$' "
+                f"THEN CAST(CAST({text} AS NUMERIC) AS INTEGER) END")
+    sql_type = compiler.dialect.type_compiler_instance.process(element.type)
+    return f"CASE WHEN {is_number} THEN CAST({text} AS {sql_type}) END"
+
+
+class json_from_text(ColumnElement):
+    """A JSON-as-text column parsed to the native JSON type (for the legacy game_metadata backfill)."""
+    inherit_cache = True
+    _traverse_internals = [("clause", InternalTraversal.dp_clauseelement)]
+
+    def __init__(self, clause):
+        self.clause = clause
+        self.type = JSON()
+
+
+@compiles(json_from_text)
+def _json_from_text_sqlite(element, compiler, **kw):
+    text = compiler.process(element.clause, **kw)
+    return f"CASE WHEN json_valid({text}) THEN json({text}) END"
+
+
+@compiles(json_from_text, "postgresql")
+def _json_from_text_postgresql(element, compiler, **kw):
+    # Invalid JSON fails the chunk; the backfill pauses with the error in its status
+    return f"CAST(NULLIF({compiler.process(element.clause, **kw)}, '') AS JSONB)"
+
+
+@compiles(Computed, "postgresql")
+def _computed_postgresql(element, compiler, **kw):
+    # Generated columns are declared without `persisted`, which SQLite creates
+    # as VIRTUAL (the only kind ALTER TABLE can add). PostgreSQL before 18 has
+    # STORED only, so ask for that explicitly there.
+    sql = compiler.sql_compiler.process(element.sqltext, include_table=False, literal_binds=True)
+    return f"GENERATED ALWAYS AS ({sql}) {'VIRTUAL' if element.persisted is False else 'STORED'}"
+
+
+# --- Filters ---
+
+_FILTER = re.compile(r"^\s*([a-z_][a-z0-9_]*)\s*(>=|<=|!=|=|>|<)\s*(-?\d+(?:\.\d+)?)\s*$")
+OPERATORS = {
+    ">": lambda column, value: column > value,
+    ">=": lambda column, value: column >= value,
+    "<": lambda column, value: column < value,
+    "<=": lambda column, value: column <= value,
+    "=": lambda column, value: column == value,
+    "!=": lambda column, value: column != value,
+}
+
+
+def parse_filter(expression: str) -> Tuple[str, str, float]:
+    """Parses "stars_connected>20" into ("stars_connected", ">", 20). Only promoted keys can be filtered on."""
+    match = _FILTER.match(expression)
+    if not match:
+        raise ValueError(f"Invalid filter '{expression}' (expected e.g. stars_connected>20)")
+    key, op, value = match.groups()
+    if key not in PROMOTED:
+        raise ValueError(f"'{key}' is not filterable; use one of: {', '.join(sorted(PROMOTED))}")
+    number = float(value)
+    return key, op, int(number) if number.is_integer() else number
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from . import models, crud
+from .jobqueue import task
 from datetime import datetime
 
 # Define Achievements hardcoded for MVP
@@ -91,3 +92,19 @@ def check_for_new_achievements(db: Session, user_id: int, current_session: model
             
     db.commit()
     return new_unlocks
+
+
+@task("evaluate_achievements")
+def evaluate_achievements(db: Session, user_id: int, session_id: int):
+    """
+    Deferred from POST /api/sessions: seeds rules and awards any new unlocks.
+    Safe to re-run; already-unlocked achievements are skipped.
+    """
+    session = db.get(models.TherapySession, session_id)
+    if session is None:
+        return []
+    seed_achievements(db)
+    unlocked = check_for_new_achievements(db, user_id, session)
+    if unlocked:
+        print(f"User {user_id} unlocked: {unlocked}")
+    return unlocked
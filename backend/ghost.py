@@ -0,0 +1,365 @@
+"""
+Ghost Mode relay: fans patient telemetry frames out to watching doctors.
+
+Each doctor socket registers a Subscription per patient with an optional
+target frame rate. Rate-limited subscriptions coalesce frames: when a frame
+arrives before the subscriber's interval has elapsed, it replaces any pending
+frame and is delivered on the trailing edge, so watchers always end up on the
+latest state without receiving every intermediate frame.
+
+Doctors watching many patients can use one multiplexed socket instead of one
+socket per patient: a MultiplexWatcher owns the socket, tags each frame with
+its patient id and optionally batches everything due in a tick into a single
+message.
+
+The manager also keeps a presence index of live patient streams (last-seen
+time and last frame, grouped by the treating doctor) so dashboards can list
+who is streaming without opening sockets, and new watchers get the last-known
+frame as soon as they subscribe.
+
+Patients are told when to stream: with no watchers the server sends a
+"pause" control message, and when someone subscribes it sends "resume" with
+the highest rate any current watcher asked for (null meaning the client's
+native rate). Idle patients therefore upload nothing.
+"""
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional, Set
+
+from fastapi import WebSocket
+
+# Upper bound on requested rates; patients currently send at ~10 fps
+MAX_FPS = 60.0
+# Frames arriving this close to the end of an interval go out immediately. When
+# the patient already sends at the watcher's rate, network jitter would otherwise
+# hold nearly every frame for a full extra interval.
+RATE_SLACK = 0.9
+
+
+def parse_fps(value) -> Optional[float]:
+    """Normalizes a requested rate. None/0/invalid means full rate (no coalescing)."""
+    try:
+        fps = float(value)
+    except (TypeError, ValueError):
+        return None
+    if fps <= 0:
+        return None
+    return min(fps, MAX_FPS)
+
+
+class Subscription:
+    """One watcher's interest in one patient stream."""
+
+    def __init__(self, websocket: WebSocket, patient_id: str, fps: Optional[float] = None,
+                 watcher: Optional["MultiplexWatcher"] = None):
+        self.websocket = websocket
+        self.watcher = watcher
+        self.patient_id = patient_id
+        self.fps = fps
+        self._last_sent = 0.0
+        self._pending: Optional[str] = None
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # The loop only holds weak references to tasks; keep the flush alive until it's done
+        self._flush_task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    @property
+    def interval(self) -> float:
+        return 1.0 / self.fps if self.fps else 0.0
+
+    def set_rate(self, fps: Optional[float]):
+        self.fps = fps
+        # Reschedule against the new interval
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+            self._schedule_flush()
+
+    async def offer(self, frame: str):
+        """Delivers a frame now, or holds it as pending until the rate allows."""
+        if self.closed:
+            return
+        now = time.monotonic()
+        if now - self._last_sent >= self.interval * RATE_SLACK:
+            self._pending = None
+            await self._send(frame, now)
+            return
+        self._pending = frame
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_handle is not None or self._flush_task is not None or self._pending is None:
+            return
+        loop = asyncio.get_running_loop()
+        delay = max(0.0, self._last_sent + self.interval - time.monotonic())
+        self._flush_handle = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        self._flush_task = asyncio.get_running_loop().create_task(self._flush())
+
+    async def _flush(self):
+        frame, self._pending = self._pending, None
+        try:
+            if frame is not None and not self.closed:
+                await self._send(frame, time.monotonic())
+        finally:
+            self._flush_task = None
+        # A frame that arrived during the send waits for its own interval
+        self._schedule_flush()
+
+    async def _send(self, frame: str, now: float):
+        self._last_sent = now
+        try:
+            await self.deliver(frame)
+        except Exception:
+            # Dead socket; the endpoint's receive loop will clean up
+            self.close()
+
+    async def deliver(self, frame: str):
+        if self.watcher is not None:
+            await self.watcher.push(self.patient_id, frame)
+        else:
+            await self.websocket.send_text(frame)
+
+    def close(self):
+        self.closed = True
+        self._pending = None
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        # A failed send closes the subscription from inside its own flush; that one is finishing anyway
+        task, self._flush_task = self._flush_task, None
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+
+def valid_frame(frame: str) -> bool:
+    """
+    Whether a patient frame can be relayed. Frames that look like JSON are
+    pasted into envelopes verbatim (tag_frame), so they must parse; checked
+    once on ingest rather than once per watcher.
+    """
+    if frame[:1] not in ("{", "["):
+        return True
+    try:
+        json.loads(frame)
+    except ValueError:
+        return False
+    return True
+
+
+def tag_frame(patient_id: str, frame: str) -> str:
+    """Wraps a raw patient frame (already checked by valid_frame) in a {"patient_id", "frame"} envelope."""
+    # Patient clients send JSON objects; anything else is embedded as a string
+    body = frame if frame[:1] in ("{", "[") else json.dumps(frame)
+    return '{"patient_id":%s,"frame":%s}' % (json.dumps(patient_id), body)
+
+
+class MultiplexWatcher:
+    """A single doctor socket subscribed to many patient streams."""
+
+    def __init__(self, websocket: WebSocket, batch_interval: Optional[float] = None):
+        self.websocket = websocket
+        self.batch_interval = batch_interval
+        self.subscriptions: Dict[str, Subscription] = {}
+        self._batch: List[str] = []
+        self._ticker: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.batch_interval:
+            self._ticker = asyncio.get_running_loop().create_task(self._run_ticks())
+
+    async def push(self, patient_id: str, frame: str):
+        envelope = tag_frame(patient_id, frame)
+        if self.batch_interval:
+            self._batch.append(envelope)
+        else:
+            await self.websocket.send_text('{"type":"frame",' + envelope[1:])
+
+    async def _run_ticks(self):
+        while True:
+            await asyncio.sleep(self.batch_interval)
+            if not self._batch:
+                continue
+            frames, self._batch = self._batch, []
+            try:
+                await self.websocket.send_text('{"type":"batch","frames":[' + ",".join(frames) + "]}")
+            except Exception:
+                return
+
+    def close(self):
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+        self._batch = []
+
+
+class PatientStream:
+    """Presence record for one live patient stream."""
+
+    def __init__(self, patient_id: str, doctor_id: Optional[int]):
+        self.patient_id = patient_id
+        self.doctor_id = doctor_id
+        self.connected_at = time.time()
+        self.last_seen = self.connected_at
+        self.last_frame: Optional[str] = None
+        # A patient may stream from more than one tab/device at once
+        self.sockets: Set[WebSocket] = set()
+        # Last control message sent to the patient sockets
+        self.control: Optional[str] = None
+
+    def touch(self, frame: str):
+        self.last_seen = time.time()
+        self.last_frame = frame
+
+
+class PresenceIndex:
+    def __init__(self):
+        self.streams: Dict[str, PatientStream] = {}
+        # Map: doctor_profile_id -> patient_ids currently streaming
+        self.by_doctor: Dict[int, Set[str]] = {}
+
+    def open(self, patient_id: str, doctor_id: Optional[int], websocket: WebSocket) -> PatientStream:
+        stream = self.streams.get(patient_id)
+        if stream is None:
+            stream = self.streams[patient_id] = PatientStream(patient_id, doctor_id)
+            if doctor_id is not None:
+                self.by_doctor.setdefault(doctor_id, set()).add(patient_id)
+        stream.sockets.add(websocket)
+        return stream
+
+    def close(self, patient_id: str, websocket: WebSocket):
+        stream = self.streams.get(patient_id)
+        if stream is None:
+            return
+        stream.sockets.discard(websocket)
+        if stream.sockets:
+            return
+        del self.streams[patient_id]
+        patients = self.by_doctor.get(stream.doctor_id)
+        if patients is not None:
+            patients.discard(patient_id)
+            if not patients:
+                del self.by_doctor[stream.doctor_id]
+
+    def last_frame(self, patient_id: str) -> Optional[str]:
+        stream = self.streams.get(patient_id)
+        return stream.last_frame if stream else None
+
+    def for_doctor(self, doctor_id: int) -> List[PatientStream]:
+        return [self.streams[pid] for pid in self.by_doctor.get(doctor_id, ())]
+
+
+class ConnectionManager:
+    def __init__(self):
+        # Map: patient_id -> {websocket: Subscription} (Doctors)
+        self.active_connections: Dict[str, Dict[WebSocket, Subscription]] = {}
+        self.presence = PresenceIndex()
+        # Control updates started from sync code (disconnect); held here until done
+        self._background: Set[asyncio.Task] = set()
+
+    async def connect(self, websocket: WebSocket, patient_id: str, fps: Optional[float] = None) -> Subscription:
+        await websocket.accept()
+        return await self.watch(websocket, patient_id, fps)
+
+    async def watch(self, websocket: WebSocket, patient_id: str, fps: Optional[float] = None,
+                    watcher: Optional[MultiplexWatcher] = None) -> Subscription:
+        """
+        Subscribes (or changes the rate of an existing subscription), immediately
+        delivers the last-known frame to new watchers and tells the patient to
+        stream at the rate now required.
+        """
+        is_new = websocket not in self.active_connections.get(patient_id, {})
+        subscription = self.subscribe(websocket, patient_id, fps, watcher=watcher)
+        if is_new:
+            frame = self.presence.last_frame(patient_id)
+            if frame is not None:
+                await subscription.offer(frame)
+        await self.update_stream_control(patient_id)
+        return subscription
+
+    async def open_stream(self, websocket: WebSocket, patient_id: str, doctor_id: Optional[int]) -> PatientStream:
+        stream = self.presence.open(patient_id, doctor_id, websocket)
+        stream.control = self.stream_control(patient_id)
+        await self._send_control(websocket, stream.control)
+        return stream
+
+    def close_stream(self, websocket: WebSocket, patient_id: str):
+        self.presence.close(patient_id, websocket)
+
+    def stream_control(self, patient_id: str) -> str:
+        """The control message matching current subscriptions for a patient."""
+        watchers = self.active_connections.get(patient_id)
+        if not watchers:
+            return '{"type":"control","action":"pause"}'
+        rates = [sub.fps for sub in watchers.values()]
+        # Any full-rate watcher means the client's native rate
+        fps = None if None in rates else max(rates)
+        return json.dumps({"type": "control", "action": "resume", "fps": fps}, separators=(",", ":"))
+
+    async def update_stream_control(self, patient_id: str):
+        stream = self.presence.streams.get(patient_id)
+        if stream is None:
+            return
+        control = self.stream_control(patient_id)
+        if control == stream.control:
+            return
+        stream.control = control
+        for websocket in list(stream.sockets):
+            await self._send_control(websocket, control)
+
+    async def _send_control(self, websocket: WebSocket, control: str):
+        try:
+            await websocket.send_text(control)
+        except Exception:
+            pass
+
+    def subscribe(self, websocket: WebSocket, patient_id: str, fps: Optional[float] = None,
+                  watcher: Optional[MultiplexWatcher] = None) -> Subscription:
+        watchers = self.active_connections.setdefault(patient_id, {})
+        subscription = watchers.get(websocket)
+        if subscription is not None:
+            # Re-subscribing only changes the rate
+            subscription.set_rate(fps)
+            return subscription
+        subscription = Subscription(websocket, patient_id, fps, watcher=watcher)
+        watchers[websocket] = subscription
+        if watcher is not None:
+            watcher.subscriptions[patient_id] = subscription
+        return subscription
+
+    def disconnect(self, websocket: WebSocket, patient_id: str):
+        watchers = self.active_connections.get(patient_id)
+        if watchers is None:
+            return
+        subscription = watchers.pop(websocket, None)
+        if subscription is not None:
+            subscription.close()
+            if subscription.watcher is not None:
+                subscription.watcher.subscriptions.pop(patient_id, None)
+        if not watchers:
+            del self.active_connections[patient_id]
+        if patient_id in self.presence.streams:
+            task = asyncio.get_running_loop().create_task(self.update_stream_control(patient_id))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    def disconnect_watcher(self, watcher: MultiplexWatcher):
+        for patient_id in list(watcher.subscriptions):
+            self.disconnect(watcher.websocket, patient_id)
+        watcher.close()
+
+    def watcher_count(self, patient_id: str) -> int:
+        return len(self.active_connections.get(patient_id, ()))
+
+    async def broadcast(self, message: str, patient_id: str):
+        watchers = self.active_connections.get(patient_id)
+        if not watchers:
+            return
+        for subscription in list(watchers.values()):
+            await subscription.offer(message)
+
+
+manager = ConnectionManager()
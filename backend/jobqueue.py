@@ -0,0 +1,220 @@
+"""
+Durable job queue stored in the application database (`job_queue` table).
+
+Request handlers defer work with enqueue(db, "task_name", {...}); the row is
+part of the caller's transaction, so the job exists if and only if the
+request's own writes commit. Tasks are plain functions registered with
+@task("name") and called as func(db, **payload) in a fresh session.
+
+Workers claim jobs in batches (see claims.py) and run them concurrently.
+Each claim counts as an attempt and hides the job for VISIBILITY_TIMEOUT
+seconds; a job whose worker dies becomes visible again and is retried. Failed
+jobs are retried with exponential backoff until max_attempts, after which
+they are dead-lettered (status "dead") for inspection and manual requeue.
+Delivery is at-least-once, so tasks must be idempotent.
+
+Small deployments drain the queue in-process through the scheduler
+(JOBQUEUE_INPROCESS=1, the default). Larger ones run dedicated workers:
+
+    python -m backend.jobqueue worker --concurrency 8
+    python -m backend.jobqueue stats
+    python -m backend.jobqueue requeue-dead
+"""
+import argparse
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict
+
+from sqlalchemy import update, select, func, or_, and_
+from sqlalchemy.orm import Session
+
+from . import models
+from .claims import claim_rows
+from .database import SessionLocal
+from .scheduler import scheduler
+
+CONCURRENCY = int(os.getenv("JOBQUEUE_CONCURRENCY", "4"))
+VISIBILITY_TIMEOUT = int(os.getenv("JOBQUEUE_VISIBILITY_TIMEOUT", "300"))
+DEFAULT_MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 900
+INPROCESS = os.getenv("JOBQUEUE_INPROCESS", "1") == "1"
+
+# Modules whose @task registrations a standalone worker needs
+TASK_MODULES = ["backend.gamification"]
+
+jobs = models.QueuedJob.__table__
+
+TASKS: Dict[str, Callable] = {}
+
+
+def task(name: str):
+    """Registers the decorated function as a queue task."""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(db: Session, task_name: str, payload: dict = None, delay: float = 0,
+            max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+    """Adds a job to the caller's transaction. It runs only once the caller commits."""
+    job = models.QueuedJob(
+        task=task_name,
+        payload=json.dumps(payload or {}),
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.add(job)
+    return job
+
+
+def claim_jobs(db: Session, limit: int, visibility_timeout: int = VISIBILITY_TIMEOUT):
+    now = datetime.utcnow()
+    due = or_(
+        and_(jobs.c.status == "queued", jobs.c.run_at <= now),
+        # Visibility timeout expired: the worker holding it died or hung
+        and_(jobs.c.status == "running", jobs.c.locked_until < now),
+    )
+    return claim_rows(db, jobs, due, limit, "locked_by", {
+        "status": "running",
+        "attempts": jobs.c.attempts + 1,
+        "locked_until": now + timedelta(seconds=visibility_timeout),
+    })
+
+
+def _finish(db: Session, job, **values):
+    # Guarded by the claim token: if our visibility timeout lapsed and another
+    # worker re-claimed the job, its outcome wins
+    db.execute(
+        update(jobs)
+        .where(jobs.c.id == job.id, jobs.c.locked_by == job.locked_by)
+        .values(locked_by=None, locked_until=None, **values)
+    )
+
+
+def execute(job, session_factory=SessionLocal):
+    """Runs one claimed job in its own session. Returns "done", "retry" or "dead"."""
+    db = session_factory()
+    try:
+        handler = TASKS.get(job.task)
+        if handler is None:
+            raise LookupError(f"Unknown task '{job.task}'")
+        if job.attempts > job.max_attempts:
+            raise RuntimeError("Exceeded max attempts (worker crashed or timed out on every attempt)")
+        handler(db, **json.loads(job.payload or "{}"))
+        _finish(db, job, status="done", finished_at=datetime.utcnow(), last_error=None)
+        db.commit()
+        return "done"
+    except Exception as e:
+        db.rollback()
+        dead = isinstance(e, LookupError) or job.attempts >= job.max_attempts
+        delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (job.attempts - 1))
+        _finish(
+            db, job,
+            status="dead" if dead else "queued",
+            run_at=datetime.utcnow() + timedelta(seconds=delay),
+            finished_at=datetime.utcnow() if dead else None,
+            last_error=repr(e),
+        )
+        db.commit()
+        return "dead" if dead else "retry"
+    finally:
+        db.close()
+
+
+class Worker:
+    def __init__(self, concurrency: int = CONCURRENCY, session_factory=SessionLocal,
+                 visibility_timeout: int = VISIBILITY_TIMEOUT):
+        self.concurrency = concurrency
+        self.session_factory = session_factory
+        self.visibility_timeout = visibility_timeout
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="jobqueue")
+
+    def run_once(self, max_batches: int = None):
+        """Claims and runs batches until the queue has nothing due. Returns outcome counts."""
+        counts = {"done": 0, "retry": 0, "dead": 0}
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            db = self.session_factory()
+            try:
+                claimed = claim_jobs(db, self.concurrency, self.visibility_timeout)
+            finally:
+                db.close()
+            if not claimed:
+                break
+            batches += 1
+            for outcome in self.pool.map(lambda job: execute(job, self.session_factory), claimed):
+                counts[outcome] += 1
+        return counts
+
+    def run_forever(self, poll_interval: float = 1.0):
+        while True:
+            counts = self.run_once()
+            if not any(counts.values()):
+                time.sleep(poll_interval)
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+
+def queue_stats(db: Session):
+    rows = db.execute(select(jobs.c.status, func.count()).group_by(jobs.c.status)).all()
+    return {status: count for status, count in rows}
+
+
+def requeue_dead(db: Session, task_name: str = None):
+    stmt = update(jobs).where(jobs.c.status == "dead")
+    if task_name:
+        stmt = stmt.where(jobs.c.task == task_name)
+    result = db.execute(stmt.values(status="queued", attempts=0, run_at=datetime.utcnow(),
+                                    finished_at=None))
+    db.commit()
+    return result.rowcount
+
+
+def drain_in_process():
+    worker = Worker(concurrency=2)
+    try:
+        return worker.run_once(max_batches=25)
+    finally:
+        worker.close()
+
+if INPROCESS:
+    scheduler.job("job_queue_drain", every=timedelta(seconds=5))(drain_in_process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AmblyoCare job queue")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker", help="run a worker until interrupted")
+    worker.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    worker.add_argument("--poll", type=float, default=1.0, help="seconds to sleep when idle")
+    sub.add_parser("stats", help="job counts by status")
+    requeue = sub.add_parser("requeue-dead", help="move dead-lettered jobs back to the queue")
+    requeue.add_argument("--task")
+    args = parser.parse_args()
+
+    for module in TASK_MODULES:
+        importlib.import_module(module)
+
+    if args.command == "worker":
+        print(f"Job queue worker started (concurrency={args.concurrency}, tasks={sorted(TASKS)})")
+        Worker(concurrency=args.concurrency).run_forever(args.poll)
+    else:
+        db = SessionLocal()
+        try:
+            if args.command == "stats":
+                print(queue_stats(db))
+            else:
+                print(f"Requeued {requeue_dead(db, args.task)} jobs")
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
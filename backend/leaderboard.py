@@ -0,0 +1,251 @@
+"""
+Materialized leaderboards.
+
+Every therapy session adds its score to a few boards in `leaderboard_scores`
+(an upsert in the session's own transaction):
+
+- "all"                        all-time totals
+- "week:2026-W42"              ISO-week totals
+- "game:<type>"                per game type
+- "game:<type>:<difficulty>"   per game type and difficulty
+
+Reads never aggregate therapy_sessions. Each process keeps the boards it has
+served in memory as a sorted list of (-score, user_id), so the top K is a
+slice (O(K)) and a user's rank is a bisect (O(log n)). A process applies its
+own writes immediately and reloads a board from the summary table once it is
+older than REFRESH_SECONDS, which is how other workers' writes show up.
+
+A write applies the totals its upsert returned, not a delta, together with
+the row's session count as a version. A board reloaded between the commit
+and the apply already has that version, so the write is not counted twice.
+
+Rebuild the summary table from scratch with: python -m backend.leaderboard rebuild
+"""
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, func, delete, insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+REFRESH_SECONDS = float(os.getenv("LEADERBOARD_REFRESH_SECONDS", "30"))
+MAX_LIMIT = 100
+
+scores = models.LeaderboardScore.__table__
+
+
+def week_of(when: datetime) -> str:
+    year, week, _ = when.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def board_key(period: str = "all", game_type: str = None, difficulty: str = None, week: str = None) -> str:
+    """Board name for a query. period is "all" or "weekly" (current ISO week unless `week` is given)."""
+    if period == "weekly":
+        return f"week:{week or week_of(datetime.utcnow())}"
+    if period != "all":
+        raise ValueError(f"Unknown period '{period}'")
+    if difficulty and not game_type:
+        raise ValueError("difficulty requires game_type")
+    if game_type:
+        return f"game:{game_type}:{difficulty}" if difficulty else f"game:{game_type}"
+    return "all"
+
+
+def boards_for_session(game_type: str, difficulty: str, start_time: datetime) -> List[str]:
+    boards = ["all", f"week:{week_of(start_time or datetime.utcnow())}"]
+    if game_type:
+        boards.append(f"game:{game_type}")
+        if difficulty:
+            boards.append(f"game:{game_type}:{difficulty}")
+    return boards
+
+
+class Board:
+    """One leaderboard, kept sorted by (-score, user_id)."""
+
+    def __init__(self, key: str, totals: Dict[int, int] = None, versions: Dict[int, int] = None):
+        self.key = key
+        self.totals: Dict[int, int] = dict(totals or {})
+        # user_id -> sessions counted in their total (leaderboard_scores.sessions)
+        self.versions: Dict[int, int] = dict(versions or {})
+        self.entries: List[Tuple[int, int]] = sorted((-score, user_id) for user_id, score in self.totals.items())
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _move(self, user_id: int, new: int):
+        old = self.totals.get(user_id)
+        if old is not None:
+            del self.entries[bisect_left(self.entries, (-old, user_id))]
+        self.totals[user_id] = new
+        insort(self.entries, (-new, user_id))
+
+    def add(self, user_id: int, delta: int):
+        self._move(user_id, self.totals.get(user_id, 0) + delta)
+
+    def set(self, user_id: int, total: int, version: int) -> bool:
+        """Sets a user's total as of `version`; a version the board already has (or passed) is ignored."""
+        if version <= self.versions.get(user_id, 0):
+            return False
+        self.versions[user_id] = version
+        self._move(user_id, total)
+        return True
+
+    def top(self, k: int) -> List[Tuple[int, int, int]]:
+        """(rank, user_id, score) for the first k entries."""
+        return [(self._rank_of(-neg), user_id, -neg) for neg, user_id in self.entries[:k]]
+
+    def _rank_of(self, score: int) -> int:
+        # Standard competition ranking: ties share a rank
+        return bisect_left(self.entries, (-score, float("-inf"))) + 1
+
+    def rank(self, user_id: int) -> Optional[int]:
+        score = self.totals.get(user_id)
+        return None if score is None else self._rank_of(score)
+
+    def around(self, user_id: int, n: int) -> List[Tuple[int, int, int]]:
+        """The user's entry with up to n neighbours on each side."""
+        score = self.totals.get(user_id)
+        if score is None:
+            return []
+        pos = bisect_left(self.entries, (-score, user_id))
+        return [(self._rank_of(-neg), uid, -neg) for neg, uid in self.entries[max(0, pos - n):pos + n + 1]]
+
+
+class LeaderboardStore:
+    """Per-process cache of boards over the leaderboard_scores table."""
+
+    def __init__(self, session_factory=SessionLocal, refresh_seconds: float = REFRESH_SECONDS):
+        self.session_factory = session_factory
+        self.refresh_seconds = refresh_seconds
+        self._boards: Dict[str, Board] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, key: str, db: Session = None) -> Board:
+        owns_session = db is None
+        db = db or self.session_factory()
+        try:
+            rows = db.execute(
+                select(scores.c.user_id, scores.c.total_score, scores.c.sessions).where(scores.c.board == key)
+            ).all()
+        finally:
+            if owns_session:
+                db.close()
+        return Board(key, {user_id: total or 0 for user_id, total, _ in rows},
+                     {user_id: sessions or 0 for user_id, _, sessions in rows})
+
+    def board(self, key: str, db: Session = None) -> Board:
+        board = self._boards.get(key)
+        if board is None or time.monotonic() - board.loaded_at > self.refresh_seconds:
+            board = self._load(key, db)
+            with self._lock:
+                self._boards[key] = board
+        return board
+
+    def apply(self, user_id: int, totals: Dict[str, Tuple[int, int]]):
+        """Applies a committed session's {board: (total, sessions)} (from record_session) to loaded boards."""
+        with self._lock:
+            for key, (total, version) in totals.items():
+                board = self._boards.get(key)
+                if board is not None:
+                    board.set(user_id, total, version)
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+
+
+store = LeaderboardStore()
+
+
+def _upsert(db: Session, rows: List[dict]) -> Dict[str, Tuple[int, int]]:
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    stmt = dialect_insert(scores).values(rows)
+    result = db.execute(stmt.on_conflict_do_update(
+        index_elements=[scores.c.board, scores.c.user_id],
+        set_={
+            "total_score": scores.c.total_score + stmt.excluded.total_score,
+            "sessions": scores.c.sessions + stmt.excluded.sessions,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    ).returning(scores.c.board, scores.c.total_score, scores.c.sessions))
+    return {board: (total or 0, sessions or 0) for board, total, sessions in result}
+
+
+def record_session(db: Session, session: models.TherapySession) -> Dict[str, Tuple[int, int]]:
+    """
+    Adds the session's score to its boards as part of the caller's
+    transaction. Returns {board: (new total, sessions)}, for store.apply()
+    after commit.
+    """
+    boards = boards_for_session(session.game_type, session.difficulty, session.start_time)
+    now = datetime.utcnow()
+    return _upsert(db, [
+        {"board": key, "user_id": session.user_id, "total_score": session.score or 0, "sessions": 1,
+         "updated_at": now}
+        for key in boards
+    ])
+
+
+def player_names(db: Session, user_ids) -> Dict[int, str]:
+    ids = list(set(user_ids))
+    if not ids:
+        return {}
+    return dict(db.execute(select(models.User.id, models.User.full_name).where(models.User.id.in_(ids))).all())
+
+
+def rebuild(db: Session, batch_size: int = 1000) -> int:
+    """Recomputes leaderboard_scores from therapy_sessions. Returns the number of rows written."""
+    sessions = models.TherapySession.__table__
+    totals = defaultdict(lambda: [0, 0])
+    stmt = (
+        select(sessions.c.user_id, sessions.c.game_type, sessions.c.difficulty, sessions.c.start_time,
+               sessions.c.score)
+        .where(sessions.c.user_id.is_not(None), sessions.c.scheduled_date.is_(None))
+        .execution_options(yield_per=batch_size)
+    )
+    for user_id, game_type, difficulty, start_time, score in db.execute(stmt):
+        for key in boards_for_session(game_type, difficulty, start_time):
+            entry = totals[(key, user_id)]
+            entry[0] += score or 0
+            entry[1] += 1
+    now = datetime.utcnow()
+    db.execute(delete(scores))
+    rows = [{"board": key, "user_id": user_id, "total_score": total, "sessions": count, "updated_at": now}
+            for (key, user_id), (total, count) in totals.items()]
+    for i in range(0, len(rows), batch_size):
+        db.execute(insert(scores), rows[i:i + batch_size])
+    db.commit()
+    store.clear()
+    return len(rows)
+
+
+def ensure_built(db: Session):
+    """Builds the summary table on first deploy (empty table, existing sessions)."""
+    if db.execute(select(func.count()).select_from(scores)).scalar():
+        return
+    if db.execute(select(func.count()).select_from(models.TherapySession.__table__)).scalar():
+        print(f"[LEADERBOARD] Built {rebuild(db)} leaderboard rows")
+
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python -m backend.leaderboard rebuild")
+    db = SessionLocal()
+    try:
+        print(f"[LEADERBOARD] Rebuilt {rebuild(db)} leaderboard rows")
+    finally:
+        db.close()
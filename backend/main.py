@@ -1,20 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from . import models, schemas, crud, database, gamification
-from datetime import datetime, timedelta
-from jose import JWTError, jwt
-import bcrypt
+from sqlalchemy.ext.asyncio import AsyncSession
+# security first: it loads .env before database.py reads DATABASE_URL
+from .security import (verify_password, create_access_token, decode_access_token,
+                       ACCESS_TOKEN_EXPIRE_MINUTES)
+from . import (models, schemas, crud, crud_async, database, gamification, tasks, notifications, jobqueue, leaderboard,
+               game_metadata, sketches, trends)
+from .scheduler import scheduler
+from .replicas import replica_set, get_read_db, get_async_read_db, mark_write
+from .cache import cache
+from .conditional import Validator, not_modified, set_validators
+from .responses import FastJSONResponse
+from .compression import CompressionMiddleware
+from datetime import datetime, time, timedelta
+from typing import Optional
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# Security Config
-SECRET_KEY = os.getenv("SECRET_KEY", "unsafe_failover_key_change_in_prod")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+import sys
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 oauth2_scheme_optional = OAuth2PasswordBearer(
@@ -22,15 +27,35 @@ oauth2_scheme_optional = OAuth2PasswordBearer(
     auto_error=False
 )
 
-# Create Tables
-models.Base.metadata.create_all(bind=database.engine)
+# Schema is managed by Alembic migrations, applied once per deploy:
+#   python -m backend.migrate
+
+# Periodic jobs (see scheduler.py); disable with SCHEDULER_ENABLED=0
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+    replica_set.start_health_checks()
+    yield
+    await scheduler.stop()
+    await replica_set.stop_health_checks()
+    cohort = sys.modules.get(f"{__package__}.cohort")  # imported on first use (numpy)
+    if cohort is not None:
+        cohort.shutdown()
 
 app = FastAPI(
     title="AmblyoCare Clinical API",
     description="Backend for Vision Therapy Platform",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Innermost: the http middlewares below re-stream bodies in chunks, which
+# would hide a response's full size from it
+app.add_middleware(CompressionMiddleware)
+
 # CORS Middleware (Allow Frontend Access)
 origins = [
     "http://localhost:3000",
@@ -55,21 +80,13 @@ async def add_security_headers(request, call_next):
     response.headers["X-Frame-Options"] = "DENY"
     return response
 
-def verify_password(plain_password, hashed_password):
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-
-def get_password_hash(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-def create_access_token(data: dict, expires_delta: timedelta | None = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+@app.middleware("http")
+async def track_writes_for_replicas(request, call_next):
+    # Read-your-writes: a caller that just wrote reads from the primary for a while
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        await mark_write(request)
+    return response
 
 def get_db():
     db = database.SessionLocal()
@@ -78,10 +95,14 @@ def get_db():
     finally:
         db.close()
 
+# Async session for the hot endpoints (login, auth, stats, session history)
+get_async_db = database.get_async_db
+
 @app.post("/token")
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.get_user_by_email(db, email=form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await crud_async.get_user_by_email(db, email=form_data.username)
+    # bcrypt is deliberately slow; keep it off the event loop
+    if not user or not await run_in_threadpool(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -94,34 +115,28 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer", "role": user.role}
 
 
-async def get_current_user_optional(token: str = Depends(oauth2_scheme_optional), db: Session = Depends(get_db)):
+async def get_current_user_optional(token: str = Depends(oauth2_scheme_optional), db: AsyncSession = Depends(get_async_db)):
     if not token:
         return None
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
-    except JWTError:
+    payload = decode_access_token(token)
+    email: str = payload.get("sub") if payload else None
+    if email is None:
         return None
-    user = crud.get_user_by_email(db, email=email)
+    user = await crud_async.get_user_by_email(db, email=email)
     return user
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+    payload = decode_access_token(token)
+    email: str = payload.get("sub") if payload else None
+    if email is None:
         raise credentials_exception
-    user = crud.get_user_by_email(db, email=email)
+    user = await crud_async.get_user_by_email(db, email=email)
     if user is None:
         raise credentials_exception
     return user
@@ -135,6 +150,21 @@ def read_root():
 def health_check():
     return {"status": "healthy", "service": "api"}
 
+@app.get("/api/admin/metrics")
+def read_metrics(current_user: models.User = Depends(get_current_user)):
+    """
+    Operational metrics for admins (scheduled job runs and durations, DB pool usage,
+    replica health, cache hit rates).
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view metrics")
+    return {
+        "scheduler": scheduler.metrics(),
+        "db_pool": database.pool_status(),
+        "replicas": replica_set.status(),
+        "cache": cache.metrics(),
+    }
+
 @app.post("/users/", response_model=schemas.UserResponse)
 def create_user(
     user: schemas.UserCreate, 
@@ -170,13 +200,7 @@ def create_user(
 
     elif user.role == "doctor":
         # Create empty doctor profile
-        db_doc = models.DoctorProfile(
-            user_id=new_user.id,
-            clinic_name="Unassigned Clinic",
-            license_number="PENDING"
-        )
-        db.add(db_doc)
-        db.commit()
+        crud.create_doctor_profile(db, user_id=new_user.id)
 
     elif user.role == "parent" and user.child_name:
         # Create Child User (Derived credentials for now)
@@ -210,8 +234,7 @@ def create_user(
              # Find their profile
              patient_profile = db.query(models.PatientProfile).filter(models.PatientProfile.user_id == existing_child.id).first()
              if patient_profile:
-                 patient_profile.parent_id = new_user.id
-                 db.commit()
+                 crud.link_parent(db, patient_profile, new_user.id)
 
     return new_user
 
@@ -220,9 +243,13 @@ def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     users = crud.get_users(db, skip=skip, limit=limit)
     return users
 
+def _dump(schema, rows):
+    """ORM rows -> JSON-ready dicts, the form cached responses are stored in."""
+    return [schema.model_validate(row).model_dump(mode="json") for row in rows]
+
 @app.get("/api/doctor/patients", response_model=list[schemas.UserResponse])
 def read_doctor_patients(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(get_current_user)
 ):
     if current_user.role != "doctor":
@@ -230,8 +257,13 @@ def read_doctor_patients(
     
     if not current_user.doctor_profile:
          return []
-         
-    return crud.get_patients_by_doctor(db, doctor_id=current_user.doctor_profile.id)
+
+    doctor_id = current_user.doctor_profile.id
+    # Cached entries were dumped through UserResponse already; don't validate them again
+    return FastJSONResponse(cache.get_or_set(
+        f"doctor_patients:{doctor_id}", "",
+        lambda: _dump(schemas.UserResponse, crud.get_patients_by_doctor(db, doctor_id=doctor_id)),
+    ))
 
 @app.get("/api/parent/children", response_model=list[schemas.UserResponse])
 def get_parent_children(
@@ -249,7 +281,9 @@ def get_public_doctors(db: Session = Depends(get_db)):
     """
     Public endpoint to list all doctors for selection during signup.
     """
-    return crud.get_all_doctors(db)
+    return FastJSONResponse(
+        cache.get_or_set("doctors", "", lambda: _dump(schemas.UserResponse, crud.get_all_doctors(db)))
+    )
 
 @app.post("/api/sessions", response_model=schemas.SessionResponse)
 def create_session(
@@ -266,20 +300,8 @@ def create_session(
     # Security: Force the user_id to match the token for patients
     session.user_id = current_user.id
 
-    # 1. Create Session
+    # Create Session (achievement checks are queued as a deferred job, see gamification.py)
     new_session = crud.create_therapy_session(db=db, session=session)
-    
-    # 2. Check Gamification
-    # Ensure achievements exist in DB
-    gamification.seed_achievements(db) 
-    
-    # Check for unlocks
-    unlocked = gamification.check_for_new_achievements(db, session.user_id, new_session)
-    
-    if unlocked:
-        print(f"User {session.user_id} unlocked: {unlocked}")
-        # In a real app, we might return this in the response or send a WS notification
-        
     return new_session
 
 
@@ -288,73 +310,253 @@ def create_session(
 async def read_users_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
+def _leaderboard_key(period: str, game_type: Optional[str], difficulty: Optional[str], week: Optional[str]):
+    try:
+        return leaderboard.board_key(period, game_type, difficulty, week)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/leaderboard")
-def read_leaderboard(db: Session = Depends(get_db)):
+def read_leaderboard(
+    period: str = "all",
+    game_type: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    week: Optional[str] = None,
+    limit: int = 10,
+    db: Session = Depends(get_read_db)
+):
     """
-    Returns top 10 players by total score (sum of all sessions).
+    Returns the top players by total score. period is "all" (optionally per
+    game_type / difficulty) or "weekly" (current ISO week, or week=2026-W42).
+    Served from the materialized boards in leaderboard.py.
     """
-    # SQL: SELECT user_id, SUM(score) as total_score FROM sessions GROUP BY user_id ORDER BY total_score DESC LIMIT 10
-    # Then join with User to get names.
-    from sqlalchemy import func
-    
-    results = db.query(
-        models.PatientProfile.user_id,
-        models.User.full_name,
-        func.sum(models.TherapySession.score).label("total_score")
-    ).join(models.TherapySession, models.PatientProfile.id == models.TherapySession.patient_id)\
-     .join(models.User, models.PatientProfile.user_id == models.User.id)\
-     .group_by(models.PatientProfile.user_id)\
-     .order_by(func.sum(models.TherapySession.score).desc())\
-     .limit(10)\
-     .all()
-     
-    return [
-        {"rank": i+1, "player": r.full_name, "score": r.total_score}
-        for i, r in enumerate(results)
-    ]
+    key = _leaderboard_key(period, game_type, difficulty, week)
+    limit = max(1, min(limit, leaderboard.MAX_LIMIT))
+
+    def compute():
+        entries = leaderboard.store.board(key, db).top(limit)
+        names = leaderboard.player_names(db, [user_id for _, user_id, _ in entries])
+        return [
+            {"rank": rank, "user_id": user_id, "player": names.get(user_id), "score": score}
+            for rank, user_id, score in entries
+        ]
+    return cache.get_or_set("leaderboard", f"top:{key}:{limit}", compute)
+
+@app.get("/api/leaderboard/rank/{user_id}")
+def read_leaderboard_rank(
+    user_id: int,
+    period: str = "all",
+    game_type: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    week: Optional[str] = None,
+    neighbours: int = 2,
+    db: Session = Depends(get_read_db)
+):
+    """
+    A player's rank on a board plus up to `neighbours` players above and below.
+    """
+    board = leaderboard.store.board(_leaderboard_key(period, game_type, difficulty, week), db)
+    rank = board.rank(user_id)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="Player has no score on this board")
+    around = board.around(user_id, max(0, min(neighbours, 10)))
+    names = leaderboard.player_names(db, [uid for _, uid, _ in around])
+    return {
+        "user_id": user_id,
+        "rank": rank,
+        "score": board.totals[user_id],
+        "total_players": len(board),
+        "neighbours": [
+            {"rank": r, "user_id": uid, "player": names.get(uid), "score": score}
+            for r, uid, score in around
+        ],
+    }
 
 @app.get("/api/stats/{user_id}")
-def read_patient_stats(
+async def read_patient_stats(
     user_id: int, 
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: models.User = Depends(get_current_user)
 ):
     # Authorization: Only Self or Doctor
     if current_user.id != user_id and current_user.role != "doctor":
          raise HTTPException(status_code=403, detail="Not authorized to view this data")
 
-    stats = crud.get_patient_stats(db, user_id)
-    return stats
+    count, max_id, latest = await crud_async.session_validator(db, user_id)
+    # streak_days is relative to today (UTC), so the validator rolls over at midnight even without a write
+    today = datetime.utcnow().date()
+    midnight = datetime.combine(today, time.min)
+    validator = Validator(f"stats-{user_id}-{today}", count, max_id, max(latest or midnight, midnight))
+    unchanged = not_modified(request, validator)
+    if unchanged:
+        return unchanged
+    set_validators(response, validator)
+    # Keyed by the ETag, so the body always matches it: another worker's
+    # write (which only invalidates that worker's cache) changes the key here
+    return await cache.get_or_set_async(f"stats:{user_id}", validator.etag,
+                                        lambda: crud_async.get_patient_stats(db, user_id))
 
 
 
 @app.get("/api/sessions/{user_id}", response_model=list[schemas.SessionResponse])
-def get_sessions(
+async def get_sessions(
     user_id: int, 
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: models.User = Depends(get_current_user)
 ):
     # Authorization: Self, Doctor, or Parent
     if current_user.id != user_id and current_user.role != "doctor" and current_user.role != "parent":
          raise HTTPException(status_code=403, detail="Not authorized to view session history")
 
-    sessions = crud.get_user_sessions(db=db, user_id=user_id)
-    # Map back to response schema
-    result = []
-    for s in sessions:
-        # s is TherapySession model
-        result.append({
-            "id": s.id,
-            "user_id": user_id, 
-            "game_type": s.game_type,
-            "difficulty": s.difficulty,
-            "duration_seconds": s.duration_seconds,
-            "score": s.score,
-            "balloons_popped": s.balloons_popped,
-            "start_time": s.start_time,
-            "created_at": s.start_time
-        })
-    return result
+    validator = Validator(f"sessions-{user_id}", *await crud_async.session_validator(db, user_id))
+    unchanged = not_modified(request, validator)
+    if unchanged:
+        return unchanged
+    # Rows come from our own query in SessionResponse's shape: skip response_model validation
+    history = await crud_async.get_session_history(db, user_id)
+    return FastJSONResponse(history, headers=validator.headers())
+
+@app.get("/api/sessions/{session_id}/trials", response_model=schemas.TrialsResponse)
+def read_session_trials(
+    session_id: int,
+    include_events: bool = False,
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Derived trial metrics of a session; the per-trial events too with include_events=true."""
+    session = db.get(models.TherapySession, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    # Authorization: Self, Doctor, or Parent (as for session history)
+    if current_user.id != session.user_id and current_user.role not in ("doctor", "parent"):
+        raise HTTPException(status_code=403, detail="Not authorized to view this session")
+    stored = crud.get_session_trials(db, session_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="No trials recorded for this session")
+
+    result = {"session_id": session_id, "n_trials": stored.n_trials, "metrics": stored.metrics}
+    if include_events:
+        from . import trials  # numpy, imported on first use
+        result["events"] = trials.as_lists(trials.decode(stored.data))
+    return FastJSONResponse(result)
+
+@app.get("/api/sessions/{session_id}/percentiles")
+def read_session_percentiles(
+    session_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    How the session ranks among all sessions (not patients) of its game and
+    difficulty, per metric: session_percentile is the share of those
+    sessions it beats (sketches.py).
+    """
+    session = db.get(models.TherapySession, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if current_user.id != session.user_id and current_user.role not in ("doctor", "parent"):
+        raise HTTPException(status_code=403, detail="Not authorized to view this session")
+    return {
+        "session_id": session_id,
+        "game_type": session.game_type,
+        "difficulty": session.difficulty,
+        "metrics": {
+            metric: sketches.store.percentile(session.game_type, session.difficulty, metric, value, db=db)
+            for (_, _, metric), value in sketches.metric_values(session.game_type, session.difficulty, session)
+        },
+    }
+
+@app.get("/api/patients/{user_id}/trends")
+def read_patient_trends(
+    user_id: int,
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Progress trend per metric: slope per session with its 95% interval,
+    confidence that the metric is improving, and projected sessions to goal.
+    Goals default to trends.METRICS; override with e.g. goal_accuracy=85.
+    Served from the running sums in patient_trends (trends.py).
+    """
+    # Authorization: Self, Doctor, or Parent (as for session history)
+    if current_user.id != user_id and current_user.role not in ("doctor", "parent"):
+        raise HTTPException(status_code=403, detail="Not authorized to view this data")
+    goals = {}
+    for metric in trends.METRICS:
+        raw = request.query_params.get(f"goal_{metric}")
+        if raw is not None:
+            try:
+                goals[metric] = float(raw)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"goal_{metric} must be a number")
+    return {"user_id": user_id, "metrics": trends.patient_trends(db, user_id, goals)}
+
+@app.get("/api/analytics/cohort")
+async def read_cohort(
+    scope: str = "doctor",
+    patient_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Trend slopes, improvement rates and cohort percentiles for every patient
+    of the doctor (scope=doctor) or of their clinic (scope=clinic). With
+    patient_id, that patient's entry is also returned as "patient".
+    """
+    if current_user.role != "doctor" or not current_user.doctor_profile:
+        raise HTTPException(status_code=403, detail="Only doctors can view cohort analytics")
+    profile = current_user.doctor_profile
+    if scope == "doctor":
+        key, filters = f"doctor:{profile.id}", {"doctor_id": profile.id}
+    elif scope == "clinic":
+        if not profile.clinic_name:
+            raise HTTPException(status_code=400, detail="Doctor profile has no clinic")
+        key, filters = f"clinic:{profile.clinic_name}", {"clinic_name": profile.clinic_name}
+    else:
+        raise HTTPException(status_code=400, detail="scope must be 'doctor' or 'clinic'")
+
+    from . import cohort  # numpy, imported on first use
+
+    async def compute():
+        result = await cohort.compute_async(await cohort.load(db, **filters))
+        names = await cohort.player_names(db, [p["user_id"] for p in result["patients"]])
+        for entry in result["patients"]:
+            entry["name"] = names.get(entry["user_id"])
+        return result
+
+    result = await cache.get_or_set_async("cohort", key, compute)
+    if patient_id is not None:
+        patient = next((p for p in result["patients"] if p["user_id"] == patient_id), None)
+        if patient is None:
+            raise HTTPException(status_code=404, detail="Patient has no sessions in this cohort")
+        result = {**result, "patient": patient}
+    return FastJSONResponse(result)
+
+@app.get("/api/analytics/sessions", response_model=list[schemas.SessionResponse])
+def search_sessions(
+    game_type: Optional[str] = None,
+    where: list[str] = Query([], description='Filters on promoted game_metadata keys, e.g. "stars_connected>20"'),
+    limit: int = 100,
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Game-specific analytics: sessions whose game_metadata matches every `where` filter."""
+    if current_user.role == "admin":
+        doctor_id = None
+    elif current_user.role == "doctor" and current_user.doctor_profile:
+        doctor_id = current_user.doctor_profile.id  # own patients only
+    else:
+        raise HTTPException(status_code=403, detail="Only doctors can search sessions")
+    try:
+        filters = [game_metadata.parse_filter(expression) for expression in where]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return crud.search_sessions(db, game_type=game_type, filters=filters, doctor_id=doctor_id,
+                                limit=max(1, min(limit, 1000)))
 
 @app.post("/api/schedule/{patient_id}")
 def schedule_session(
@@ -368,23 +570,12 @@ def schedule_session(
          raise HTTPException(status_code=403, detail="Only doctors can schedule sessions")
 
     # Create a wrapper session marked as scheduled
-    # In real app, we might have a separate 'Schedule' table, but using TherapySession with future date works for MVP
     # We check if profile exists first
     patient = db.query(models.PatientProfile).filter(models.PatientProfile.user_id == patient_id).first()
     if not patient:
         raise HTTPException(status_code=404, detail="Patient profile not found")
 
-    db_session = models.TherapySession(
-        patient_id=patient.id,
-        scheduled_date=date,
-        game_type="space", # Default assignment
-        difficulty="medium",
-        duration_seconds=0,
-        score=0
-    )
-    db.add(db_session)
-    db.commit()
-    db.refresh(db_session)
+    crud.schedule_therapy_session(db, patient, date)
     return {"status": "success", "scheduled_date": date}
 
 @app.post("/api/doctor/notes", response_model=schemas.DoctorNoteResponse)
@@ -404,6 +595,8 @@ def create_doctor_note(
 @app.get("/api/doctor/notes/{patient_id}", response_model=list[schemas.DoctorNoteResponse])
 def get_doctor_notes(
     patient_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -424,6 +617,11 @@ def get_doctor_notes(
     else:
          raise HTTPException(status_code=403, detail="Not authorized")
 
+    validator = Validator(f"notes-{patient_id}", *crud.note_validator(db, patient_id))
+    unchanged = not_modified(request, validator)
+    if unchanged:
+        return unchanged
+    set_validators(response, validator)
     return crud.get_doctor_notes(db, patient_id)
 
 @app.post("/api/patients/link")
@@ -448,60 +646,115 @@ def link_doctor(
         # Create if missing
         patient_profile = crud.create_patient_profile(db, schemas.PatientProfileCreate(diagnosis="Unknown", affected_eye="Both"), current_user.id)
         
-    patient_profile.doctor_id = doctor_profile.id
-    db.commit()
+    crud.assign_doctor(db, patient_profile, doctor_profile.id)
     
     return {"status": "success", "doctor_name": doctor_profile.user.full_name, "clinic": doctor_profile.clinic_name}
 
 # --- Ghost Mode / Real-Time Monitoring ---
+import json
+from typing import Optional
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import List, Dict
+from .ghost import manager, parse_fps, valid_frame, MultiplexWatcher
 
-class ConnectionManager:
-    def __init__(self):
-        # Map: patient_id -> list[WebSocket] (Doctors)
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-
-    async def connect(self, websocket: WebSocket, patient_id: str):
-        await websocket.accept()
-        if patient_id not in self.active_connections:
-            self.active_connections[patient_id] = []
-        self.active_connections[patient_id].append(websocket)
-
-    def disconnect(self, websocket: WebSocket, patient_id: str):
-        if patient_id in self.active_connections:
-            self.active_connections[patient_id].remove(websocket)
-            if not self.active_connections[patient_id]:
-                del self.active_connections[patient_id]
+def _lookup_stream_doctor(db: Session, patient_id: str):
+    try:
+        return crud.get_doctor_id_for_patient(db, int(patient_id))
+    except ValueError:
+        return None
+    finally:
+        # Release the pooled connection for the life of the socket
+        db.close()
 
-    async def broadcast(self, message: str, patient_id: str):
-        if patient_id in self.active_connections:
-            for connection in self.active_connections[patient_id]:
-                await connection.send_text(message)
+def _decode_frame(frame: Optional[str]):
+    if frame is None:
+        return None
+    try:
+        return json.loads(frame)
+    except ValueError:
+        return frame
 
-manager = ConnectionManager()
+@app.get("/api/doctor/live")
+def read_live_patients(include_frames: bool = False, current_user: models.User = Depends(get_current_user)):
+    """
+    Patients of the current doctor that are streaming right now (in-memory, no DB scan).
+    Pass include_frames=true to also get each stream's last-known frame.
+    """
+    if current_user.role != "doctor":
+        raise HTTPException(status_code=403, detail="Only doctors can view live sessions")
+    if not current_user.doctor_profile:
+        return []
+    return [
+        {
+            "patient_id": stream.patient_id,
+            "connected_at": datetime.utcfromtimestamp(stream.connected_at),
+            "last_seen": datetime.utcfromtimestamp(stream.last_seen),
+            "watchers": manager.watcher_count(stream.patient_id),
+            **({"last_frame": _decode_frame(stream.last_frame)} if include_frames else {}),
+        }
+        for stream in manager.presence.for_doctor(current_user.doctor_profile.id)
+    ]
 
 @app.websocket("/ws/patient/{patient_id}")
-async def websocket_patient_endpoint(websocket: WebSocket, patient_id: str):
+async def websocket_patient_endpoint(websocket: WebSocket, patient_id: str, db: Session = Depends(get_db)):
     # Patient connects here to STREAM data
     await websocket.accept()
+    doctor_id = await run_in_threadpool(_lookup_stream_doctor, db, patient_id)
+    # Tells the client whether anyone is watching (pause / resume at a rate)
+    stream = await manager.open_stream(websocket, patient_id, doctor_id)
     try:
         while True:
             data = await websocket.receive_text()
-            # Broadcast every message from patient to listener doctors
+            if not valid_frame(data):
+                continue  # would corrupt the multiplexed envelopes
+            stream.touch(data)
+            # Relay to listener doctors (each coalesced to its own rate)
             await manager.broadcast(data, patient_id)
     except WebSocketDisconnect:
-        # Patient disconnected, maybe notify doctors?
         pass
+    finally:
+        manager.close_stream(websocket, patient_id)
 
 @app.websocket("/ws/doctor/{patient_id}")
-async def websocket_doctor_endpoint(websocket: WebSocket, patient_id: str):
-    # Doctor connects here to RECEIVE data
-    await manager.connect(websocket, patient_id)
+async def websocket_doctor_endpoint(websocket: WebSocket, patient_id: str, fps: Optional[float] = None):
+    # Doctor connects here to RECEIVE data, optionally at a reduced rate
+    # (e.g. ?fps=1 for thumbnail grids, ?fps=30 for a full-screen view)
+    await manager.connect(websocket, patient_id, parse_fps(fps))
     try:
         while True:
-            # Keep connection open
-            await websocket.receive_text() 
+            # Control messages: {"type": "set_rate", "fps": 5}
+            message = await websocket.receive_text()
+            try:
+                control = json.loads(message)
+            except ValueError:
+                continue
+            if isinstance(control, dict) and control.get("type") == "set_rate":
+                await manager.watch(websocket, patient_id, parse_fps(control.get("fps")))
     except WebSocketDisconnect:
         manager.disconnect(websocket, patient_id)
 
+@app.websocket("/ws/doctor")
+async def websocket_doctor_multiplex_endpoint(websocket: WebSocket, batch_ms: Optional[int] = None):
+    # One socket for many patients. Control messages:
+    #   {"type": "subscribe", "patient_id": "12", "fps": 5}
+    #   {"type": "unsubscribe", "patient_id": "12"}
+    # Frames arrive as {"type": "frame", "patient_id": ..., "frame": {...}}, or
+    # with ?batch_ms=N as one {"type": "batch", "frames": [...]} message per tick.
+    await websocket.accept()
+    watcher = MultiplexWatcher(websocket, batch_ms / 1000.0 if batch_ms and batch_ms > 0 else None)
+    watcher.start()
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                control = json.loads(message)
+            except ValueError:
+                continue
+            if not isinstance(control, dict) or control.get("patient_id") is None:
+                continue
+            patient_id = str(control["patient_id"])
+            if control.get("type") in ("subscribe", "set_rate"):
+                await manager.watch(websocket, patient_id, parse_fps(control.get("fps")), watcher=watcher)
+            elif control.get("type") == "unsubscribe":
+                manager.disconnect(websocket, patient_id)
+    except WebSocketDisconnect:
+        manager.disconnect_watcher(watcher)
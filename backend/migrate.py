@@ -0,0 +1,85 @@
+"""
+Applies database migrations. Run once per deploy, before the new app starts:
+
+    python -m backend.migrate
+
+The app itself no longer issues DDL at import. Databases created by the old
+import-time create_all() have tables but no alembic_version row; the 0001
+baseline adopts them, creating only the tables, columns (formerly added by
+hand with add_column.py) and indexes they lack.
+
+Migrations never import backend.models: a revision describes the schema as
+it was when it was written, so anything it needs (column defaults, say) is
+written out in the revision itself.
+
+New columns on large tables go through a migration plus a chunked backfill;
+see backfill.py.
+"""
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
+from . import database
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+
+def alembic_config(connection=None) -> Config:
+    config = Config(ALEMBIC_INI)
+    config.attributes["configure_logger"] = False
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def upgrade(engine=None, revision: str = "head"):
+    engine = engine or database.engine
+    with engine.connect() as connection:
+        if "alembic_version" not in inspect(connection).get_table_names():
+            print("[MIGRATE] No migration history; applying from the baseline")
+        # Leave transaction control to Alembic (some steps, e.g. CREATE INDEX
+        # CONCURRENTLY, run outside a transaction)
+        connection.commit()
+        command.upgrade(alembic_config(connection), revision)
+
+
+def _session_factory(engine=None):
+    from sqlalchemy.orm import sessionmaker
+    return sessionmaker(bind=engine) if engine is not None else database.SessionLocal
+
+
+def run_backfills(engine=None):
+    """Runs (or resumes) every registered backfill that hasn't finished."""
+    from . import backfill
+    session_factory = _session_factory(engine)
+    db = session_factory()
+    try:
+        pending = [name for name in backfill.BACKFILLS if backfill.status(db, name)["status"] != "done"]
+    finally:
+        db.close()
+    for name in pending:
+        backfill.run(name, session_factory=session_factory)
+
+
+def build_summaries(engine=None):
+    """Populates derived summary tables that are new in this deploy."""
+    from . import leaderboard, sketches, trends
+    db = _session_factory(engine)()
+    try:
+        leaderboard.ensure_built(db)
+        trends.ensure_built(db)
+        # Catches up from the checkpoint; a no-op when the scheduled job is current
+        sketches.persist_sketches(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    upgrade()
+    print("[MIGRATE] Database is up to date")
+    # Data backfills are chunked and resumable; a deploy that is cut short
+    # picks them up again next time (or run python -m backend.backfill run ...)
+    run_backfills()
+    build_summaries()
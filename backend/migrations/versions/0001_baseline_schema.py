@@ -0,0 +1,257 @@
+"""baseline schema
+
+Also adopts databases that predate migrations (tables created at app import):
+existing tables and indexes are kept and only what is missing is created.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 04:05:08.104432
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# Defaults for columns a legacy table may lack, as the models had them at this
+# revision. Written out here (not read from backend.models) so this migration
+# behaves the same however the models change later. Enums store member names.
+LEGACY_DEFAULTS = {
+    "job_queue": {"payload": "{}", "status": "queued", "attempts": 0, "max_attempts": 5},
+    "users": {"role": "PATIENT", "is_active": True},
+    "notification_outbox": {"channel": "email", "status": "pending", "attempts": 0},
+    "patient_profiles": {"visual_acuity_left": "20/20", "visual_acuity_right": "20/20",
+                         "prescription_details": "{}"},
+    "doctor_notes": {"note_type": "SUGGESTION"},
+    "therapy_sessions": {
+        "duration_seconds": 0, "score": 0, "balloons_popped": 0, "accuracy": 0.0, "fixation_accuracy": 0.0,
+        "avg_response_time": 0.0, "dichoptic_contrast_level": 1.0, "completion_rate": 0.0,
+        "suppression_events": 0,
+    },
+}
+
+
+def _create_table(name, *elements):
+    """
+    op.create_table(), except on a database created by the app's old
+    import-time create_all(): there the table may already exist, possibly
+    missing columns added since (previously patched by add_column.py), which
+    are added here with their LEGACY_DEFAULTS.
+    """
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table(name):
+        op.create_table(name, *elements)
+        return
+    existing = {c["name"] for c in inspector.get_columns(name)}
+    defaults = LEGACY_DEFAULTS.get(name, {})
+    for column in elements:
+        if not isinstance(column, sa.Column) or column.name in existing:
+            continue
+        default = None
+        if column.name in defaults:
+            default = sa.literal(defaults[column.name], column.type)
+        print(f"[MIGRATE] Adding missing column {name}.{column.name}")
+        op.add_column(name, sa.Column(column.name, column.type, nullable=True, server_default=default))
+
+
+def upgrade():
+    _create_table('achievements',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('icon', sa.String(), nullable=True),
+    sa.Column('requirement_type', sa.String(), nullable=True),
+    sa.Column('requirement_value', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_achievements_id', 'achievements', ['id'], unique=False, if_not_exists=True)
+
+    _create_table('job_queue',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('task', sa.String(), nullable=True),
+    sa.Column('payload', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('max_attempts', sa.Integer(), nullable=True),
+    sa.Column('run_at', sa.DateTime(), nullable=True),
+    sa.Column('locked_by', sa.String(), nullable=True),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_job_queue_id', 'job_queue', ['id'], unique=False, if_not_exists=True)
+    op.create_index('ix_job_queue_status_run_at', 'job_queue', ['status', 'run_at'], unique=False, if_not_exists=True)
+    op.create_index('ix_job_queue_task', 'job_queue', ['task'], unique=False, if_not_exists=True)
+
+    _create_table('scheduler_leases',
+    sa.Column('job_name', sa.String(), nullable=False),
+    sa.Column('owner', sa.String(), nullable=True),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('next_run_at', sa.DateTime(), nullable=True),
+    sa.Column('last_run_at', sa.DateTime(), nullable=True),
+    sa.Column('last_duration_seconds', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('job_name')
+    )
+    _create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(), nullable=True),
+    sa.Column('hashed_password', sa.String(), nullable=True),
+    sa.Column('full_name', sa.String(), nullable=True),
+    sa.Column('role', sa.Enum('ADMIN', 'DOCTOR', 'PATIENT', 'PARENT', name='userrole'), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_users_email', 'users', ['email'], unique=True, if_not_exists=True)
+    op.create_index('ix_users_id', 'users', ['id'], unique=False, if_not_exists=True)
+
+    _create_table('doctor_profiles',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('license_number', sa.String(), nullable=True),
+    sa.Column('clinic_name', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_doctor_profiles_id', 'doctor_profiles', ['id'], unique=False, if_not_exists=True)
+
+    _create_table('notification_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('channel', sa.String(), nullable=True),
+    sa.Column('recipient', sa.String(), nullable=True),
+    sa.Column('subject', sa.String(), nullable=True),
+    sa.Column('body', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+    sa.Column('claimed_by', sa.String(), nullable=True),
+    sa.Column('claimed_until', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_notification_outbox_id', 'notification_outbox', ['id'], unique=False, if_not_exists=True)
+    op.create_index('ix_notification_outbox_status_next', 'notification_outbox', ['status', 'next_attempt_at'], unique=False, if_not_exists=True)
+
+    _create_table('user_achievements',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('achievement_id', sa.Integer(), nullable=True),
+    sa.Column('unlocked_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['achievement_id'], ['achievements.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_user_achievements_id', 'user_achievements', ['id'], unique=False, if_not_exists=True)
+
+    _create_table('patient_profiles',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('doctor_id', sa.Integer(), nullable=True),
+    sa.Column('parent_id', sa.Integer(), nullable=True),
+    sa.Column('diagnosis', sa.String(), nullable=True),
+    sa.Column('affected_eye', sa.String(), nullable=True),
+    sa.Column('baseline_visual_acuity', sa.String(), nullable=True),
+    sa.Column('visual_acuity_left', sa.String(), nullable=True),
+    sa.Column('visual_acuity_right', sa.String(), nullable=True),
+    sa.Column('prescription_details', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['doctor_id'], ['doctor_profiles.id'], ),
+    sa.ForeignKeyConstraint(['parent_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_patient_profiles_id', 'patient_profiles', ['id'], unique=False, if_not_exists=True)
+
+    _create_table('doctor_notes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('doctor_id', sa.Integer(), nullable=True),
+    sa.Column('patient_id', sa.Integer(), nullable=True),
+    sa.Column('note_type', sa.Enum('SUGGESTION', 'REPORT', name='notetype'), nullable=True),
+    sa.Column('content', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['doctor_id'], ['doctor_profiles.id'], ),
+    sa.ForeignKeyConstraint(['patient_id'], ['patient_profiles.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_doctor_notes_id', 'doctor_notes', ['id'], unique=False, if_not_exists=True)
+
+    _create_table('therapy_sessions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('patient_id', sa.Integer(), nullable=True),
+    sa.Column('start_time', sa.DateTime(), nullable=True),
+    sa.Column('scheduled_date', sa.DateTime(), nullable=True),
+    sa.Column('end_time', sa.DateTime(), nullable=True),
+    sa.Column('duration_seconds', sa.Integer(), nullable=True),
+    sa.Column('game_type', sa.String(), nullable=True),
+    sa.Column('difficulty', sa.String(), nullable=True),
+    sa.Column('score', sa.Integer(), nullable=True),
+    sa.Column('balloons_popped', sa.Integer(), nullable=True),
+    sa.Column('accuracy', sa.Float(), nullable=True),
+    sa.Column('fixation_accuracy', sa.Float(), nullable=True),
+    sa.Column('avg_response_time', sa.Float(), nullable=True),
+    sa.Column('dichoptic_contrast_level', sa.Float(), nullable=True),
+    sa.Column('completion_rate', sa.Float(), nullable=True),
+    sa.Column('game_metadata', sa.Text(), nullable=True),
+    sa.Column('average_fixation_score', sa.Float(), nullable=True),
+    sa.Column('suppression_events', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['patient_id'], ['patient_profiles.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_therapy_sessions_id', 'therapy_sessions', ['id'], unique=False, if_not_exists=True)
+    op.create_index('ix_therapy_sessions_patient_start', 'therapy_sessions', ['patient_id', 'start_time'], unique=False, if_not_exists=True)
+
+
+
+def downgrade():
+    with op.batch_alter_table('therapy_sessions', schema=None) as batch_op:
+        batch_op.drop_index('ix_therapy_sessions_patient_start')
+        batch_op.drop_index(batch_op.f('ix_therapy_sessions_id'))
+
+    op.drop_table('therapy_sessions')
+    with op.batch_alter_table('doctor_notes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_doctor_notes_id'))
+
+    op.drop_table('doctor_notes')
+    with op.batch_alter_table('patient_profiles', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_patient_profiles_id'))
+
+    op.drop_table('patient_profiles')
+    with op.batch_alter_table('user_achievements', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_achievements_id'))
+
+    op.drop_table('user_achievements')
+    with op.batch_alter_table('notification_outbox', schema=None) as batch_op:
+        batch_op.drop_index('ix_notification_outbox_status_next')
+        batch_op.drop_index(batch_op.f('ix_notification_outbox_id'))
+
+    op.drop_table('notification_outbox')
+    with op.batch_alter_table('doctor_profiles', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_doctor_profiles_id'))
+
+    op.drop_table('doctor_profiles')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_id'))
+        batch_op.drop_index(batch_op.f('ix_users_email'))
+
+    op.drop_table('users')
+    op.drop_table('scheduler_leases')
+    with op.batch_alter_table('job_queue', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_job_queue_task'))
+        batch_op.drop_index('ix_job_queue_status_run_at')
+        batch_op.drop_index(batch_op.f('ix_job_queue_id'))
+
+    op.drop_table('job_queue')
+    with op.batch_alter_table('achievements', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_achievements_id'))
+
+    op.drop_table('achievements')
@@ -0,0 +1,34 @@
+"""backfill progress
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 04:08:43.501476
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('backfill_progress',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('last_id', sa.Integer(), nullable=True),
+    sa.Column('max_id', sa.Integer(), nullable=True),
+    sa.Column('rows_updated', sa.Integer(), nullable=True),
+    sa.Column('chunks', sa.Integer(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('backfill_progress')
@@ -0,0 +1,32 @@
+"""therapy_sessions.user_id
+
+Expand step only: a nullable column and an index, both online-safe. Existing
+rows are filled by the "therapy_sessions_user_id" backfill (backfill.py),
+which python -m backend.migrate runs after upgrading.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 04:20:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('therapy_sessions', sa.Column('user_id', sa.Integer(), nullable=True))
+    # CONCURRENTLY on PostgreSQL so the build doesn't block session inserts
+    with op.get_context().autocommit_block():
+        op.create_index('ix_therapy_sessions_user_start', 'therapy_sessions', ['user_id', 'start_time'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_therapy_sessions_user_start', table_name='therapy_sessions')
+    with op.batch_alter_table('therapy_sessions', schema=None) as batch_op:
+        batch_op.drop_column('user_id')
@@ -0,0 +1,32 @@
+"""leaderboard scores
+
+Filled from existing sessions by leaderboard.rebuild(), which
+python -m backend.migrate runs when the table is empty.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 04:13:25.474142
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('leaderboard_scores',
+    sa.Column('board', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('total_score', sa.Integer(), nullable=True),
+    sa.Column('sessions', sa.Integer(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('board', 'user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('leaderboard_scores')
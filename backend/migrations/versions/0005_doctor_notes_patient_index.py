@@ -0,0 +1,28 @@
+"""doctor_notes patient index
+
+Serves the notes list and its conditional-GET validator (count / max id per
+patient) without scanning the table.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 04:19:25.989881
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY on PostgreSQL so the build doesn't block note inserts
+    with op.get_context().autocommit_block():
+        op.create_index('ix_doctor_notes_patient_created', 'doctor_notes', ['patient_id', 'created_at'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_doctor_notes_patient_created', table_name='doctor_notes')
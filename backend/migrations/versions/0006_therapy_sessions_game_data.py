@@ -0,0 +1,57 @@
+"""therapy_sessions game_data
+
+Expand step for structured game metadata (game_metadata.py): a native JSON
+column (JSONB on PostgreSQL), generated columns for the promoted keys and
+partial indexes on them. Existing rows are copied from the legacy text
+column by the "therapy_sessions_game_data" backfill, which
+python -m backend.migrate runs after upgrading.
+
+The generated columns are VIRTUAL on SQLite (an instant ALTER). PostgreSQL
+before 18 only has STORED generated columns, so there the ADD COLUMN
+rewrites therapy_sessions once; schedule it for a quiet period.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 04:24:54.701397
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+PROMOTED = ['stars_connected', 'max_combo', 'targets_hit']
+
+
+def _generated(key):
+    """The promoted key's generated-column expression, as of this revision."""
+    if op.get_bind().dialect.name == 'postgresql':
+        return sa.Computed(sa.text(f"CAST((game_data ->> '{key}') AS INTEGER)"), persisted=True)
+    # SQLite can only ALTER-add VIRTUAL generated columns
+    return sa.Computed(sa.text(f"json_extract(game_data, '$.{key}')"))
+
+
+def upgrade():
+    op.add_column('therapy_sessions', sa.Column(
+        'game_data', sa.JSON().with_variant(postgresql.JSONB(), 'postgresql'), nullable=True))
+    for key in PROMOTED:
+        op.add_column('therapy_sessions', sa.Column(f'meta_{key}', sa.Integer(), _generated(key), nullable=True))
+    # CONCURRENTLY on PostgreSQL so the builds don't block session inserts
+    with op.get_context().autocommit_block():
+        for key in PROMOTED:
+            where = sa.text(f'meta_{key} IS NOT NULL')
+            op.create_index(f'ix_therapy_sessions_game_{key}', 'therapy_sessions', ['game_type', f'meta_{key}'],
+                            unique=False, sqlite_where=where, postgresql_where=where, postgresql_concurrently=True)
+
+
+def downgrade():
+    for key in PROMOTED:
+        op.drop_index(f'ix_therapy_sessions_game_{key}', table_name='therapy_sessions')
+    with op.batch_alter_table('therapy_sessions', schema=None) as batch_op:
+        for key in PROMOTED:
+            batch_op.drop_column(f'meta_{key}')
+        batch_op.drop_column('game_data')
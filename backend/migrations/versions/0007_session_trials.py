@@ -0,0 +1,33 @@
+"""session trials
+
+Trial-level events per session (trials.py): a compressed blob and its
+derived metrics, one row per session that uploaded trials.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 04:27:52.877625
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('session_trials',
+    sa.Column('session_id', sa.Integer(), nullable=False),
+    sa.Column('n_trials', sa.Integer(), nullable=True),
+    sa.Column('data', sa.LargeBinary(), nullable=True),
+    sa.Column('metrics', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['session_id'], ['therapy_sessions.id'], ),
+    sa.PrimaryKeyConstraint('session_id')
+    )
+
+
+def downgrade():
+    op.drop_table('session_trials')
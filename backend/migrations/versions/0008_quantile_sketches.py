@@ -0,0 +1,41 @@
+"""quantile sketches
+
+Persisted KLL sketches per (game_type, difficulty, metric) and their ingest
+checkpoint (sketches.py). Filled by the "quantile_sketches" scheduled job.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 04:32:33.543245
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('quantile_sketches',
+    sa.Column('game_type', sa.String(), nullable=False),
+    sa.Column('difficulty', sa.String(), nullable=False),
+    sa.Column('metric', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=True),
+    sa.Column('data', sa.JSON(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('game_type', 'difficulty', 'metric')
+    )
+    op.create_table('sketch_checkpoints',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=True),
+    sa.Column('next_max_id', sa.Integer(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('sketch_checkpoints')
+    op.drop_table('quantile_sketches')
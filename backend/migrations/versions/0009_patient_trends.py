@@ -0,0 +1,38 @@
+"""patient trends
+
+Running least-squares sums per patient and metric (trends.py), updated with
+each new session. Existing sessions are summed in by `python -m
+backend.migrate` (trends.ensure_built).
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 04:36:04.370972
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('patient_trends',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('metric', sa.String(), nullable=False),
+    sa.Column('n', sa.Integer(), nullable=True),
+    sa.Column('sum_x', sa.Float(), nullable=True),
+    sa.Column('sum_y', sa.Float(), nullable=True),
+    sa.Column('sum_xx', sa.Float(), nullable=True),
+    sa.Column('sum_xy', sa.Float(), nullable=True),
+    sa.Column('sum_yy', sa.Float(), nullable=True),
+    sa.Column('last_value', sa.Float(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('user_id', 'metric')
+    )
+
+
+def downgrade():
+    op.drop_table('patient_trends')
@@ -0,0 +1,32 @@
+"""notification_outbox kind
+
+Tags outbox rows with what they are about, so the inactivity job can skip
+patients who already had a reminder since their last session. Rows from
+before this revision have no kind.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19 05:02:11.418093
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('notification_outbox', sa.Column('kind', sa.String(), nullable=True))
+    # CONCURRENTLY on PostgreSQL so the build doesn't block the outbox
+    with op.get_context().autocommit_block():
+        op.create_index('ix_notification_outbox_user_kind', 'notification_outbox', ['user_id', 'kind', 'created_at'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_notification_outbox_user_kind', table_name='notification_outbox')
+    with op.batch_alter_table('notification_outbox', schema=None) as batch_op:
+        batch_op.drop_column('kind')
@@ -0,0 +1,67 @@
+"""game_data guarded casts
+
+Re-creates the promoted meta_* generated columns (0006) with expressions
+that yield NULL instead of failing or mis-sorting when a key holds
+something other than a whole number. On PostgreSQL the plain CAST raised
+on '12.0' or 'abc', failing the insert (or the legacy backfill chunk); on
+SQLite a string was kept as text and compared greater than every number.
+
+A generated column's expression can't be altered, so each column and its
+partial index are dropped and added again. On PostgreSQL this rewrites
+therapy_sessions once, like 0006; schedule it for a quiet period.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19 05:40:12.207316
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+PROMOTED = ['stars_connected', 'max_combo', 'targets_hit']
+
+
+def _guarded(key):
+    """The promoted key's generated-column expression, as of this revision."""
+    if op.get_bind().dialect.name == 'postgresql':
+        text = f"(game_data ->> '{key}')"
+        return sa.Computed(sa.text(
+            f"CASE WHEN jsonb_typeof(game_data -> '{key}') = 'number' AND {text} ~ '^-?[0-9]{{1,9}}(\\.0+)?$' "
+            f"THEN CAST(CAST({text} AS NUMERIC) AS INTEGER) END"), persisted=True)
+    value = f"json_extract(game_data, '$.{key}')"
+    return sa.Computed(sa.text(
+        f"CASE WHEN json_type(game_data, '$.{key}') IN ('integer', 'real') "
+        f"AND {value} = CAST({value} AS INTEGER) THEN CAST({value} AS INTEGER) END"))
+
+
+def _unguarded(key):
+    """0006's expression."""
+    if op.get_bind().dialect.name == 'postgresql':
+        return sa.Computed(sa.text(f"CAST((game_data ->> '{key}') AS INTEGER)"), persisted=True)
+    return sa.Computed(sa.text(f"json_extract(game_data, '$.{key}')"))
+
+
+def _recreate(expression):
+    for key in PROMOTED:
+        op.drop_index(f'ix_therapy_sessions_game_{key}', table_name='therapy_sessions')
+        op.drop_column('therapy_sessions', f'meta_{key}')
+        op.add_column('therapy_sessions', sa.Column(f'meta_{key}', sa.Integer(), expression(key), nullable=True))
+    # CONCURRENTLY on PostgreSQL so the builds don't block session inserts
+    with op.get_context().autocommit_block():
+        for key in PROMOTED:
+            where = sa.text(f'meta_{key} IS NOT NULL')
+            op.create_index(f'ix_therapy_sessions_game_{key}', 'therapy_sessions', ['game_type', f'meta_{key}'],
+                            unique=False, sqlite_where=where, postgresql_where=where, postgresql_concurrently=True)
+
+
+def upgrade():
+    _recreate(_guarded)
+
+
+def downgrade():
+    _recreate(_unguarded)
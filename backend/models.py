@@ -1,6 +1,9 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Enum, Text, Boolean
+from sqlalchemy import (Column, Integer, String, ForeignKey, DateTime, Float, Enum, Text, Boolean, Index, JSON,
+                        LargeBinary, Computed, event, select, text)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from .database import Base
+from .game_metadata import PROMOTED, json_field
 from datetime import datetime
 import enum
 
@@ -63,6 +66,10 @@ class TherapySession(Base):
     __tablename__ = "therapy_sessions"
     id = Column(Integer, primary_key=True, index=True)
     patient_id = Column(Integer, ForeignKey("patient_profiles.id"))
+    # Denormalized patient.user_id so per-user reads skip the profile join.
+    # Set on insert (see _fill_session_user_id); no FK so the column could be
+    # added online (SQLite would rebuild the table for a constraint).
+    user_id = Column(Integer, nullable=True)
     
     start_time = Column(DateTime, default=datetime.utcnow)
     scheduled_date = Column(DateTime, nullable=True) # For Doctor scheduling
@@ -80,23 +87,49 @@ class TherapySession(Base):
     accuracy = Column(Float, default=0.0)
     
     # Advanced / Eye Tracking Metrics
-    fixation_accuracy = Column(Float, default=0.0) # Percentage of successful fixations
-    avg_response_time = Column(Float, default=0.0) # Seconds to find target
-    dichoptic_contrast_level = Column(Float, default=1.0) # Setting used
+    # NULL when the session didn't measure it
+    fixation_accuracy = Column(Float) # Percentage of successful fixations
+    avg_response_time = Column(Float) # Seconds to find target
+    dichoptic_contrast_level = Column(Float) # Setting used
     completion_rate = Column(Float, default=0.0) # % of level finished
-    game_metadata = Column(Text, default="{}") # JSON blob for game-specifics (stars connected, etc)
+    # Game-specific results (stars connected, etc), validated per game_type (see game_metadata.py)
+    game_data = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)
+    # Legacy JSON-as-text copy, no longer written; copied into game_data by the
+    # "therapy_sessions_game_data" backfill and dropped by a later migration
+    game_metadata = Column(Text, nullable=True)
+
+    # Promoted game_data keys (game_metadata.PROMOTED), indexed for analytics filters
+    meta_stars_connected = Column(Integer, Computed(json_field("game_data", "stars_connected", Integer)))
+    meta_max_combo = Column(Integer, Computed(json_field("game_data", "max_combo", Integer)))
+    meta_targets_hit = Column(Integer, Computed(json_field("game_data", "targets_hit", Integer)))
 
     # Legacy/Advanced Metrics
     average_fixation_score = Column(Float, nullable=True)
     suppression_events = Column(Integer, default=0)
     
     patient = relationship("PatientProfile", back_populates="sessions")
-    
-    @property
-    def user_id(self):
-        if self.patient:
-            return self.patient.user_id
-        return None
+
+    __table_args__ = (
+        # Latest-session-per-patient lookups (inactivity job, streaks)
+        Index("ix_therapy_sessions_patient_start", "patient_id", "start_time"),
+        # Session history, stats and leaderboard (per-user, newest first)
+        Index("ix_therapy_sessions_user_start", "user_id", "start_time"),
+        # Partial: only sessions that report the key are indexed
+        *(
+            Index(f"ix_therapy_sessions_game_{key}", "game_type", f"meta_{key}",
+                  sqlite_where=text(f"meta_{key} IS NOT NULL"), postgresql_where=text(f"meta_{key} IS NOT NULL"))
+            for key in PROMOTED
+        ),
+    )
+
+@event.listens_for(TherapySession, "before_insert")
+def _fill_session_user_id(mapper, connection, target):
+    # Backstop for code paths that only set patient_id (scripts, seeders)
+    if target.user_id is None and target.patient_id is not None:
+        profiles = PatientProfile.__table__
+        target.user_id = connection.execute(
+            select(profiles.c.user_id).where(profiles.c.id == target.patient_id)
+        ).scalar()
 
 class Achievement(Base):
     __tablename__ = "achievements"
@@ -135,6 +168,150 @@ class DoctorNote(Base):
     doctor = relationship("DoctorProfile", back_populates="notes")
     patient = relationship("PatientProfile", back_populates="doctor_notes")
 
+    __table_args__ = (
+        # A patient's notes, newest first; also serves the conditional-GET validator
+        Index("ix_doctor_notes_patient_created", "patient_id", "created_at"),
+    )
+
+class SchedulerLease(Base):
+    """One row per periodic job; guards it so only one worker runs it per interval."""
+    __tablename__ = "scheduler_leases"
+    job_name = Column(String, primary_key=True)
+    owner = Column(String, nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    next_run_at = Column(DateTime, default=datetime.utcnow)
+    last_run_at = Column(DateTime, nullable=True)
+    last_duration_seconds = Column(Float, nullable=True)
+
+class NotificationOutbox(Base):
+    """
+    Outgoing notifications. Producers append rows cheaply; the delivery worker
+    in notifications.py claims and sends them in batches.
+    """
+    __tablename__ = "notification_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    channel = Column(String, default="email") # "email" or "sms"
+    kind = Column(String, nullable=True) # what the message is about, e.g. "inactivity_reminder"
+    recipient = Column(String)
+    subject = Column(String)
+    body = Column(Text)
+
+    status = Column(String, default="pending") # pending, sending, sent, failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    claimed_by = Column(String, nullable=True)
+    claimed_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_notification_outbox_status_next", "status", "next_attempt_at"),
+        # "Has this user already had this kind of message since ...?" (inactivity job)
+        Index("ix_notification_outbox_user_kind", "user_id", "kind", "created_at"),
+    )
+
+class QueuedJob(Base):
+    """Durable deferred work (see jobqueue.py)."""
+    __tablename__ = "job_queue"
+    id = Column(Integer, primary_key=True, index=True)
+    task = Column(String, index=True)
+    payload = Column(Text, default="{}") # JSON kwargs for the task
+
+    status = Column(String, default="queued") # queued, running, done, dead
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    run_at = Column(DateTime, default=datetime.utcnow)
+    locked_by = Column(String, nullable=True)
+    locked_until = Column(DateTime, nullable=True) # visibility timeout
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_job_queue_status_run_at", "status", "run_at"),
+    )
+
+class LeaderboardScore(Base):
+    """
+    Materialized leaderboard totals, one row per (board, user), kept up to
+    date on session insert (see leaderboard.py). Boards: "all", "week:<ISO
+    week>", "game:<type>" and "game:<type>:<difficulty>".
+    """
+    __tablename__ = "leaderboard_scores"
+    board = Column(String, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    total_score = Column(Integer, default=0)
+    sessions = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class BackfillProgress(Base):
+    """Checkpoint of a chunked backfill (see backfill.py); lets a run resume where it stopped."""
+    __tablename__ = "backfill_progress"
+    name = Column(String, primary_key=True)
+    status = Column(String, default="pending") # pending, running, paused, done
+    last_id = Column(Integer, default=0) # highest primary key processed
+    max_id = Column(Integer, nullable=True) # highest primary key when the run started
+    rows_updated = Column(Integer, default=0)
+    chunks = Column(Integer, default=0)
+    started_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+class SessionTrials(Base):
+    """
+    Trial-level events of one session: a compressed columnar blob plus the
+    metrics derived from it at ingest (see trials.py).
+    """
+    __tablename__ = "session_trials"
+    session_id = Column(Integer, ForeignKey("therapy_sessions.id"), primary_key=True)
+    n_trials = Column(Integer, default=0)
+    data = Column(LargeBinary) # trials.encode()
+    metrics = Column(JSON) # trials.compute_metrics()
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class QuantileSketch(Base):
+    """
+    KLL sketch of one metric's values across sessions of a game and
+    difficulty (see sketches.py). Empty strings stand for a missing
+    game_type / difficulty.
+    """
+    __tablename__ = "quantile_sketches"
+    game_type = Column(String, primary_key=True)
+    difficulty = Column(String, primary_key=True)
+    metric = Column(String, primary_key=True)
+    count = Column(Integer, default=0) # sessions summarized
+    data = Column(JSON) # sketches.KLL.to_dict()
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class SketchCheckpoint(Base):
+    """How far into therapy_sessions (by id) the persisted sketches reach."""
+    __tablename__ = "sketch_checkpoints"
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, default=0) # sessions up to this id are in the sketches
+    next_max_id = Column(Integer, nullable=True) # upper bound for the next run
+    updated_at = Column(DateTime, nullable=True)
+
+class PatientTrend(Base):
+    """
+    Running least-squares sums of one metric over a patient's sessions (see
+    trends.py). x is the session's ordinal among the patient's measured
+    sessions of that metric, y the metric value.
+    """
+    __tablename__ = "patient_trends"
+    user_id = Column(Integer, primary_key=True)
+    metric = Column(String, primary_key=True)
+    n = Column(Integer, default=0)
+    sum_x = Column(Float, default=0.0)
+    sum_y = Column(Float, default=0.0)
+    sum_xx = Column(Float, default=0.0)
+    sum_xy = Column(Float, default=0.0)
+    sum_yy = Column(Float, default=0.0)
+    last_value = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 # Resolve User relationships (Circular dependency fix)
 User.patient_profile = relationship("PatientProfile", back_populates="user", uselist=False, foreign_keys=[PatientProfile.user_id])
 User.children_profiles = relationship("PatientProfile", back_populates="parent", foreign_keys=[PatientProfile.parent_id])
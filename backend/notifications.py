@@ -0,0 +1,194 @@
+"""
+Notification outbox and delivery worker.
+
+Producers call enqueue_notification() (or enqueue_many() for bulk jobs),
+which only inserts into `notification_outbox` as part of their transaction.
+The delivery worker then:
+
+1. claims a batch of due rows by stamping them with a claim token (see
+   claims.py: FOR UPDATE SKIP LOCKED on PostgreSQL, a single atomic UPDATE
+   on SQLite), so concurrent workers never pick the same rows,
+2. sends them concurrently with bounded parallelism,
+3. marks them sent, or schedules a retry with exponential backoff, or gives
+   up after MAX_ATTEMPTS.
+
+Claims expire after CLAIM_SECONDS so rows held by a crashed worker are
+retried. Messages go out over SMTP when SMTP_HOST is set (a local stand-in
+works, e.g. `python -m aiosmtpd -n -l localhost:1025`), otherwise they are
+logged to the console.
+
+Run a delivery pass by hand with: python -m backend.notifications
+"""
+import os
+import random
+import smtplib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from sqlalchemy import update, insert, or_, and_
+from sqlalchemy.orm import Session
+
+from . import models
+from .claims import claim_rows
+from .database import SessionLocal
+from .scheduler import scheduler
+
+BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "100"))
+CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "8"))
+MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+CLAIM_SECONDS = 300
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+
+outbox = models.NotificationOutbox.__table__
+
+
+# --- Producers ---
+
+def enqueue_notification(db: Session, recipient: str, subject: str, body: str,
+                         user_id: int = None, channel: str = "email"):
+    """Adds a notification to the caller's transaction; nothing is sent inline."""
+    note = models.NotificationOutbox(
+        user_id=user_id, channel=channel, recipient=recipient, subject=subject, body=body
+    )
+    db.add(note)
+    return note
+
+def enqueue_many(db: Session, notifications: list):
+    """Bulk variant: one multi-row INSERT for a list of dicts (recipient, subject, body, ...)."""
+    if not notifications:
+        return
+    now = datetime.utcnow()
+    db.execute(insert(outbox), [
+        {"channel": "email", "user_id": None, "status": "pending", "attempts": 0,
+         "next_attempt_at": now, "created_at": now, **n}
+        for n in notifications
+    ])
+
+
+# --- Senders ---
+
+class ConsoleSender:
+    def send(self, note):
+        print(f"[NOTIFICATION] To {note.recipient}: {note.subject} - {note.body}")
+
+class SMTPSender:
+    def __init__(self, host: str, port: int = 25, from_addr: str = "no-reply@amblyocare.app",
+                 username: str = None, password: str = None, starttls: bool = False, timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.from_addr = from_addr
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send(self, note):
+        message = EmailMessage()
+        message["From"] = self.from_addr
+        message["To"] = note.recipient
+        message["Subject"] = note.subject
+        message.set_content(note.body)
+        # One connection per message keeps the sender thread-safe
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+def default_sender():
+    host = os.getenv("SMTP_HOST")
+    if not host:
+        return ConsoleSender()
+    return SMTPSender(
+        host,
+        int(os.getenv("SMTP_PORT", "25")),
+        from_addr=os.getenv("SMTP_FROM", "no-reply@amblyocare.app"),
+        username=os.getenv("SMTP_USERNAME"),
+        password=os.getenv("SMTP_PASSWORD"),
+        starttls=os.getenv("SMTP_STARTTLS", "0") == "1",
+    )
+
+
+# --- Delivery worker ---
+
+def backoff_delay(attempts: int) -> timedelta:
+    """Exponential backoff with jitter: ~30s, 1m, 2m, ... capped at an hour."""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+def claim_batch(db: Session, limit: int = BATCH_SIZE):
+    """Atomically claims up to `limit` due notifications and returns them."""
+    now = datetime.utcnow()
+    due = or_(
+        and_(outbox.c.status == "pending", outbox.c.next_attempt_at <= now),
+        # Claimed by a worker that died mid-batch
+        and_(outbox.c.status == "sending", outbox.c.claimed_until < now),
+    )
+    return claim_rows(db, outbox, due, limit, "claimed_by", {
+        "status": "sending",
+        "claimed_until": now + timedelta(seconds=CLAIM_SECONDS),
+    })
+
+def _send_one(sender, note):
+    try:
+        sender.send(note)
+        return None
+    except Exception as e:
+        return repr(e)
+
+def deliver_pending(db: Session, sender=None, batch_size: int = BATCH_SIZE,
+                    concurrency: int = CONCURRENCY, max_batches: int = None):
+    """
+    Drains due notifications batch by batch. Returns counts of sent, retried
+    and failed messages.
+    """
+    sender = sender or default_sender()
+    counts = {"sent": 0, "retried": 0, "failed": 0}
+    batches = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while max_batches is None or batches < max_batches:
+            claimed = claim_batch(db, batch_size)
+            if not claimed:
+                break
+            batches += 1
+            errors = list(pool.map(lambda note: _send_one(sender, note), claimed))
+
+            now = datetime.utcnow()
+            sent_ids = [note.id for note, error in zip(claimed, errors) if error is None]
+            if sent_ids:
+                db.execute(
+                    update(outbox).where(outbox.c.id.in_(sent_ids))
+                    .values(status="sent", sent_at=now, claimed_by=None, claimed_until=None,
+                            attempts=outbox.c.attempts + 1, last_error=None)
+                )
+                counts["sent"] += len(sent_ids)
+            for note, error in zip(claimed, errors):
+                if error is None:
+                    continue
+                attempts = note.attempts + 1
+                give_up = attempts >= MAX_ATTEMPTS
+                db.execute(
+                    update(outbox).where(outbox.c.id == note.id)
+                    .values(status="failed" if give_up else "pending", attempts=attempts,
+                            next_attempt_at=now + backoff_delay(attempts), last_error=error,
+                            claimed_by=None, claimed_until=None)
+                )
+                counts["failed" if give_up else "retried"] += 1
+            db.commit()
+    return counts
+
+
+@scheduler.job("notification_delivery", every=timedelta(seconds=30))
+def run_delivery():
+    db = SessionLocal()
+    try:
+        return deliver_pending(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print(run_delivery())
@@ -0,0 +1,248 @@
+"""
+Read-replica routing for GET endpoints.
+
+Configure replicas with DATABASE_REPLICA_URLS (comma-separated). Read-only
+endpoints take their session from get_read_db / get_async_read_db, whose
+RoutingSession sends queries to a healthy replica (round-robin, pinned for
+the rest of the request) and everything else to the primary:
+
+- any flush/write goes to the primary, and so do statements that write or
+  lock (session.execute(update(...)), select(...).with_for_update()); the
+  rest of that session then stays on the primary to see its own changes;
+- with no healthy replica, reads fall back to the primary;
+- read-your-writes: after a successful write request, the same caller
+  (identified by a hash of its Authorization header) reads from the primary
+  for REPLICA_STICKY_SECONDS, covering replication lag.
+
+The read-your-writes marks live in the cache backend when it is shared
+(CACHE_BACKEND=redis), so a write on one worker sends the caller's next
+read to the primary on every worker. With the in-process backends they are
+per worker, which is only correct with a single worker: replicas with
+WEB_CONCURRENCY > 1 require CACHE_BACKEND=redis, and startup fails otherwise.
+
+Replicas are health-checked every REPLICA_HEALTH_INTERVAL seconds (and
+marked down immediately on a disconnect error). To try it locally, point
+DATABASE_URL and DATABASE_REPLICA_URLS at two SQLite files, or at two local
+PostgreSQL instances set up with streaming replication.
+"""
+import asyncio
+import hashlib
+import itertools
+import math
+import os
+from typing import List, Optional
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from . import database
+from .cache import cache, LocalLRU, SharedBackend
+
+REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "10"))
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))  # uvicorn / gunicorn worker count
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = database.make_engine(url)
+        self._async_engine = None
+        self.healthy = True
+        self.last_error: Optional[str] = None
+        event.listen(self.engine, "handle_error", self._on_error)
+
+    @property
+    def async_engine(self):
+        if self._async_engine is None:
+            self._async_engine = database.make_async_engine(self.url)
+            event.listen(self._async_engine.sync_engine, "handle_error", self._on_error)
+        return self._async_engine
+
+    def _on_error(self, context):
+        if context.is_disconnect:
+            self.healthy = False
+            self.last_error = repr(context.original_exception)
+
+    def check(self):
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            self.healthy = True
+            self.last_error = None
+        except Exception as e:
+            self.healthy = False
+            self.last_error = repr(e)
+
+
+class ReplicaSet:
+    def __init__(self, urls: List[str], sticky_seconds: float = STICKY_SECONDS, sticky_store=None):
+        self.replicas = [Replica(url) for url in urls]
+        self.sticky_seconds = sticky_seconds
+        # "sticky:<principal>" -> set while the caller's reads stay on the primary (see module docstring)
+        self.sticky_store = sticky_store if sticky_store is not None else LocalLRU(max_entries=10000)
+        self._cycle = itertools.count()
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def blocking(self) -> bool:
+        """True when the sticky store does network I/O (async callers use the threadpool)."""
+        return self.sticky_store.blocking
+
+    def pick(self) -> Optional[Replica]:
+        """Next healthy replica in round-robin order, or None."""
+        n = len(self.replicas)
+        start = next(self._cycle)
+        for i in range(n):
+            replica = self.replicas[(start + i) % n]
+            if replica.healthy:
+                return replica
+        return None
+
+    def mark_write(self, principal: Optional[str]):
+        if not self.replicas or principal is None or self.sticky_seconds <= 0:
+            return
+        # Shared stores take whole seconds; rounding up only lengthens the window
+        ttl = self.sticky_seconds if not self.blocking else max(1, math.ceil(self.sticky_seconds))
+        try:
+            self.sticky_store.set(f"sticky:{principal}", 1, ttl)
+        except Exception as e:
+            print(f"[REPLICAS] Could not mark write for read-your-writes: {e!r}")
+
+    def is_sticky(self, principal: Optional[str]) -> bool:
+        if principal is None or not self.replicas:
+            return False
+        try:
+            return self.sticky_store.get(f"sticky:{principal}") is not None
+        except Exception:
+            return True  # can't tell: the primary is always safe
+
+    def check_all(self):
+        for replica in self.replicas:
+            replica.check()
+
+    async def _run_health_checks(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, self.check_all)
+            await asyncio.sleep(interval)
+
+    def start_health_checks(self, interval: float = HEALTH_INTERVAL):
+        if self.replicas and self._health_task is None:
+            self._health_task = asyncio.get_running_loop().create_task(self._run_health_checks(interval))
+
+    async def stop_health_checks(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def status(self):
+        return [{"url": r.engine.url.render_as_string(hide_password=True), "healthy": r.healthy,
+                 "last_error": r.last_error} for r in self.replicas]
+
+
+def _sticky_store():
+    if isinstance(cache.backend, SharedBackend):
+        return cache.backend
+    if REPLICA_URLS and WORKERS > 1:
+        raise RuntimeError(
+            "DATABASE_REPLICA_URLS with WEB_CONCURRENCY > 1 needs CACHE_BACKEND=redis: "
+            "read-your-writes must be shared by all workers"
+        )
+    return None
+
+
+replica_set = ReplicaSet(REPLICA_URLS, sticky_store=_sticky_store())
+
+
+def principal_key(request: Request) -> Optional[str]:
+    auth = request.headers.get("authorization")
+    if not auth:
+        return None
+    return hashlib.sha256(auth.encode()).hexdigest()[:32]
+
+
+class RoutingSession(Session):
+    """Session that sends read-only work to a replica (see module docstring)."""
+
+    use_async_engines = False
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self._read_replica(clause)
+        if replica is not None:
+            return replica.async_engine.sync_engine if self.use_async_engines else replica.engine
+        return super().get_bind(mapper, clause=clause, **kw)
+
+    def _read_replica(self, clause=None) -> Optional[Replica]:
+        if not self.info.get("read_only") or self.info.get("wrote"):
+            return None
+        if self._flushing or getattr(clause, "is_dml", False) or getattr(clause, "_for_update_arg", None) is not None:
+            # Writes and locks need the primary, and later reads must see them
+            self.info["wrote"] = True
+            return None
+        replicas = self.info.get("replica_set", replica_set)
+        if not replicas.replicas:
+            return None
+        if "sticky" not in self.info:
+            self.info["sticky"] = replicas.is_sticky(self.info.get("principal"))
+        if self.info["sticky"]:
+            return None
+        # Pin one replica per session so a request sees a consistent snapshot
+        replica = self.info.get("replica")
+        if replica is None or not replica.healthy:
+            replica = self.info["replica"] = replicas.pick()
+        return replica
+
+
+class AsyncRoutingSession(RoutingSession):
+    use_async_engines = True
+
+
+ReadSessionLocal = sessionmaker(class_=RoutingSession, bind=database.engine, autocommit=False, autoflush=False)
+_async_read_sessionmaker = None
+
+
+def AsyncReadSessionLocal(**kw):
+    global _async_read_sessionmaker
+    if _async_read_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        _async_read_sessionmaker = async_sessionmaker(
+            bind=database.get_async_engine(), sync_session_class=AsyncRoutingSession,
+            autoflush=False, expire_on_commit=False,
+        )
+    return _async_read_sessionmaker(**kw)
+
+
+def get_read_db(request: Request):
+    principal = principal_key(request)
+    db = ReadSessionLocal(info={"read_only": True, "principal": principal,
+                                "sticky": replica_set.is_sticky(principal)})
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(request: Request):
+    principal = principal_key(request)
+    # Looked up here rather than in get_bind, which runs on the event loop
+    sticky = (await run_in_threadpool(replica_set.is_sticky, principal) if replica_set.blocking
+              else replica_set.is_sticky(principal))
+    async with AsyncReadSessionLocal(info={"read_only": True, "principal": principal, "sticky": sticky}) as db:
+        yield db
+
+
+async def mark_write(request: Request):
+    """Read-your-writes after a successful write request (called by the app's middleware)."""
+    principal = principal_key(request)
+    if replica_set.blocking:
+        await run_in_threadpool(replica_set.mark_write, principal)
+    else:
+        replica_set.mark_write(principal)
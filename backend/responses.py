@@ -0,0 +1,40 @@
+"""
+Fast JSON responses for large, trusted payloads.
+
+With a response_model, FastAPI validates every item of the returned list
+against the schema before it serializes it, which is most of the cost of a
+long session history. Endpoints whose rows come straight from our own
+queries, or from the cache (already dumped through the schema once), can
+return FastJSONResponse instead: FastAPI skips response_model handling for
+Response objects, and orjson encodes datetimes in the same ISO format
+pydantic does. The response_model stays on the route for the OpenAPI docs.
+
+orjson is in requirements.txt; without it this falls back to the json module.
+"""
+import json
+from datetime import date, datetime
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is a listed requirement
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,215 @@
+"""
+In-process periodic job scheduler.
+
+Jobs are registered declaratively with @scheduler.job(...) and the scheduler
+starts with the FastAPI app. Every uvicorn worker runs the same loop, so each
+job is guarded by a row in `scheduler_leases`: a worker may only run a job
+after atomically claiming that row, which succeeds only when the job is due
+(next_run_at has passed) and nobody else holds an unexpired lease. The job
+therefore runs on exactly one worker per interval, and a crashed worker's
+lease simply expires.
+
+Jobs run in a thread pool by default, or in a process pool for CPU-heavy work
+(the function must then be importable at module level).
+"""
+import asyncio
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import update, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from . import database, models
+
+TICK_SECONDS = float(os.getenv("SCHEDULER_TICK_SECONDS", "5"))
+LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", "600"))
+
+
+class ScheduledJob:
+    def __init__(self, name: str, func: Callable, interval: timedelta, executor: str = "thread"):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor '{executor}'")
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.executor = executor
+        # Metrics (local to this worker)
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.last_run: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def metrics(self):
+        return {
+            "interval_seconds": self.interval.total_seconds(),
+            "executor": self.executor,
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_run": self.last_run,
+            "last_duration_seconds": self.last_duration,
+            "last_error": self.last_error,
+        }
+
+
+class Scheduler:
+    def __init__(self, session_factory=None, tick_seconds: float = TICK_SECONDS,
+                 lease_seconds: int = LEASE_SECONDS, max_workers: int = 2):
+        self.session_factory = session_factory
+        self.tick_seconds = tick_seconds
+        self.lease_seconds = lease_seconds
+        self.max_workers = max_workers
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs: Dict[str, ScheduledJob] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+    def job(self, name: str, every: timedelta, executor: str = "thread"):
+        """Registers the decorated function as a periodic job."""
+        def decorator(func):
+            self.jobs[name] = ScheduledJob(name, func, every, executor)
+            return func
+        return decorator
+
+    def _session(self):
+        return (self.session_factory or database.SessionLocal)()
+
+    # --- Leases ---
+
+    def try_acquire(self, job: ScheduledJob) -> bool:
+        """Claims the job's lease if it is due and not held by a live worker."""
+        leases = models.SchedulerLease.__table__
+        now = datetime.utcnow()
+        db = self._session()
+        try:
+            result = db.execute(
+                update(leases)
+                .where(
+                    leases.c.job_name == job.name,
+                    leases.c.next_run_at <= now,
+                    (leases.c.locked_until.is_(None)) | (leases.c.locked_until < now),
+                )
+                .values(owner=self.owner, locked_until=now + timedelta(seconds=self.lease_seconds))
+            )
+            if result.rowcount == 1:
+                db.commit()
+                return True
+            exists = db.execute(select(leases.c.job_name).where(leases.c.job_name == job.name)).first()
+            if exists:
+                db.rollback()
+                return False
+            # First run anywhere: whoever inserts the row wins
+            db.execute(insert(leases).values(
+                job_name=job.name,
+                owner=self.owner,
+                locked_until=now + timedelta(seconds=self.lease_seconds),
+                next_run_at=now,
+            ))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def release(self, job: ScheduledJob, started: datetime, duration: float):
+        leases = models.SchedulerLease.__table__
+        db = self._session()
+        try:
+            db.execute(
+                update(leases)
+                .where(leases.c.job_name == job.name, leases.c.owner == self.owner)
+                .values(
+                    locked_until=None,
+                    next_run_at=started + job.interval,
+                    last_run_at=started,
+                    last_duration_seconds=duration,
+                )
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    # --- Execution ---
+
+    def _executor(self, job: ScheduledJob):
+        if job.executor == "process":
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._processes
+        return self._threads
+
+    async def run_due(self):
+        """Starts every due job whose lease this worker wins. Returns the started tasks."""
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="scheduler")
+        loop = asyncio.get_running_loop()
+        started = []
+        for job in self.jobs.values():
+            if job.running:
+                continue
+            if await loop.run_in_executor(self._threads, self.try_acquire, job):
+                job.running = True
+                started.append(loop.create_task(self._execute(job)))
+        return started
+
+    async def _execute(self, job: ScheduledJob):
+        loop = asyncio.get_running_loop()
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        try:
+            await loop.run_in_executor(self._executor(job), job.func)
+            job.last_error = None
+        except Exception as e:
+            job.failures += 1
+            job.last_error = repr(e)
+            print(f"[SCHEDULER] Job {job.name} failed: {e!r}")
+        finally:
+            duration = time.perf_counter() - start
+            job.runs += 1
+            job.last_run = started_at
+            job.last_duration = duration
+            job.running = False
+            await loop.run_in_executor(self._threads, self.release, job, started_at, duration)
+
+    async def _run_forever(self):
+        while True:
+            try:
+                await self.run_due()
+            except Exception as e:
+                print(f"[SCHEDULER] Tick failed: {e!r}")
+            await asyncio.sleep(self.tick_seconds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._threads is not None:
+            self._threads.shutdown(wait=False)
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=False)
+            self._processes = None
+
+    def metrics(self):
+        return {"owner": self.owner, "jobs": {name: job.metrics() for name, job in self.jobs.items()}}
+
+
+scheduler = Scheduler()
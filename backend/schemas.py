@@ -1,7 +1,8 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, AliasChoices, model_validator
+from typing import Optional, List, Union, Dict, Any
 from datetime import datetime
 from .models import UserRole
+from . import game_metadata as game_metadata_registry
 
 # --- Forward Refs ---
 # Pydantic v1 requires update_forward_refs, v2 handles strings better but ordering is safer.
@@ -63,6 +64,30 @@ class UserResponse(UserBase):
         from_attributes = True
 
 # --- Session Schemas ---
+MAX_TRIALS = 5000
+
+class TrialsUpload(BaseModel):
+    """A session's trials as parallel columns (see trials.py)."""
+    t_ms: List[int] = Field(..., max_length=MAX_TRIALS, description="ms since session start, non-decreasing")
+    x: List[float] = Field(..., max_length=MAX_TRIALS, description="target x, 0..1 of the play area")
+    y: List[float] = Field(..., max_length=MAX_TRIALS, description="target y, 0..1 of the play area")
+    hit: List[bool] = Field(..., max_length=MAX_TRIALS)
+    rt_ms: List[Optional[int]] = Field(..., max_length=MAX_TRIALS, description="reaction time; null for misses")
+
+    @model_validator(mode="after")
+    def _check_columns(self):
+        if len({len(self.t_ms), len(self.x), len(self.y), len(self.hit), len(self.rt_ms)}) != 1:
+            raise ValueError("trial columns must have the same length")
+        if any(b < a for a, b in zip(self.t_ms, self.t_ms[1:])) or (self.t_ms and self.t_ms[0] < 0):
+            raise ValueError("t_ms must be non-negative and non-decreasing")
+        return self
+
+class TrialsResponse(BaseModel):
+    session_id: int
+    n_trials: int
+    metrics: Dict[str, Any]
+    events: Optional[Dict[str, List[Any]]] = None
+
 class SessionCreate(BaseModel):
     user_id: int 
     game_type: str
@@ -72,12 +97,21 @@ class SessionCreate(BaseModel):
     balloons_popped: int = Field(0, ge=0)
     accuracy: float = Field(0.0, ge=0.0, le=100.0)
     
-    # New Metrics
-    fixation_accuracy: Optional[float] = 0.0
-    avg_response_time: Optional[float] = 0.0
-    dichoptic_contrast_level: Optional[float] = 1.0
+    # New Metrics; left out means not measured (stored NULL, kept out of trends and percentiles)
+    fixation_accuracy: Optional[float] = None
+    avg_response_time: Optional[float] = None
+    dichoptic_contrast_level: Optional[float] = None
     completion_rate: Optional[float] = 0.0
-    game_metadata: Optional[str] = "{}"
+    # Game-specific results; a JSON object (or, from older clients, a JSON string)
+    game_metadata: Optional[Union[Dict[str, Any], str]] = None
+    # Optional trial-level events; stored compressed with derived metrics
+    trials: Optional[TrialsUpload] = None
+
+    @model_validator(mode="after")
+    def _validate_game_metadata(self):
+        # Checked against the game's schema (game_metadata.SCHEMAS); stored as a dict
+        self.game_metadata = game_metadata_registry.validate(self.game_type, self.game_metadata)
+        return self
 
 class SessionResponse(BaseModel):
     id: int
@@ -95,6 +129,8 @@ class SessionResponse(BaseModel):
     
     scheduled_date: Optional[datetime] = None
     created_at: datetime = datetime.utcnow()
+    # Read from TherapySession.game_data
+    game_metadata: Optional[Dict[str, Any]] = Field(None, validation_alias=AliasChoices("game_data", "game_metadata"))
     
     class Config:
         from_attributes = True
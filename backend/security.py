@@ -0,0 +1,56 @@
+"""
+Password hashing and access tokens.
+
+jose (via cryptography) and bcrypt are imported on first use rather than at
+module import, so a cold process can start serving (health checks, public
+endpoints) without paying for them; the first login or authenticated
+request loads them.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_env():
+    """Loads a .env file (cwd, backend/ or repo root) if one exists; dotenv is only imported then."""
+    for directory in (os.getcwd(), _BACKEND_DIR, os.path.dirname(_BACKEND_DIR)):
+        path = os.path.join(directory, ".env")
+        if os.path.isfile(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            return path
+    return None
+
+load_env()
+
+SECRET_KEY = os.getenv("SECRET_KEY", "unsafe_failover_key_change_in_prod")
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
+
+
+def verify_password(plain_password, hashed_password):
+    import bcrypt
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+def get_password_hash(password):
+    import bcrypt
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def create_access_token(data: dict, expires_delta: timedelta | None = None):
+    from jose import jwt
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.utcnow() + expires_delta
+    else:
+        expire = datetime.utcnow() + timedelta(minutes=15)
+    to_encode.update({"exp": expire})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def decode_access_token(token: str) -> Optional[dict]:
+    """The token's claims, or None if it is malformed, forged or expired."""
+    from jose import JWTError, jwt
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
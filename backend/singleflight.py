@@ -0,0 +1,105 @@
+"""
+Request coalescing ("single flight") for expensive reads.
+
+When several requests ask for the same thing at once (a dashboard and its
+pollers loading /api/stats/{id}, or everybody refreshing the leaderboard when
+its cache entry expires), only the first one runs the computation; the rest
+wait for it and share its result or its exception. Nothing is kept once the
+call finishes, so this is not a cache: it removes duplicate work in flight,
+and the response cache (backend/cache.py) covers what comes after.
+
+There are two groups: one for threads (sync endpoints run in the threadpool)
+and one for async tasks on the event loop. Coalescing is per process.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class Group:
+    """Coalesces concurrent calls with the same key across threads."""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Runs fn() unless a call for key is already running. Returns (result, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+class AsyncGroup:
+    """Coalesces concurrent calls with the same key across tasks of one event loop."""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Awaits fn() unless a call for key is already running. Returns (result, shared)."""
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            try:
+                # shield: a waiter that is cancelled must not cancel the leader's call
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled (e.g. its client went away); try again ourselves
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark it retrieved so an exception nobody waited for isn't logged as lost
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,332 @@
+"""
+Streaming quantile sketches: "better than X% of sessions" lookups.
+
+For every (game_type, difficulty, metric) we keep a KLL sketch of the metric's
+values across all sessions. A KLL sketch holds at most a few hundred values
+in levels of doubling weight, answers rank queries with about 1% error, and
+two sketches merge into one, so memory stays bounded however many sessions
+there are.
+
+The rank is over sessions, not patients: someone who plays daily weighs
+more than someone who played once. A per-patient sketch would have to
+replace a patient's value whenever they play again, and a KLL sketch can't
+remove values. Patient-against-patient comparisons are cohort.py's job.
+
+How the pieces fit:
+
+- `quantile_sketches` holds the persisted sketches, and `sketch_checkpoints`
+  records the last therapy_sessions id folded into them. The leased
+  scheduler job "quantile_sketches" (one worker per interval) folds in newer
+  sessions in id order, in batches of INGEST_BATCH. Ids are only ingested up
+  to the max id seen on the previous run, so an insert still in flight when
+  a higher id commits is not skipped.
+- Each process caches the persisted sketches (reloaded every
+  REFRESH_SECONDS). It also keeps the values of the sessions it inserted
+  since then (record() after commit), so a player's own session counts
+  immediately. Those values are dropped once the checkpoint covers them.
+- percentile() is a bisect over the sketch's cached CDF plus a scan of those
+  few pending values, which takes microseconds.
+
+Rebuild everything from therapy_sessions with:
+    python -m backend.sketches rebuild
+"""
+import math
+import os
+import random
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, func, delete
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+from .scheduler import scheduler
+from .trends import is_measured
+
+K = int(os.getenv("SKETCH_K", "200"))
+REFRESH_SECONDS = float(os.getenv("SKETCH_REFRESH_SECONDS", "60"))
+INGEST_BATCH = 50000
+MAX_PENDING = 10000  # per process; older values are in the next persisted sketch anyway
+CHECKPOINT = "quantile_sketches"
+
+# metric -> higher is better
+METRICS = {
+    "score": True,
+    "accuracy": True,
+    "fixation_accuracy": True,
+    "avg_response_time": False,
+}
+
+SketchKey = Tuple[str, str, str]
+
+
+class KLL:
+    """KLL quantile sketch (Karnin, Lang, Liberty 2016) over floats."""
+
+    def __init__(self, k: int = K, levels: List[List[float]] = None, n: int = 0):
+        self.k = k
+        self.levels: List[List[float]] = levels or [[]]
+        self.n = n
+        self._size = sum(len(level) for level in self.levels)
+        self._cdf = None
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def update(self, value: float):
+        self.levels[0].append(float(value))
+        self.n += 1
+        self._size += 1
+        self._cdf = None
+        if self._size >= self._max_size():
+            self._compress()
+
+    def merge(self, other: "KLL"):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, items in enumerate(other.levels):
+            self.levels[h].extend(items)
+        self.n += other.n
+        self._size = sum(len(level) for level in self.levels)
+        self._cdf = None
+        while self._size >= self._max_size():
+            self._compress()
+
+    def _compress(self):
+        for h in range(len(self.levels)):
+            if len(self.levels[h]) >= self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append([])
+                items = sorted(self.levels[h])
+                # An odd item out stays at this level; every other one of the rest moves up at double weight
+                keep = [items.pop()] if len(items) % 2 else []
+                promoted = items[random.getrandbits(1)::2]
+                self.levels[h] = keep
+                self.levels[h + 1].extend(promoted)
+                self._size -= len(items) - len(promoted)
+                if self._size < self._max_size():
+                    break
+
+    def _distribution(self):
+        if self._cdf is None:
+            weighted = sorted((value, 1 << h) for h, level in enumerate(self.levels) for value in level)
+            values, cumulative, total = [], [], 0
+            for value, weight in weighted:
+                total += weight
+                values.append(value)
+                cumulative.append(total)
+            self._cdf = (values, cumulative, total)
+        return self._cdf
+
+    def counts(self, value: float) -> Tuple[float, float]:
+        """Estimated (number of values < value, number of values <= value)."""
+        values, cumulative, _ = self._distribution()
+        lo, hi = bisect_left(values, value), bisect_right(values, value)
+        return (cumulative[lo - 1] if lo else 0), (cumulative[hi - 1] if hi else 0)
+
+    def quantile(self, q: float) -> Optional[float]:
+        values, cumulative, total = self._distribution()
+        if not values:
+            return None
+        return values[min(bisect_left(cumulative, q * total), len(values) - 1)]
+
+    def to_dict(self) -> dict:
+        return {"k": self.k, "n": self.n, "levels": self.levels}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "KLL":
+        return cls(k=data.get("k", K), levels=[list(level) for level in data["levels"]], n=data["n"])
+
+
+def metric_values(game_type, difficulty, row) -> List[Tuple[SketchKey, float]]:
+    """Sketch keys and values a session contributes; unmeasured metrics (trends.is_measured) are skipped."""
+    result = []
+    for metric in METRICS:
+        value = getattr(row, metric)
+        if is_measured(metric, value):
+            result.append(((game_type or "", difficulty or "", metric), float(value)))
+    return result
+
+
+class SketchStore:
+    """Per-process view: persisted sketches plus this process's not-yet-persisted values."""
+
+    def __init__(self, session_factory=SessionLocal, refresh_seconds: float = REFRESH_SECONDS):
+        self.session_factory = session_factory
+        self.refresh_seconds = refresh_seconds
+        self._sketches: Dict[SketchKey, KLL] = {}
+        self._pending: Dict[SketchKey, List[Tuple[int, float]]] = defaultdict(list)
+        self._pending_count = 0
+        self._last_id = 0
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _refresh(self, db: Session = None):
+        owns_session = db is None
+        db = db or self.session_factory()
+        try:
+            checkpoint = db.get(models.SketchCheckpoint, CHECKPOINT)
+            rows = db.execute(select(models.QuantileSketch)).scalars().all()
+            sketches = {(r.game_type, r.difficulty, r.metric): KLL.from_dict(r.data) for r in rows}
+        finally:
+            if owns_session:
+                db.close()
+        last_id = checkpoint.last_id if checkpoint else 0
+        with self._lock:
+            self._sketches, self._last_id = sketches, last_id
+            for key, values in list(self._pending.items()):
+                self._pending[key] = [(i, v) for i, v in values if i > last_id]
+            self._pending_count = sum(len(v) for v in self._pending.values())
+            self._loaded_at = time.monotonic()
+
+    def record(self, session: models.TherapySession):
+        """Counts a committed session in this process's view right away."""
+        with self._lock:
+            if self._pending_count >= MAX_PENDING:
+                return
+            for key, value in metric_values(session.game_type, session.difficulty, session):
+                self._pending[key].append((session.id, value))
+                self._pending_count += 1
+
+    def percentile(self, game_type: str, difficulty: str, metric: str, value: float,
+                   db: Session = None) -> Optional[dict]:
+        """Share of sessions (0-100) at this game and difficulty that `value` beats, or None without data."""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds:
+            self._refresh(db)
+        key = (game_type or "", difficulty or "", metric)
+        sketch = self._sketches.get(key)
+        below, at_or_below = sketch.counts(value) if sketch else (0, 0)
+        total = sketch.n if sketch else 0
+        for _, pending in self._pending.get(key, ()):
+            below += pending < value
+            at_or_below += pending <= value
+            total += 1
+        if not total:
+            return None
+        # Ties count half, so identical values sit at the middle of their group
+        share = 100.0 * (below + at_or_below) / (2 * total)
+        return {"session_percentile": round(share if METRICS[metric] else 100.0 - share, 1), "sessions": total}
+
+    def clear(self):
+        with self._lock:
+            self._sketches.clear()
+            self._pending.clear()
+            self._pending_count = 0
+            self._last_id = 0
+            self._loaded_at = None
+
+
+store = SketchStore()
+
+
+def _checkpoint(db: Session) -> models.SketchCheckpoint:
+    checkpoint = db.get(models.SketchCheckpoint, CHECKPOINT)
+    if checkpoint is None:
+        checkpoint = models.SketchCheckpoint(name=CHECKPOINT, last_id=0)
+        db.add(checkpoint)
+    return checkpoint
+
+
+def ingest(db: Session, batch: int = INGEST_BATCH) -> int:
+    """
+    Folds the next batch of sessions into the persisted sketches and advances
+    the checkpoint, in one transaction. Returns the number of sessions read.
+    """
+    sessions = models.TherapySession
+    checkpoint = _checkpoint(db)
+    current_max = db.execute(select(func.max(sessions.id))).scalar() or 0
+    if checkpoint.next_max_id is None:
+        checkpoint.next_max_id = current_max
+    upper = checkpoint.next_max_id
+
+    rows = db.execute(
+        select(sessions.id, sessions.game_type, sessions.difficulty,
+               *(getattr(sessions, metric) for metric in METRICS))
+        .where(sessions.id > checkpoint.last_id, sessions.id <= upper, sessions.scheduled_date.is_(None))
+        .order_by(sessions.id)
+        .limit(batch)
+    ).all()
+
+    new: Dict[SketchKey, KLL] = defaultdict(KLL)
+    for row in rows:
+        for key, value in metric_values(row.game_type, row.difficulty, row):
+            new[key].update(value)
+
+    now = datetime.utcnow()
+    for (game_type, difficulty, metric), sketch in new.items():
+        row = db.get(models.QuantileSketch, (game_type, difficulty, metric))
+        if row is None:
+            row = models.QuantileSketch(game_type=game_type, difficulty=difficulty, metric=metric)
+            db.add(row)
+        else:
+            merged = KLL.from_dict(row.data)
+            merged.merge(sketch)
+            sketch = merged
+        row.data = sketch.to_dict()
+        row.count = sketch.n
+        row.updated_at = now
+
+    if len(rows) < batch:
+        # Everything up to `upper` is in; sessions above it are ingested next run
+        checkpoint.last_id = upper
+        checkpoint.next_max_id = current_max
+    else:
+        checkpoint.last_id = rows[-1].id
+    checkpoint.updated_at = now
+    db.commit()
+    return len(rows)
+
+
+@scheduler.job("quantile_sketches", every=timedelta(minutes=1))
+def persist_sketches(db: Session = None):
+    """Scheduled: brings the persisted sketches up to date."""
+    owns_session = db is None
+    db = db or SessionLocal()
+    try:
+        total = 0
+        while True:
+            read = ingest(db)
+            total += read
+            if read < INGEST_BATCH:
+                break
+        return total
+    finally:
+        if owns_session:
+            db.close()
+
+
+def rebuild(db: Session) -> int:
+    """Drops the sketches and rebuilds them from all sessions. Returns the number of sessions read."""
+    db.execute(delete(models.QuantileSketch))
+    db.execute(delete(models.SketchCheckpoint).where(models.SketchCheckpoint.name == CHECKPOINT))
+    db.commit()
+    total = 0
+    # Two passes: the first only records the current max id as the upper bound
+    while True:
+        read = ingest(db)
+        total += read
+        checkpoint = db.get(models.SketchCheckpoint, CHECKPOINT)
+        if read < INGEST_BATCH and checkpoint.last_id >= checkpoint.next_max_id:
+            break
+    store.clear()
+    return total
+
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python -m backend.sketches rebuild")
+    db = SessionLocal()
+    try:
+        print(f"[SKETCHES] Rebuilt from {rebuild(db)} sessions")
+    finally:
+        db.close()
@@ -1,44 +1,89 @@
 from datetime import datetime, timedelta
-from database import SessionLocal
-from models import User, TherapySession, UserRole
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from .database import SessionLocal
+from .scheduler import scheduler
+from .notifications import enqueue_many
+from .models import User, TherapySession, UserRole, NotificationOutbox
 
-def check_inactivity_and_notify():
+INACTIVITY_DAYS = 3
+BATCH_SIZE = 1000
+REMINDER_KIND = "inactivity_reminder"
+
+def find_inactive_patients(db: Session, days: int = INACTIVITY_DAYS, batch_size: int = BATCH_SIZE):
+    """
+    Yields batches of (user_id, full_name, email, last_active) for patients whose
+    last session (or signup, if they never played) is older than `days` and
+    who haven't been sent a reminder since.
+
+    One grouped query instead of a query per patient; rows are streamed with
+    yield_per so memory stays bounded regardless of patient count.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    last_played = (
+        select(
+            TherapySession.user_id.label("user_id"),
+            func.max(TherapySession.start_time).label("last_played"),
+        )
+        .group_by(TherapySession.user_id)
+        .subquery()
+    )
+    last_active = func.coalesce(last_played.c.last_played, User.created_at)
+    already_reminded = (
+        select(NotificationOutbox.id)
+        .where(NotificationOutbox.user_id == User.id, NotificationOutbox.kind == REMINDER_KIND,
+               NotificationOutbox.created_at >= last_active)
+        .exists()
+    )
+
+    stmt = (
+        select(User.id, User.full_name, User.email, last_active.label("last_active"))
+        .outerjoin(last_played, last_played.c.user_id == User.id)
+        .where(User.role == UserRole.PATIENT, last_active < cutoff, ~already_reminded)
+        .execution_options(yield_per=batch_size)
+    )
+    for batch in db.execute(stmt).partitions():
+        yield batch
+
+@scheduler.job("inactivity_check", every=timedelta(hours=24))
+def check_inactivity_and_notify(db: Session = None):
     """
-    Checks for patients who haven't played in 3 days.
-    In a real app, this would send Emails/SMS.
-    Here, it logs to console or updates a notification table.
+    Checks for patients who haven't played in 3 days and queues a reminder
+    for each in the notification outbox (delivered by notifications.py).
+    One reminder per lapse: patients reminded since their last session are
+    skipped until they play again. Returns the number of patients notified.
+
+    Errors roll the run back and propagate to the scheduler, which logs them
+    and counts them in its metrics (last_error, failures).
     """
-    db = SessionLocal()
+    owns_session = db is None
+    if owns_session:
+        db = SessionLocal()
+    notified = 0
     try:
-        # Get all patients
-        patients = db.query(User).filter(User.role == UserRole.PATIENT).all()
-        
-        for patient in patients:
-            # Get last session
-            last_session = db.query(TherapySession)\
-                .filter(TherapySession.patient_id == patient.patient_profile.id)\
-                .order_by(TherapySession.start_time.desc())\
-                .first()
-            
-            should_notify = False
-            if not last_session:
-                # Never played?
-                if (datetime.utcnow() - patient.created_at).days > 3:
-                     should_notify = True
-            else:
-                if (datetime.utcnow() - last_session.start_time).days > 3:
-                    should_notify = True
-            
-            if should_notify:
-                # Log Notification (Simulating Email)
-                print(f"[NOTIFICATION] ALERT: Patient {patient.full_name} ({patient.email}) hasn't played in over 3 days!")
-                
-                # In a real system: send_email(patient.email, "Missed you at Star Guardian Academy!")
-
-    except Exception as e:
-        print(f"Error in background task: {e}")
+        for batch in find_inactive_patients(db):
+            enqueue_many(db, [
+                {
+                    "user_id": patient.id,
+                    "kind": REMINDER_KIND,
+                    "recipient": patient.email,
+                    "subject": "Missed you at Star Guardian Academy!",
+                    "body": f"Hi {patient.full_name}, you haven't played in over {INACTIVITY_DAYS} days. Your eyes miss their training!",
+                }
+                for patient in batch
+            ])
+            notified += len(batch)
+        # Committing mid-stream would release the connection under the open cursor
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     finally:
-        db.close()
+        if owns_session:
+            db.close()
+    return notified
 
 if __name__ == "__main__":
+    # Run from the project root: python -m backend.tasks
     check_inactivity_and_notify()
@@ -0,0 +1,220 @@
+"""
+Per-patient treatment-progress trends, kept as running least-squares sums.
+
+For each patient and metric, `patient_trends` holds n, Σx, Σy, Σx², Σxy and
+Σy², where x is the session's ordinal among the patient's sessions that
+measured the metric (1, 2, 3, ...) and y its value. Every new session adds
+one term to each sum with a single upsert in the session's own transaction,
+so updating a trend is O(1) however long the history, and so is reading it:
+
+    slope      = Sxy / Sxx          (Sxy = Σxy - ΣxΣy/n, Sxx = Σx² - (Σx)²/n)
+    residuals  = Syy - slope * Sxy  (Syy = Σy² - (Σy)²/n)
+    std error  = sqrt(residuals / (n - 2) / Sxx)
+
+From these, estimate() reports the slope per session with a 95% interval,
+the confidence that the metric is really improving, the fitted current
+value, and a projection of how many more sessions it takes to reach the
+goal at that rate.
+
+Rebuild the table from therapy_sessions with:
+    python -m backend.trends rebuild
+"""
+import math
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, func, delete, insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+# metric -> (higher is better, default goal)
+METRICS = {
+    "accuracy": (True, 90.0),
+    "fixation_accuracy": (True, 90.0),
+    "avg_response_time": (False, 1.0),  # seconds
+    "dichoptic_contrast_level": (True, 1.0),  # fellow-eye contrast back to balanced
+}
+MIN_SESSIONS = 3
+MAX_PROJECTION = 1000  # sessions; further out than this is reported as None
+
+# Two-sided 95% critical values of Student's t by degrees of freedom; 1.96 beyond 30
+_T95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+
+trends = models.PatientTrend.__table__
+
+
+def is_measured(metric: str, value) -> bool:
+    """
+    Whether a session's metric value is a measurement. Shared with the
+    quantile sketches. Metrics a client didn't send are NULL; sessions from
+    before that stored a response time of 0 when there was none.
+    """
+    return value is not None and not (metric == "avg_response_time" and value <= 0)
+
+
+def measured(session) -> Dict[str, float]:
+    """The trend metrics a session measured."""
+    values = {}
+    for metric in METRICS:
+        value = getattr(session, metric)
+        if is_measured(metric, value):
+            values[metric] = float(value)
+    return values
+
+
+def _upsert(db: Session, user_id: int, values: Dict[str, float], now: datetime):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    # A first session is x = 1; after that x = n + 1, with n read from the row being updated
+    stmt = dialect_insert(trends).values([
+        {"user_id": user_id, "metric": metric, "n": 1, "sum_x": 1.0, "sum_y": y, "sum_xx": 1.0, "sum_xy": y,
+         "sum_yy": y * y, "last_value": y, "updated_at": now}
+        for metric, y in values.items()
+    ])
+    x, y = trends.c.n + 1, stmt.excluded.last_value
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[trends.c.user_id, trends.c.metric],
+        set_={
+            "n": x,
+            "sum_x": trends.c.sum_x + x,
+            "sum_y": trends.c.sum_y + y,
+            "sum_xx": trends.c.sum_xx + x * x,
+            "sum_xy": trends.c.sum_xy + x * y,
+            "sum_yy": trends.c.sum_yy + y * y,
+            "last_value": y,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    ))
+
+
+def record_session(db: Session, session: models.TherapySession):
+    """Adds the session to its patient's trends as part of the caller's transaction."""
+    if session.user_id is None or session.scheduled_date is not None:
+        return
+    values = measured(session)
+    if values:
+        _upsert(db, session.user_id, values, datetime.utcnow())
+
+
+def estimate(n: int, sum_x: float, sum_y: float, sum_xx: float, sum_xy: float, sum_yy: float,
+             higher_is_better: bool, goal: Optional[float]) -> dict:
+    """Trend statistics from the running sums."""
+    result = {
+        "sessions": n, "slope": None, "slope_ci95": None, "confidence": None, "r_squared": None,
+        "current": None, "goal": goal, "sessions_to_goal": None,
+    }
+    if n < MIN_SESSIONS:
+        return result
+    sxx = sum_xx - sum_x * sum_x / n
+    sxy = sum_xy - sum_x * sum_y / n
+    syy = max(sum_yy - sum_y * sum_y / n, 0.0)
+    if sxx <= 0:
+        return result
+
+    slope = sxy / sxx
+    intercept = (sum_y - slope * sum_x) / n
+    residuals = max(syy - slope * sxy, 0.0)  # clamped: cancellation can leave a tiny negative
+    std_error = math.sqrt(residuals / (n - 2) / sxx)
+    margin = (_T95[n - 3] if n - 2 <= len(_T95) else 1.96) * std_error
+    # P(true slope points the improving way), normal approximation to the t statistic
+    direction = slope if higher_is_better else -slope
+    if std_error:
+        confidence = 0.5 * math.erfc(-direction / (std_error * math.sqrt(2)))
+    else:
+        confidence = 1.0 if direction > 0 else 0.0 if direction < 0 else 0.5
+    current = intercept + slope * n
+
+    result.update({
+        "slope": round(slope, 6),
+        "slope_ci95": [round(slope - margin, 6), round(slope + margin, 6)],
+        "confidence": round(confidence, 4),
+        "r_squared": round(slope * sxy / syy, 4) if syy > 0 else None,
+        "current": round(current, 4),
+    })
+    if goal is not None:
+        remaining = goal - current
+        if (remaining <= 0) if higher_is_better else (remaining >= 0):
+            result["sessions_to_goal"] = 0
+        elif direction > 0:
+            sessions = math.ceil(remaining / slope - 1e-9)  # 6.000000001 sessions is 6
+            result["sessions_to_goal"] = sessions if sessions <= MAX_PROJECTION else None
+    return result
+
+
+def patient_trends(db: Session, user_id: int, goals: Dict[str, float] = None) -> Dict[str, dict]:
+    """Trend estimates for every metric the patient has data for. One primary-key lookup, no history scan."""
+    goals = goals or {}
+    rows = db.execute(select(trends).where(trends.c.user_id == user_id)).all()
+    result = {}
+    for row in rows:
+        if row.metric not in METRICS:
+            continue
+        higher_is_better, default_goal = METRICS[row.metric]
+        result[row.metric] = {
+            **estimate(row.n, row.sum_x, row.sum_y, row.sum_xx, row.sum_xy, row.sum_yy,
+                       higher_is_better, goals.get(row.metric, default_goal)),
+            "higher_is_better": higher_is_better,
+            "last_value": row.last_value,
+            "updated_at": row.updated_at,
+        }
+    return result
+
+
+def rebuild(db: Session, batch_size: int = 1000) -> int:
+    """Recomputes patient_trends from therapy_sessions (in id order, as inserted). Returns the rows written."""
+    sessions = models.TherapySession
+    sums = defaultdict(lambda: [0, 0.0, 0.0, 0.0, 0.0, 0.0, None])
+    stmt = (
+        select(sessions.user_id, *(getattr(sessions, metric) for metric in METRICS))
+        .where(sessions.user_id.is_not(None), sessions.scheduled_date.is_(None))
+        .order_by(sessions.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for row in db.execute(stmt):
+        for metric, y in measured(row).items():
+            entry = sums[(row.user_id, metric)]
+            entry[0] += 1
+            x = entry[0]
+            entry[1] += x
+            entry[2] += y
+            entry[3] += x * x
+            entry[4] += x * y
+            entry[5] += y * y
+            entry[6] = y
+    now = datetime.utcnow()
+    db.execute(delete(trends))
+    rows: List[dict] = [
+        {"user_id": user_id, "metric": metric, "n": n, "sum_x": sx, "sum_y": sy, "sum_xx": sxx, "sum_xy": sxy,
+         "sum_yy": syy, "last_value": last, "updated_at": now}
+        for (user_id, metric), (n, sx, sy, sxx, sxy, syy, last) in sums.items()
+    ]
+    for i in range(0, len(rows), batch_size):
+        db.execute(insert(trends), rows[i:i + batch_size])
+    db.commit()
+    return len(rows)
+
+
+def ensure_built(db: Session):
+    """Builds the trends table on first deploy (empty table, existing sessions)."""
+    if db.execute(select(func.count()).select_from(trends)).scalar():
+        return
+    if db.execute(select(func.count()).select_from(models.TherapySession.__table__)).scalar():
+        print(f"[TRENDS] Built {rebuild(db)} trend rows")
+
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python -m backend.trends rebuild")
+    db = SessionLocal()
+    try:
+        print(f"[TRENDS] Rebuilt {rebuild(db)} trend rows")
+    finally:
+        db.close()
@@ -0,0 +1,139 @@
+"""
+Trial-level event storage for therapy sessions.
+
+A session's individual trials (one per target shown) arrive as columns:
+t_ms (ms since session start), x / y (target position, 0..1 of the play
+area), hit, and rt_ms (reaction time, None for misses). They are stored in
+`session_trials` as one compressed binary blob per session, column by
+column, each in the narrowest type that holds it:
+
+    t_ms   uint32  delta-encoded (small, repetitive gaps compress well)
+    x, y   uint16  quantized to 1/65535 of the play area
+    hit    bits    np.packbits
+    rt_ms  uint16  RT_MISSING for misses, capped at 65534 ms
+
+then zlib-compressed, so a few hundred trials take 1-3 KB. Derived metrics
+(reaction-time percentiles and histogram, fatigue slope, hit-rate curve) are
+computed with vectorized NumPy once, at ingest, and stored next to the blob
+as JSON; reading them never decodes the trials.
+
+numpy is imported with this module, and callers import it on first use so it
+stays off the API's cold-start path.
+"""
+import struct
+import zlib
+from typing import Dict, Sequence
+
+import numpy as np
+
+MAGIC = b"TRL1"
+HEADER = struct.Struct("<4sI")  # magic, trial count
+RT_MISSING = 0xFFFF
+COMPRESSION_LEVEL = 6
+
+CURVE_BINS = 10  # hit-rate curve resolution (consecutive blocks of trials)
+RT_HISTOGRAM_EDGES = list(range(0, 2001, 100))  # ms; slower responses go in the last bucket
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def to_arrays(t_ms: Sequence[int], x: Sequence[float], y: Sequence[float], hit: Sequence[bool],
+              rt_ms: Sequence) -> Dict[str, np.ndarray]:
+    """Columns as received (lists) -> typed arrays, the form encode() and compute_metrics() take."""
+    rt = np.array([RT_MISSING if v is None else min(max(v, 0), RT_MISSING - 1) for v in rt_ms], dtype=np.uint16)
+    return {
+        "t_ms": np.asarray(t_ms, dtype=np.int64),
+        "x": np.asarray(x, dtype=np.float64),
+        "y": np.asarray(y, dtype=np.float64),
+        "hit": np.asarray(hit, dtype=bool),
+        "rt_ms": rt,
+    }
+
+
+def _quantize(values: np.ndarray) -> np.ndarray:
+    return np.rint(np.clip(values, 0.0, 1.0) * 65535).astype("<u2")
+
+
+def encode(arrays: Dict[str, np.ndarray]) -> bytes:
+    n = len(arrays["t_ms"])
+    deltas = np.diff(arrays["t_ms"], prepend=0).astype("<u4")
+    body = b"".join((
+        deltas.tobytes(),
+        _quantize(arrays["x"]).tobytes(),
+        _quantize(arrays["y"]).tobytes(),
+        np.packbits(arrays["hit"]).tobytes(),
+        arrays["rt_ms"].astype("<u2").tobytes(),
+    ))
+    return HEADER.pack(MAGIC, n) + zlib.compress(body, COMPRESSION_LEVEL)
+
+
+def decode(blob: bytes) -> Dict[str, np.ndarray]:
+    magic, n = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("Not a trial blob")
+    body = zlib.decompress(blob[HEADER.size:])
+    offset = 0
+
+    def take(dtype, count):
+        nonlocal offset
+        array = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+        offset += array.nbytes
+        return array
+
+    t_ms = np.cumsum(take("<u4", n), dtype=np.int64)
+    x = take("<u2", n) / 65535
+    y = take("<u2", n) / 65535
+    hit = np.unpackbits(take("u1", (n + 7) // 8), count=n).astype(bool)
+    rt_ms = take("<u2", n).astype(np.uint16)
+    return {"t_ms": t_ms, "x": x, "y": y, "hit": hit, "rt_ms": rt_ms}
+
+
+def compute_metrics(arrays: Dict[str, np.ndarray]) -> dict:
+    t_ms, hit, rt = arrays["t_ms"], arrays["hit"], arrays["rt_ms"]
+    n = len(hit)
+    answered = hit & (rt != RT_MISSING)
+    rts = rt[answered].astype(np.float64)
+
+    metrics = {
+        "trials": n,
+        "hits": int(hit.sum()),
+        "hit_rate": round(float(hit.mean()), 4) if n else None,
+        "rt_mean_ms": round(float(rts.mean()), 1) if rts.size else None,
+        "rt_percentiles_ms": (
+            dict(zip((f"p{p}" for p in PERCENTILES), np.round(np.percentile(rts, PERCENTILES), 1).tolist()))
+            if rts.size else None
+        ),
+        "fatigue_slope_ms_per_min": None,
+        "hit_rate_curve": [],
+        "rt_histogram": {"edges_ms": RT_HISTOGRAM_EDGES, "counts": []},
+    }
+
+    # Fatigue: least-squares slope of reaction time over session time (hits only).
+    # Positive = responses slow down as the session goes on.
+    minutes = t_ms[answered] / 60000.0
+    if rts.size >= 3 and np.ptp(minutes) > 0:
+        slope = np.polyfit(minutes, rts, 1)[0]
+        metrics["fatigue_slope_ms_per_min"] = round(float(slope), 2)
+
+    if n:
+        # Hit rate over CURVE_BINS consecutive blocks of (almost) equal size
+        bins = min(CURVE_BINS, n)
+        starts = (np.arange(bins) * n) // bins
+        hits_per_block = np.add.reduceat(hit.astype(np.int64), starts)
+        block_sizes = np.diff(np.append(starts, n))
+        metrics["hit_rate_curve"] = np.round(hits_per_block / block_sizes, 4).tolist()
+
+    counts, _ = np.histogram(np.minimum(rts, RT_HISTOGRAM_EDGES[-1] - 1), bins=RT_HISTOGRAM_EDGES)
+    metrics["rt_histogram"]["counts"] = counts.tolist()
+    return metrics
+
+
+def as_lists(arrays: Dict[str, np.ndarray]) -> dict:
+    """Decoded arrays -> JSON-ready columns (rt_ms None for misses)."""
+    rt = arrays["rt_ms"].astype(np.int64)
+    return {
+        "t_ms": arrays["t_ms"].tolist(),
+        "x": np.round(arrays["x"], 5).tolist(),
+        "y": np.round(arrays["y"], 5).tolist(),
+        "hit": arrays["hit"].tolist(),
+        "rt_ms": [None if v == RT_MISSING else v for v in rt.tolist()],
+    }
@@ -7,6 +7,8 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
 
 if __name__ == "__main__":
+    from backend import migrate
+    migrate.upgrade()
     uvicorn.run(
         "backend.main:app",
         host="0.0.0.0",
@@ -0,0 +1,145 @@
+"""
+Cold-start benchmark: import time and first-request latency of the API.
+
+Each run starts fresh interpreters, so nothing is warm:
+
+- import: `import backend.main` in a new process (median of --runs);
+- first request: spawn uvicorn, then time from spawn to the first 200 from
+  /health, and the first POST /token after that (pulls in bcrypt + jose).
+
+Results are appended as one JSON line to --history (default
+tests/bench_history/cold_start.jsonl, committed alongside the code) and
+compared with the previous entry, so regressions show up over time:
+
+    python tests/bench_cold_start.py --runs 5
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+DEFAULT_HISTORY = os.path.join(ROOT, "tests", "bench_history", "cold_start.jsonl")
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import backend.main; print(time.perf_counter() - t)"
+
+
+def prepare_database(path):
+    """Migrated SQLite DB with one patient to log in as."""
+    script = (
+        "from backend import migrate, database, crud, schemas; migrate.upgrade(); "
+        "db = database.SessionLocal(); "
+        "crud.create_user(db, schemas.UserCreate(email='bench@example.com', password='bench-pass', "
+        "full_name='Bench', role='patient')); db.close()"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=_env(path), check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+def _env(db_path):
+    return {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}", "SCHEDULER_ENABLED": "0"}
+
+
+def measure_import(db_path):
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=_env(db_path),
+                         check=True, capture_output=True, text=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_requests(db_path, timeout=30.0):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=_env(db_path), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f"{base}/health", timeout=1) as resp:
+                    if resp.status == 200:
+                        break
+            except OSError:
+                if time.perf_counter() - start > timeout:
+                    raise RuntimeError("server did not come up")
+                time.sleep(0.01)
+        first_health = time.perf_counter() - start
+
+        form = urllib.parse.urlencode({"username": "bench@example.com", "password": "bench-pass"}).encode()
+        t = time.perf_counter()
+        with urllib.request.urlopen(f"{base}/token", data=form, timeout=timeout) as resp:
+            assert resp.status == 200
+        first_login = time.perf_counter() - t
+        return first_health, first_login
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--history", default=DEFAULT_HISTORY)
+    parser.add_argument("--no-record", action="store_true", help="print results without appending to history")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "cold_start.db")
+        prepare_database(db_path)
+        imports = [measure_import(db_path) for _ in range(args.runs)]
+        firsts = [measure_first_requests(db_path) for _ in range(args.runs)]
+
+    result = {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "import_ms": round(statistics.median(imports) * 1000, 1),
+        "spawn_to_first_health_ms": round(statistics.median(f[0] for f in firsts) * 1000, 1),
+        "first_login_ms": round(statistics.median(f[1] for f in firsts) * 1000, 1),
+    }
+    print(json.dumps(result, indent=2))
+
+    previous = None
+    if os.path.exists(args.history):
+        with open(args.history) as f:
+            lines = [line for line in f if line.strip()]
+        previous = json.loads(lines[-1]) if lines else None
+    if previous:
+        print(f"vs {previous.get('revision')} ({previous['timestamp']}):")
+        for key in ("import_ms", "spawn_to_first_health_ms", "first_login_ms"):
+            if key in previous:
+                print(f"  {key}: {previous[key]} -> {result[key]} ({result[key] - previous[key]:+.1f})")
+
+    if not args.no_record:
+        os.makedirs(os.path.dirname(args.history), exist_ok=True)
+        with open(args.history, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Serialization cost of a session history, per 1k sessions: before and after
+the fast response path (backend/responses.py, backend/compression.py).
+
+- before: load TherapySession entities, map them to dicts, then what FastAPI
+  does with a response_model: validate every item as SessionResponse and
+  dump to JSON;
+- after: crud_async.get_session_history (column select, dicts in the
+  response shape) encoded by FastJSONResponse (orjson), no validation.
+
+Then compression of the resulting body at each supported encoding. Run:
+
+    python tests/bench_serialization.py --sessions 1000 --repeat 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def prepare(url, n):
+    from sqlalchemy.orm import sessionmaker
+    from backend import database, migrate, models
+
+    engine = database.make_engine(url)
+    migrate.upgrade(engine)
+    db = sessionmaker(bind=engine)()
+    user = models.User(email="bench@example.com", full_name="Bench", role="patient")
+    db.add(user)
+    db.flush()
+    profile = models.PatientProfile(user_id=user.id)
+    db.add(profile)
+    db.flush()
+    start = datetime(2026, 1, 1)
+    db.add_all(
+        models.TherapySession(patient_id=profile.id, user_id=user.id, game_type="space", difficulty="medium",
+                              duration_seconds=60 + i % 300, score=i % 997, balloons_popped=i % 40,
+                              fixation_accuracy=(i % 100) / 100, avg_response_time=0.4,
+                              start_time=start + timedelta(minutes=i))
+        for i in range(n)
+    )
+    db.commit()
+    user_id = user.id
+    db.close()
+    engine.dispose()
+    return user_id
+
+
+def legacy_rows(sessions, user_id):
+    # The mapping get_sessions did before the fast path
+    return [{
+        "id": s.id, "user_id": user_id, "game_type": s.game_type, "difficulty": s.difficulty,
+        "duration_seconds": s.duration_seconds, "score": s.score, "balloons_popped": s.balloons_popped,
+        "start_time": s.start_time, "created_at": s.start_time,
+    } for s in sessions]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t)
+    return statistics.median(samples), result
+
+
+async def run(url, user_id, repeat):
+    from pydantic import TypeAdapter
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from backend import crud_async, database, schemas
+    from backend.responses import dumps
+
+    engine = database.make_async_engine(url)
+    Session = async_sessionmaker(bind=engine, expire_on_commit=False)
+    adapter = TypeAdapter(list[schemas.SessionResponse])
+
+    async def atimed(fn):
+        samples = []
+        for _ in range(repeat):
+            async with Session() as db:
+                t = time.perf_counter()
+                result = await fn(db)
+                samples.append(time.perf_counter() - t)
+        return statistics.median(samples), result
+
+    load_before, rows_before = await atimed(
+        lambda db: _legacy_load(crud_async, db, user_id))
+    load_after, rows_after = await atimed(lambda db: crud_async.get_session_history(db, user_id))
+    await engine.dispose()
+
+    encode_before, body_before = timed(lambda: adapter.dump_json(adapter.validate_python(rows_before)), repeat)
+    encode_after, body_after = timed(lambda: dumps(rows_after), repeat)
+    return {
+        "before": {"load": load_before, "encode": encode_before, "bytes": len(body_before)},
+        "after": {"load": load_after, "encode": encode_after, "bytes": len(body_after)},
+    }, body_after
+
+
+async def _legacy_load(crud_async, db, user_id):
+    return legacy_rows(await crud_async.get_user_sessions(db, user_id), user_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="default: a temporary SQLite file")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    user_id = prepare(url, args.sessions)
+    results, body = asyncio.run(run(url, user_id, args.repeat))
+
+    per_k = 1000 / args.sessions
+    print(f"{args.sessions} sessions, median of {args.repeat} runs, ms per 1k sessions")
+    print(f"{'':8} {'load':>8} {'encode':>8} {'total':>8} {'bytes':>9}")
+    for name, r in results.items():
+        print(f"{name:8} {r['load'] * 1000 * per_k:8.2f} {r['encode'] * 1000 * per_k:8.2f} "
+              f"{(r['load'] + r['encode']) * 1000 * per_k:8.2f} {r['bytes']:9d}")
+
+    from backend import compression
+    encodings = ["gzip"] + (["br"] if compression.brotli is not None else [])
+    for encoding in encodings:
+        seconds, compressed = timed(lambda: compression.compress(body, encoding), args.repeat)
+        print(f"{encoding:8} {len(compressed):9d} bytes ({len(compressed) / len(body):.1%}) "
+              f"in {seconds * 1000 * per_k:.2f} ms per 1k sessions")
+
+
+if __name__ == "__main__":
+    main()
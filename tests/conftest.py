@@ -1,29 +1,37 @@
 import pytest
 import sys
 import os
+import tempfile
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from fastapi.testclient import TestClient
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from backend.main import app, get_db
-from backend.database import Base
+# Don't run periodic jobs against the real database while testing
+os.environ.setdefault("SCHEDULER_ENABLED", "0")
+
+from backend.main import app, get_db, get_async_db, get_read_db, get_async_read_db
+from backend import leaderboard, sketches
+from backend.cache import cache
+from backend.database import Base, make_async_engine
 from backend.models import User, UserRole
 
-# Use a separate test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Use a separate test database. A file (not :memory:) so the sync and async
+# engines see the same data; tables are recreated for every test.
+TEST_DB_PATH = os.path.join(tempfile.mkdtemp(prefix="amblyocare_test_"), "test.db")
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{TEST_DB_PATH}"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, 
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-@pytest.fixture(scope="module")
+@pytest.fixture(scope="function")
 def db_engine():
     Base.metadata.create_all(bind=engine)
     yield engine
@@ -31,24 +39,35 @@ def db_engine():
 
 @pytest.fixture(scope="function")
 def db_session(db_engine):
-    connection = db_engine.connect()
-    transaction = connection.begin()
-    session = TestingSessionLocal(bind=connection)
+    session = TestingSessionLocal()
     yield session
     session.close()
-    transaction.rollback()
-    connection.close()
 
 @pytest.fixture(scope="function")
 def client(db_session):
     # Dependency override
     def override_get_db():
         yield db_session
-    
+
+    # NullPool: each TestClient runs its own event loop
+    async_engine = make_async_engine(SQLALCHEMY_DATABASE_URL, profile="default", poolclass=NullPool)
+    async_session = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with async_session() as db:
+            yield db
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_read_db] = override_get_async_db
+    # In-process caches must not outlive the per-test database
+    leaderboard.store.clear()
+    sketches.store.clear()
+    cache.clear()
     with TestClient(app) as c:
         yield c
-    del app.dependency_overrides[get_db]
+    app.dependency_overrides.clear()
 
 @pytest.fixture
 def patient_token(client):
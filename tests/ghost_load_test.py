@@ -0,0 +1,245 @@
+"""
+Ghost Mode load generator.
+
+Simulates N patients streaming telemetry frames over /ws/patient/{id} and M
+doctors watching each patient over /ws/doctor/{id}, then reports end-to-end
+frame latency percentiles, drop rate and server CPU/memory as JSON.
+
+By default it starts a local uvicorn instance on a throwaway SQLite database:
+
+    python tests/ghost_load_test.py --scenario clinic
+    python tests/ghost_load_test.py --patients 100 --watchers 2 --rate 10 --watcher-fps 1
+    python tests/ghost_load_test.py --url ws://localhost:8000 --server-pid 1234
+
+Patients honour the server's pause/resume control messages like the real
+therapy client, so frames are only counted while someone is watching.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import websockets
+
+try:
+    import psutil
+except ImportError:  # CPU/memory sampling is optional
+    psutil = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    # Quick sanity run
+    "smoke": dict(patients=5, watchers=1, rate=10, watcher_fps=None, duration=10),
+    # A doctor's thumbnail wall: many patients, low-rate watchers
+    "clinic": dict(patients=40, watchers=1, rate=10, watcher_fps=1, duration=30),
+    # Group session with several full-rate observers per patient
+    "group": dict(patients=20, watchers=5, rate=10, watcher_fps=None, duration=30),
+    # Many patients streaming with nobody watching (should be near-free)
+    "idle": dict(patients=200, watchers=0, rate=10, watcher_fps=None, duration=30),
+}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Stats:
+    def __init__(self):
+        self.sent = {}          # patient_id -> frames sent while measuring
+        self.received = 0
+        self.latencies_ms = []
+        self.errors = 0
+        self.measuring = False
+
+
+async def run_patient(url, patient_id, rate, stats, stop):
+    interval = 1.0 / rate
+    paused = False
+    min_interval = 0.0
+    last_sent = 0.0
+    seq = 0
+    try:
+        async with websockets.connect(f"{url}/ws/patient/{patient_id}") as ws:
+            async def read_controls():
+                nonlocal paused, min_interval
+                async for message in ws:
+                    control = json.loads(message)
+                    if control.get("type") == "control":
+                        paused = control["action"] == "pause"
+                        min_interval = 1.0 / control["fps"] if control.get("fps") else 0.0
+
+            reader = asyncio.create_task(read_controls())
+            while not stop.is_set():
+                now = time.time()
+                if not paused and now - last_sent >= min_interval:
+                    last_sent = now
+                    seq += 1
+                    await ws.send(json.dumps({"type": "stats_update", "seq": seq, "sent_at": now,
+                                              "gaze": {"x": 0.5, "y": 0.5}, "score": seq}))
+                    if stats.measuring:
+                        stats.sent[patient_id] = stats.sent.get(patient_id, 0) + 1
+                await asyncio.sleep(interval)
+            reader.cancel()
+    except Exception:
+        stats.errors += 1
+
+
+async def run_watcher(url, patient_id, fps, stats, stop):
+    query = f"?fps={fps}" if fps else ""
+    try:
+        async with websockets.connect(f"{url}/ws/doctor/{patient_id}{query}") as ws:
+            while not stop.is_set():
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                if not stats.measuring:
+                    continue
+                frame = json.loads(message)
+                stats.received += 1
+                stats.latencies_ms.append((time.time() - frame["sent_at"]) * 1000.0)
+    except Exception:
+        stats.errors += 1
+
+
+async def sample_server(pid, stop, samples):
+    if psutil is None or pid is None:
+        return
+    proc = psutil.Process(pid)
+    procs = [proc] + proc.children(recursive=True)
+    for p in procs:
+        p.cpu_percent(None)
+    while not stop.is_set():
+        await asyncio.sleep(1.0)
+        try:
+            samples.append({
+                "cpu_percent": sum(p.cpu_percent(None) for p in procs),
+                "rss_mb": sum(p.memory_info().rss for p in procs) / 1e6,
+            })
+        except psutil.NoSuchProcess:
+            return
+
+
+async def run_load(url, patients, watchers, rate, watcher_fps, duration, warmup, server_pid):
+    stats = Stats()
+    stop = asyncio.Event()
+    tasks = []
+    # Watchers first so patients are resumed as soon as they connect
+    for pid in range(1, patients + 1):
+        for _ in range(watchers):
+            tasks.append(asyncio.create_task(run_watcher(url, 100000 + pid, watcher_fps, stats, stop)))
+    for pid in range(1, patients + 1):
+        tasks.append(asyncio.create_task(run_patient(url, 100000 + pid, rate, stats, stop)))
+
+    await asyncio.sleep(warmup)
+    samples = []
+    sampler_stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_server(server_pid, sampler_stop, samples))
+    stats.measuring = True
+    started = time.time()
+    await asyncio.sleep(duration)
+    stats.measuring = False
+    elapsed = time.time() - started
+    sampler_stop.set()
+    await asyncio.sleep(0.5)  # let in-flight frames land before tearing down
+    stop.set()
+    await asyncio.gather(*tasks, sampler, return_exceptions=True)
+
+    # Rate-limited watchers are expected to receive at most watcher_fps per second
+    expected = 0
+    for sent in stats.sent.values():
+        per_watcher = min(sent, int(watcher_fps * elapsed)) if watcher_fps else sent
+        expected += per_watcher * watchers
+    latencies = sorted(stats.latencies_ms)
+    return {
+        "frames_sent": sum(stats.sent.values()),
+        "frames_received": stats.received,
+        "frames_expected": expected,
+        "drop_rate": round(max(0.0, 1 - stats.received / expected), 4) if expected else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+        },
+        "messages_per_second": round(stats.received / elapsed, 1) if elapsed else None,
+        "connection_errors": stats.errors,
+        "server": {
+            "cpu_percent_avg": round(sum(s["cpu_percent"] for s in samples) / len(samples), 1) if samples else None,
+            "cpu_percent_max": max((s["cpu_percent"] for s in samples), default=None),
+            "rss_mb_max": round(max(s["rss_mb"] for s in samples), 1) if samples else None,
+        },
+    }
+
+
+def start_server(port):
+    db_path = os.path.join(tempfile.mkdtemp(prefix="ghost_load_"), "load.db")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    import requests
+    for _ in range(100):
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=0.5).status_code == 200:
+                return server
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="smoke")
+    parser.add_argument("--patients", type=int)
+    parser.add_argument("--watchers", type=int, help="watching doctors per patient")
+    parser.add_argument("--rate", type=float, help="patient send rate (frames/s)")
+    parser.add_argument("--watcher-fps", type=float, help="rate requested by each watcher (default: full rate)")
+    parser.add_argument("--duration", type=float, help="measurement window in seconds")
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--url", help="existing server, e.g. ws://localhost:8000 (default: start uvicorn)")
+    parser.add_argument("--server-pid", type=int, help="pid to sample when using --url")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", default="ghost_load_report.json")
+    args = parser.parse_args()
+
+    config = dict(SCENARIOS[args.scenario])
+    for key in ("patients", "watchers", "rate", "watcher_fps", "duration"):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+
+    server = None
+    url, server_pid = args.url, args.server_pid
+    if url is None:
+        server = start_server(args.port)
+        url, server_pid = f"ws://127.0.0.1:{args.port}", server.pid
+
+    print(f"--- Ghost Mode load test: {config} ---")
+    try:
+        results = asyncio.run(run_load(url, config["patients"], config["watchers"], config["rate"],
+                                       config["watcher_fps"], config["duration"], args.warmup, server_pid))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {"scenario": args.scenario, "config": config, "timestamp": time.time(), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
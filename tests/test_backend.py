@@ -58,3 +58,40 @@ def test_doctor_create_note(client, doctor_token):
     assert get_resp.status_code == 200
     assert len(get_resp.json()) == 1
     assert get_resp.json()[0]["content"] == "Test Note"
+
+def test_session_history_and_stats(client, patient_token):
+    auth = {"Authorization": f"Bearer {patient_token}"}
+    me = client.get("/users/me", headers=auth).json()
+    for score in (10, 20):
+        resp = client.post("/api/sessions", json={
+            "user_id": me["id"], "game_type": "balloon", "difficulty": "easy",
+            "duration_seconds": 120, "score": score, "balloons_popped": 5, "accuracy": 80.0
+        }, headers=auth)
+        assert resp.status_code == 200, resp.text
+
+    history = client.get(f"/api/sessions/{me['id']}", headers=auth).json()
+    assert sorted(s["score"] for s in history) == [10, 20]
+    assert all(s["user_id"] == me["id"] for s in history)
+
+    stats = client.get(f"/api/stats/{me['id']}", headers=auth).json()
+    assert stats["total_sessions"] == 2
+    assert stats["total_duration_minutes"] == 4
+    assert stats["balloons_popped"] == 10
+    assert stats["streak_days"] == 1
+
+def test_authentication_is_one_query(client, doctor_token):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        me = client.get("/users/me", headers={"Authorization": f"Bearer {doctor_token}"})
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+    assert me.status_code == 200
+    assert me.json()["doctor_profile"] is not None
+    # The user and both one-to-one profiles in a single joined SELECT
+    assert len(statements) == 1, statements
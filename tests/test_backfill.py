@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, insert, select, func
+from sqlalchemy.orm import sessionmaker
+
+from backend import backfill, models
+
+
+@pytest.fixture
+def setup(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'backfill.db'}")
+    metadata = MetaData()
+    table = Table("items", metadata, Column("id", Integer, primary_key=True),
+                  Column("value", Integer), Column("doubled", Integer, nullable=True))
+    metadata.create_all(engine)
+    models.BackfillProgress.__table__.create(engine)
+    with engine.begin() as conn:
+        # Sparse keys: chunks are bounded by key order, not by id arithmetic
+        conn.execute(insert(table), [{"id": i * 3, "value": i} for i in range(1, 251)])
+    job = backfill.Backfill("items_doubled", table, {"doubled": table.c.value * 2},
+                            pending=table.c.doubled.is_(None))
+    yield engine, sessionmaker(bind=engine), table, job
+    engine.dispose()
+
+
+def test_backfill_runs_in_chunks_and_resumes(setup):
+    engine, Session, table, job = setup
+
+    partial = backfill.run(job, Session, chunk_size=40, sleep=0, max_chunks=3, report=None)
+    assert partial["status"] == "running"
+    assert partial["rows_updated"] == 120
+    assert partial["last_id"] == 360
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).where(table.c.doubled.is_not(None))).scalar() == 120
+
+    # A new run (new process, same checkpoint) picks up where the last one stopped
+    done = backfill.run(job, Session, chunk_size=40, sleep=0, report=None)
+    assert done["status"] == "done"
+    assert done["percent"] == 100.0
+    assert done["rows_updated"] == 250
+    assert done["chunks"] == 7
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).where(table.c.doubled != table.c.value * 2)).scalar() == 0
+
+
+def test_rows_outside_the_run_are_untouched(setup):
+    engine, Session, table, job = setup
+    backfill.run(job, Session, chunk_size=100, sleep=0, report=None)
+    with engine.begin() as conn:
+        # Inserted after the run: the application is responsible for these
+        conn.execute(insert(table).values(id=10000, value=1))
+    again = backfill.run(job, Session, chunk_size=100, sleep=0, report=None)
+    assert again["rows_updated"] == 250
+    with engine.connect() as conn:
+        assert conn.execute(select(table.c.doubled).where(table.c.id == 10000)).scalar() is None
+
+    db = Session()
+    backfill.reset(db, job.name)
+    assert backfill.status(db, job.name)["status"] == "pending"
+    db.close()
+
+
+def test_session_user_id_is_set_on_insert(db_session):
+    user = models.User(email="kid@example.com", role="patient")
+    db_session.add(user)
+    db_session.flush()
+    profile = models.PatientProfile(user_id=user.id)
+    db_session.add(profile)
+    db_session.flush()
+    # Only patient_id given, as older scripts do
+    session = models.TherapySession(patient_id=profile.id, game_type="space", score=5)
+    db_session.add(session)
+    db_session.commit()
+    assert session.user_id == user.id
@@ -0,0 +1,87 @@
+import time
+
+from backend.cache import Cache, LocalLRU, SharedBackend
+
+
+class StandInClient:
+    """Minimal Redis stand-in: get / set(ex=) / incr, bytes values like redis-py."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at < time.monotonic():
+            return None
+        return value
+
+    def set(self, key, value, ex=None):
+        self.data[key] = (value.encode(), time.monotonic() + ex if ex else None)
+
+    def incr(self, key):
+        value = int(self.get(key) or 0) + 1
+        self.data[key] = (str(value).encode(), None)
+        return value
+
+
+def test_lru_evicts_and_expires():
+    lru = LocalLRU(max_entries=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+    assert lru.get("b") is None and lru.get("a") == 1
+    lru.set("short", 1, ttl=0.01)
+    time.sleep(0.02)
+    assert lru.get("short") is None
+    # Generations survive eviction
+    lru.incr("gen:x")
+    for i in range(5):
+        lru.set(str(i), i)
+    assert lru.get("gen:x") == 1
+
+
+def test_generation_invalidation_and_metrics():
+    for backend in (LocalLRU(), SharedBackend(StandInClient())):
+        cache = Cache(backend)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {"total": len(calls)}
+
+        assert cache.get_or_set("stats:1", "", compute) == {"total": 1}
+        assert cache.get_or_set("stats:1", "", compute) == {"total": 1}
+        cache.invalidate("stats:2")  # other namespaces are untouched
+        assert cache.get_or_set("stats:1", "", compute) == {"total": 1}
+        cache.invalidate("stats:1")
+        assert cache.get_or_set("stats:1", "", compute) == {"total": 2}
+
+        stats = cache.metrics()["namespaces"]["stats"]
+        assert (stats["hits"], stats["misses"], stats["invalidations"]) == (2, 2, 2)
+
+
+def test_shared_backend_is_seen_by_every_process():
+    client = StandInClient()
+    worker_a, worker_b = Cache(SharedBackend(client)), Cache(SharedBackend(client))
+    worker_a.get_or_set("doctors", "", lambda: ["dr a"])
+    assert worker_b.get_or_set("doctors", "", lambda: ["stale"]) == ["dr a"]
+    worker_a.invalidate("doctors")
+    assert worker_b.get_or_set("doctors", "", lambda: ["dr a", "dr b"]) == ["dr a", "dr b"]
+
+
+def test_stats_endpoint_is_invalidated_by_new_sessions(client, patient_token):
+    headers = {"Authorization": f"Bearer {patient_token}"}
+    me = client.get("/users/me", headers=headers).json()
+    assert client.get(f"/api/stats/{me['id']}", headers=headers).json()["total_sessions"] == 0
+    assert client.get(f"/api/stats/{me['id']}", headers=headers).json()["total_sessions"] == 0
+
+    res = client.post("/api/sessions", headers=headers, json={
+        "user_id": me["id"], "game_type": "space", "difficulty": "easy", "duration_seconds": 120, "score": 10,
+    })
+    assert res.status_code == 200
+    assert client.get(f"/api/stats/{me['id']}", headers=headers).json()["total_sessions"] == 1
+
+    doctors = client.get("/api/public/doctors").json()
+    client.post("/users/", json={"full_name": "Dr New", "email": "new_doc@example.com", "password": "pw", "role": "doctor"})
+    assert len(client.get("/api/public/doctors").json()) == len(doctors) + 1
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from backend import cohort, models
+
+WEEK = 7 * 24 * 3600
+
+
+def _arrays():
+    # Patient 1 improves 10 points/week, patient 2 is flat, patient 3 has too few sessions for a trend
+    rows = [(1, w * WEEK, 50 + 10 * w, 0.5 + 0.01 * w) for w in range(8)]
+    rows += [(2, w * WEEK / 2, 60.0, 0.7) for w in range(6)]
+    rows += [(3, 0, 40.0, np.nan), (3, WEEK, 44.0, np.nan)]
+    user_id, t, score, accuracy = map(np.array, zip(*rows))
+    return {"user_id": user_id.astype(np.int64), "t": t.astype(float), "score": score.astype(float),
+            "accuracy": accuracy.astype(float)}
+
+
+def test_vectorized_metrics_match_per_patient_fits():
+    result = cohort.compute(_arrays())
+    by_user = {p["user_id"]: p for p in result["patients"]}
+    assert result["cohort"] == {**result["cohort"], "patients": 3, "sessions": 16}
+
+    assert by_user[1]["score_slope"] == 10.0
+    assert by_user[1]["accuracy_slope"] == float(np.round(np.polyfit(np.arange(8), 0.5 + 0.01 * np.arange(8), 1)[0], 4))
+    assert by_user[2]["score_slope"] == 0.0
+    assert by_user[3]["score_slope"] is None and by_user[3]["accuracy_slope"] is None
+    # last quarter (sessions 6, 7: 110, 120) vs first quarter (50, 60)
+    assert by_user[1]["improvement_rate"] == round((115 - 55) / 55, 4)
+    assert by_user[3]["improvement_rate"] == 0.1
+
+    assert by_user[1]["percentiles"]["score_slope"] > by_user[2]["percentiles"]["score_slope"]
+    assert result["cohort"]["distribution"]["score_slope"]["p50"] == 5.0
+
+
+def test_process_pool_gives_the_same_result():
+    arrays = _arrays()
+    try:
+        pooled = asyncio.run(cohort.compute_async(arrays, min_rows_for_pool=0))
+    finally:
+        cohort.shutdown()
+    assert pooled == cohort.compute(arrays)
+
+
+def test_cohort_endpoint(client, doctor_token, db_session):
+    doc_auth = {"Authorization": f"Bearer {doctor_token}"}
+    ids = [
+        client.post("/users/", headers=doc_auth, json={
+            "email": f"cohort{i}@test.com", "password": "pw", "full_name": f"Cohort {i}", "role": "patient",
+        }).json()["id"]
+        for i in range(3)
+    ]
+    start = datetime(2026, 9, 1)
+    for slope, user_id in zip((2, 5, 8), ids):
+        profile = db_session.query(models.PatientProfile).filter_by(user_id=user_id).one()
+        db_session.add_all(
+            models.TherapySession(patient_id=profile.id, user_id=user_id, game_type="space", score=20 + slope * week,
+                                  accuracy=60 + week, fixation_accuracy=0.5, start_time=start + timedelta(weeks=week))
+            for week in range(5)
+        )
+    db_session.commit()
+
+    res = client.get("/api/analytics/cohort", headers=doc_auth, params={"patient_id": ids[2]})
+    assert res.status_code == 200
+    body = res.json()
+    assert body["cohort"]["patients"] == 3
+    assert body["patient"]["name"] == "Cohort 2"
+    assert body["patient"]["score_slope"] == 8.0
+    assert body["patient"]["percentiles"]["score_slope"] > 80
+    assert body["patient"]["accuracy_slope"] == 1.0  # game accuracy, not fixation accuracy
+
+    assert client.get("/api/analytics/cohort", headers=doc_auth, params={"scope": "world"}).status_code == 400
+    assert client.get("/api/analytics/cohort", headers=doc_auth, params={"patient_id": 999}).status_code == 404
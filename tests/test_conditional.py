@@ -0,0 +1,93 @@
+from backend import crud, crud_async
+
+
+def _post_session(client, auth, user_id, score=10):
+    res = client.post("/api/sessions", headers=auth, json={
+        "user_id": user_id, "game_type": "space", "difficulty": "easy", "duration_seconds": 60, "score": score,
+    })
+    assert res.status_code == 200
+
+
+def test_sessions_and_stats_answer_304_until_a_new_session(client, patient_token, monkeypatch):
+    auth = {"Authorization": f"Bearer {patient_token}"}
+    me = client.get("/users/me", headers=auth).json()
+    _post_session(client, auth, me["id"])
+
+    first = client.get(f"/api/sessions/{me['id']}", headers=auth)
+    stats = client.get(f"/api/stats/{me['id']}", headers=auth)
+    assert first.headers["etag"].startswith('W/"sessions-')
+    assert "last-modified" in first.headers
+    assert stats.headers["etag"] != first.headers["etag"]
+
+    # A matching validator is answered without loading or serializing the sessions
+    def unexpected(*args, **kwargs):
+        raise AssertionError("full query ran for an unchanged resource")
+    monkeypatch.setattr(crud_async, "get_user_sessions", unexpected)
+    monkeypatch.setattr(crud_async, "get_session_history", unexpected)
+    for path, etag in ((f"/api/sessions/{me['id']}", first.headers["etag"]),
+                       (f"/api/stats/{me['id']}", stats.headers["etag"])):
+        res = client.get(path, headers={**auth, "If-None-Match": etag})
+        assert res.status_code == 304
+        assert res.content == b""
+        assert res.headers["etag"] == etag
+    res = client.get(f"/api/sessions/{me['id']}",
+                     headers={**auth, "If-Modified-Since": first.headers["last-modified"]})
+    assert res.status_code == 304
+    monkeypatch.undo()
+
+    _post_session(client, auth, me["id"], score=20)
+    changed = client.get(f"/api/sessions/{me['id']}", headers={**auth, "If-None-Match": first.headers["etag"]})
+    assert changed.status_code == 200
+    assert len(changed.json()) == 2
+    assert changed.headers["etag"] != first.headers["etag"]
+
+
+def test_notes_validator_and_authorization(client, doctor_token, patient_token, monkeypatch):
+    doc_auth = {"Authorization": f"Bearer {doctor_token}"}
+    pat_id = client.post("/users/", headers=doc_auth, json={
+        "email": "p_etag@test.com", "password": "pw", "full_name": "P Etag", "role": "patient",
+    }).json()["id"]
+    client.post("/api/doctor/notes", headers=doc_auth,
+                json={"patient_id": pat_id, "note_type": "suggestion", "content": "Blink more"})
+
+    notes = client.get(f"/api/doctor/notes/{pat_id}", headers=doc_auth)
+    etag = notes.headers["etag"]
+    monkeypatch.setattr(crud, "get_doctor_notes", lambda *a: [])
+    assert client.get(f"/api/doctor/notes/{pat_id}", headers={**doc_auth, "If-None-Match": f'"x", {etag}'}).status_code == 304
+
+    # Validators are checked only after authorization
+    other = {"Authorization": f"Bearer {patient_token}", "If-None-Match": etag}
+    assert client.get(f"/api/doctor/notes/{pat_id}", headers=other).status_code == 403
+
+
+def test_stats_validator_rolls_over_at_midnight_and_matches_the_body(client, patient_token, db_session,
+                                                                     monkeypatch):
+    from datetime import datetime as real_datetime, timedelta
+
+    from backend import main, models
+
+    auth = {"Authorization": f"Bearer {patient_token}"}
+    me = client.get("/users/me", headers=auth).json()
+    _post_session(client, auth, me["id"])
+    today = client.get(f"/api/stats/{me['id']}", headers=auth)
+    assert today.json()["streak_days"] == 1
+
+    # A session written by another worker doesn't invalidate this worker's
+    # cache, but the new ETag keys a new cache entry, so the body is never stale
+    profile = db_session.query(models.PatientProfile).filter_by(user_id=me["id"]).one()
+    db_session.add(models.TherapySession(patient_id=profile.id, user_id=me["id"], game_type="space", score=5))
+    db_session.commit()
+    fresh = client.get(f"/api/stats/{me['id']}", headers={**auth, "If-None-Match": today.headers["etag"]})
+    assert fresh.status_code == 200
+    assert fresh.json()["total_sessions"] == 2
+
+    # Two days later, with no new session, the streak has lapsed: no 304
+    class Later(real_datetime):
+        @classmethod
+        def utcnow(cls):
+            return real_datetime.utcnow() + timedelta(days=2)
+    monkeypatch.setattr(main, "datetime", Later)
+    later = client.get(f"/api/stats/{me['id']}", headers={**auth, "If-None-Match": fresh.headers["etag"],
+                                                          "If-Modified-Since": fresh.headers["last-modified"]})
+    assert later.status_code == 200
+    assert later.headers["etag"] != fresh.headers["etag"]
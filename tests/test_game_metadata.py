@@ -0,0 +1,88 @@
+from sqlalchemy import text
+
+from backend import backfill, crud, game_metadata, models
+
+
+def _login(client, email, password="pw"):
+    token = client.post("/token", data={"username": email, "password": password}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_metadata_is_validated_stored_and_filterable(client, doctor_token):
+    doc_auth = {"Authorization": f"Bearer {doctor_token}"}
+    client.post("/users/", headers=doc_auth, json={
+        "email": "neural_kid@test.com", "password": "pw", "full_name": "Neural Kid", "role": "patient",
+    })
+    kid = _login(client, "neural_kid@test.com")
+    kid_id = client.get("/users/me", headers=kid).json()["id"]
+
+    def post(game_type, metadata):
+        return client.post("/api/sessions", headers=kid, json={
+            "user_id": kid_id, "game_type": game_type, "difficulty": "easy", "duration_seconds": 60, "score": 5,
+            "game_metadata": metadata,
+        })
+
+    created = post("neural", {"stars_connected": 25, "pathways_completed": 3, "extra": "kept"})
+    assert created.status_code == 200
+    assert created.json()["game_metadata"] == {"stars_connected": 25, "pathways_completed": 3, "extra": "kept"}
+    assert post("neural", '{"stars_connected": "12"}').status_code == 200  # older clients send a string
+    assert post("balloon", {"max_combo": 7}).status_code == 200
+    assert post("neural", {"stars_connected": -1}).status_code == 422
+    assert post("neural", "[1, 2]").status_code == 422
+
+    res = client.get("/api/analytics/sessions", headers=doc_auth,
+                     params={"game_type": "neural", "where": "stars_connected>20"})
+    assert res.status_code == 200
+    assert [s["game_metadata"]["stars_connected"] for s in res.json()] == [25]
+    both = client.get("/api/analytics/sessions", headers=doc_auth,
+                      params=[("where", "stars_connected>=10"), ("where", "stars_connected<20")]).json()
+    assert [s["game_metadata"] for s in both] == [{"stars_connected": 12}]
+
+    assert client.get("/api/analytics/sessions", headers=doc_auth, params={"where": "extra>1"}).status_code == 400
+    assert client.get("/api/analytics/sessions", headers=kid).status_code == 403
+    history = client.get(f"/api/sessions/{kid_id}", headers=kid).json()
+    assert {"max_combo": 7} in [s["game_metadata"] for s in history]
+
+
+def test_filters_are_index_scans(db_session):
+    query = db_session.query(models.TherapySession.id).filter(
+        models.TherapySession.game_type == "neural", models.TherapySession.meta_stars_connected > 20)
+    sql = str(query.statement.compile(db_session.get_bind(), compile_kwargs={"literal_binds": True}))
+    plan = " ".join(row[-1] for row in db_session.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+    assert "ix_therapy_sessions_game_stars_connected" in plan
+
+
+def test_legacy_text_is_backfilled(db_session):
+    legacy = [
+        models.TherapySession(user_id=1, game_type="neural", game_metadata='{"stars_connected": 30}'),
+        models.TherapySession(user_id=1, game_type="neural", game_metadata="{}"),
+        models.TherapySession(user_id=1, game_type="neural", game_metadata="not json"),
+    ]
+    db_session.add_all(legacy)
+    db_session.commit()
+    ids = [s.id for s in legacy]
+
+    job = backfill.BACKFILLS["therapy_sessions_game_data"]
+    backfill.run(job, lambda: db_session, sleep=0, report=None)
+    legacy = [db_session.get(models.TherapySession, i) for i in ids]
+    assert [s.game_data for s in legacy] == [{"stars_connected": 30}, None, None]
+    assert legacy[0].meta_stars_connected == 30
+    assert [s.id for s in crud.search_sessions(db_session, "neural", [game_metadata.parse_filter("stars_connected>20")])] \
+        == [legacy[0].id]
+
+
+def test_promoted_columns_ignore_values_that_are_not_whole_numbers(db_session):
+    # The legacy backfill copies game_data unvalidated, so promoted keys can hold anything
+    values = [7, 12.0, 1.5, "abc", "12", None]
+    rows = [models.TherapySession(user_id=1, game_type="neural", game_data={"max_combo": v}) for v in values]
+    db_session.add_all(rows)
+    db_session.commit()
+    assert [db_session.get(models.TherapySession, s.id).meta_max_combo for s in rows] == [7, 12, None, None, None, None]
+    assert [s.id for s in crud.search_sessions(db_session, "neural", [game_metadata.parse_filter("max_combo>10")])] \
+        == [rows[1].id]
+
+    # On PostgreSQL a bare CAST('12.0' AS INTEGER) raises and fails the insert
+    from sqlalchemy.dialects import postgresql
+    sql = str(game_metadata.json_field("game_data", "max_combo").compile(dialect=postgresql.dialect()))
+    assert sql.startswith("CASE WHEN jsonb_typeof(game_data -> 'max_combo') = 'number'")
+    assert "CAST(CAST((game_data ->> 'max_combo') AS NUMERIC) AS INTEGER)" in sql
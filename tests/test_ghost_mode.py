@@ -0,0 +1,163 @@
+import asyncio
+import json
+
+from backend.ghost import ConnectionManager, MultiplexWatcher, parse_fps
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+
+def test_parse_fps():
+    assert parse_fps(None) is None
+    assert parse_fps("0") is None
+    assert parse_fps("abc") is None
+    assert parse_fps("5") == 5.0
+    assert parse_fps(1000) == 60.0
+
+
+def test_rate_limited_subscriber_gets_latest_frame():
+    async def scenario():
+        manager = ConnectionManager()
+        full, thumb = FakeSocket(), FakeSocket()
+        await manager.connect(full, "1")
+        await manager.connect(thumb, "1", fps=10)
+
+        for i in range(5):
+            await manager.broadcast(str(i), "1")
+        await asyncio.sleep(0.15)
+        return full.sent, thumb.sent
+
+    full_sent, thumb_sent = asyncio.run(scenario())
+    assert full_sent == ["0", "1", "2", "3", "4"]
+    # First frame immediately, intermediate frames coalesced into the last one
+    assert thumb_sent == ["0", "4"]
+
+
+def test_closing_a_subscription_cancels_its_flush():
+    class SlowSocket(FakeSocket):
+        async def send_text(self, text):
+            if self.sent:
+                await asyncio.sleep(1)
+            self.sent.append(text)
+
+    async def scenario():
+        manager = ConnectionManager()
+        socket = SlowSocket()
+        subscription = await manager.connect(socket, "1", fps=10)
+        await manager.broadcast("0", "1")
+        await manager.broadcast("1", "1")
+        await asyncio.sleep(0.15)
+        flush = subscription._flush_task
+        assert flush is not None and not flush.done()  # trailing frame, stuck in a slow send
+        manager.disconnect(socket, "1")
+        await asyncio.sleep(0)
+        return flush, socket.sent
+
+    flush, sent = asyncio.run(scenario())
+    assert flush.cancelled() and sent == ["0"]
+
+
+def test_doctor_socket_receives_patient_frames(client):
+    with client.websocket_connect("/ws/doctor/42?fps=30") as doctor:
+        with client.websocket_connect("/ws/patient/42") as patient:
+            patient.send_text(json.dumps({"type": "stats_update", "score": 7}))
+            assert json.loads(doctor.receive_text())["score"] == 7
+
+
+def test_multiplexed_socket_tags_frames_by_patient(client):
+    with client.websocket_connect("/ws/doctor") as doctor:
+        doctor.send_text(json.dumps({"type": "subscribe", "patient_id": 1}))
+        doctor.send_text(json.dumps({"type": "subscribe", "patient_id": 2}))
+        with client.websocket_connect("/ws/patient/1") as p1, client.websocket_connect("/ws/patient/2") as p2:
+            p1.send_text(json.dumps({"score": 1}))
+            first = json.loads(doctor.receive_text())
+            p2.send_text(json.dumps({"score": 2}))
+            second = json.loads(doctor.receive_text())
+    assert first == {"type": "frame", "patient_id": "1", "frame": {"score": 1}}
+    assert second == {"type": "frame", "patient_id": "2", "frame": {"score": 2}}
+
+
+def test_malformed_frames_are_dropped(client):
+    with client.websocket_connect("/ws/doctor") as doctor:
+        doctor.send_text(json.dumps({"type": "subscribe", "patient_id": 5}))
+        with client.websocket_connect("/ws/patient/5") as patient:
+            patient.receive_text()  # resume
+            patient.send_text('{"score": 1')
+            patient.send_text(json.dumps({"score": 2}))
+            received = json.loads(doctor.receive_text())
+    assert received == {"type": "frame", "patient_id": "5", "frame": {"score": 2}}
+
+
+def test_multiplexed_batches_per_tick():
+    async def scenario():
+        manager = ConnectionManager()
+        socket = FakeSocket()
+        watcher = MultiplexWatcher(socket, batch_interval=0.05)
+        watcher.start()
+        manager.subscribe(socket, "1", watcher=watcher)
+        manager.subscribe(socket, "2", watcher=watcher)
+        await manager.broadcast('{"n":1}', "1")
+        await manager.broadcast('{"n":2}', "2")
+        await asyncio.sleep(0.08)
+        manager.disconnect_watcher(watcher)
+        return socket.sent
+
+    sent = asyncio.run(scenario())
+    assert len(sent) == 1
+    batch = json.loads(sent[0])
+    assert batch["type"] == "batch"
+    assert [f["patient_id"] for f in batch["frames"]] == ["1", "2"]
+
+
+def test_presence_index_and_snapshot_on_subscribe(client, doctor_token):
+    doc_auth = {"Authorization": f"Bearer {doctor_token}"}
+    pat = client.post("/users/", json={"email": "live@test.com", "password": "pw", "full_name": "Live Patient", "role": "patient"}, headers=doc_auth).json()
+
+    assert client.get("/api/doctor/live", headers=doc_auth).json() == []
+    with client.websocket_connect(f"/ws/patient/{pat['id']}") as patient:
+        patient.send_text(json.dumps({"score": 3}))
+        # A doctor joining mid-stream gets the last frame without waiting for the next one
+        with client.websocket_connect(f"/ws/doctor/{pat['id']}") as doctor:
+            assert json.loads(doctor.receive_text()) == {"score": 3}
+            live = client.get("/api/doctor/live?include_frames=true", headers=doc_auth).json()
+    assert len(live) == 1
+    assert live[0]["patient_id"] == str(pat["id"])
+    assert live[0]["watchers"] == 1
+    assert live[0]["last_frame"] == {"score": 3}
+    assert client.get("/api/doctor/live", headers=doc_auth).json() == []
+
+
+def test_patient_paused_until_watched(client):
+    with client.websocket_connect("/ws/patient/77") as patient:
+        assert json.loads(patient.receive_text()) == {"type": "control", "action": "pause"}
+        with client.websocket_connect("/ws/doctor/77?fps=5"):
+            assert json.loads(patient.receive_text()) == {"type": "control", "action": "resume", "fps": 5.0}
+            with client.websocket_connect("/ws/doctor/77"):
+                # A full-rate watcher lifts the limit
+                assert json.loads(patient.receive_text()) == {"type": "control", "action": "resume", "fps": None}
+            assert json.loads(patient.receive_text())["fps"] == 5.0
+        assert json.loads(patient.receive_text()) == {"type": "control", "action": "pause"}
+
+
+def test_pause_after_disconnect_is_tracked_until_sent():
+    async def scenario():
+        manager = ConnectionManager()
+        patient, doctor = FakeSocket(), FakeSocket()
+        await manager.open_stream(patient, "9", None)
+        await manager.connect(doctor, "9")
+        manager.disconnect(doctor, "9")
+        pending = set(manager._background)
+        await asyncio.sleep(0)
+        return pending, manager._background, patient.sent
+
+    pending, background, sent = asyncio.run(scenario())
+    assert len(pending) == 1 and not background
+    assert json.loads(sent[-1]) == {"type": "control", "action": "pause"}
@@ -0,0 +1,98 @@
+import json
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend import gamification, jobqueue, models
+from backend.database import Base
+
+
+@pytest.fixture
+def factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'queue.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def recorded():
+    calls = []
+
+    @jobqueue.task("test_record")
+    def record(db, value, fail_times=0):
+        calls.append(value)
+        if len(calls) <= fail_times:
+            raise RuntimeError("boom")
+
+    yield calls
+    jobqueue.TASKS.pop("test_record")
+
+
+def _status(factory):
+    db = factory()
+    try:
+        return {j.id: (j.status, j.attempts) for j in db.query(models.QueuedJob).all()}
+    finally:
+        db.close()
+
+
+def test_enqueue_is_transactional(factory, recorded):
+    db = factory()
+    jobqueue.enqueue(db, "test_record", {"value": 1})
+    db.rollback()
+    jobqueue.enqueue(db, "test_record", {"value": 2})
+    db.commit()
+    db.close()
+
+    worker = jobqueue.Worker(concurrency=2, session_factory=factory)
+    assert worker.run_once() == {"done": 1, "retry": 0, "dead": 0}
+    worker.close()
+    assert recorded == [2]
+
+
+def test_retry_then_dead_letter(factory, recorded, monkeypatch):
+    monkeypatch.setattr(jobqueue, "BACKOFF_BASE_SECONDS", 0)
+    db = factory()
+    job = jobqueue.enqueue(db, "test_record", {"value": "x", "fail_times": 99}, max_attempts=2)
+    jobqueue.enqueue(db, "no_such_task")
+    db.commit()
+    job_id = job.id
+    db.close()
+
+    worker = jobqueue.Worker(concurrency=2, session_factory=factory)
+    assert worker.run_once() == {"done": 0, "retry": 1, "dead": 2}
+    worker.close()
+    assert _status(factory)[job_id] == ("dead", 2)
+
+    db = factory()
+    assert jobqueue.requeue_dead(db, "test_record") == 1
+    assert jobqueue.queue_stats(db) == {"dead": 1, "queued": 1}
+    db.close()
+
+
+def test_visibility_timeout_redelivers(factory, recorded):
+    db = factory()
+    jobqueue.enqueue(db, "test_record", {"value": 1})
+    db.commit()
+    # A worker claims the job and dies
+    assert len(jobqueue.claim_jobs(db, 10, visibility_timeout=0)) == 1
+    time.sleep(0.01)
+    [redelivered] = jobqueue.claim_jobs(db, 10)
+    assert redelivered.attempts == 2
+    # Still hidden from other workers while the new claim is live
+    assert jobqueue.claim_jobs(db, 10) == []
+    db.close()
+
+
+def test_session_post_defers_achievements(client, patient_token, db_session):
+    auth = {"Authorization": f"Bearer {patient_token}"}
+    me = client.get("/users/me", headers=auth).json()
+    resp = client.post("/api/sessions", json={"user_id": me["id"], "game_type": "balloon", "difficulty": "easy",
+                                              "duration_seconds": 60, "score": 10}, headers=auth)
+    assert resp.status_code == 200
+    job = db_session.query(models.QueuedJob).filter_by(task="evaluate_achievements").one()
+    assert job.status == "queued"
+
+    assert gamification.evaluate_achievements(db_session, **json.loads(job.payload)) == ["First Steps"]
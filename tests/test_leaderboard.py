@@ -0,0 +1,99 @@
+from backend import leaderboard, models
+
+
+def test_board_ranks_and_neighbours():
+    board = leaderboard.Board("all", {1: 50, 2: 80, 3: 50, 4: 10})
+    assert board.top(2) == [(1, 2, 80), (2, 1, 50)]
+    # Ties share a rank
+    assert board.rank(3) == 2
+    assert board.rank(4) == 4
+    assert board.rank(99) is None
+
+    board.add(4, 100)
+    assert board.top(1) == [(1, 4, 110)]
+    assert board.rank(2) == 2
+    assert [uid for _, uid, _ in board.around(1, 1)] == [2, 1, 3]
+    assert len(board) == 4
+
+
+def _post_session(client, token, user_id, score, game_type="space", difficulty="easy"):
+    res = client.post(
+        "/api/sessions",
+        json={"user_id": user_id, "game_type": game_type, "difficulty": difficulty,
+              "duration_seconds": 60, "score": score},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert res.status_code == 200, res.text
+
+
+def _login(client, email):
+    client.post("/users/", json={"full_name": email.split("@")[0], "email": email, "password": "pw", "role": "patient"})
+    token = client.post("/token", data={"username": email, "password": "pw"}).json()["access_token"]
+    me = client.get("/users/me", headers={"Authorization": f"Bearer {token}"}).json()
+    return token, me["id"]
+
+
+def test_leaderboard_endpoints(client):
+    ana, ana_id = _login(client, "ana@example.com")
+    ben, ben_id = _login(client, "ben@example.com")
+
+    # Load the board first so the in-process copy is updated incrementally
+    assert client.get("/api/leaderboard").json() == []
+    _post_session(client, ana, ana_id, 30)
+    _post_session(client, ana, ana_id, 30, game_type="balloon")
+    _post_session(client, ben, ben_id, 50)
+
+    top = client.get("/api/leaderboard").json()
+    assert [(e["player"], e["score"], e["rank"]) for e in top] == [("ana", 60, 1), ("ben", 50, 2)]
+
+    space = client.get("/api/leaderboard", params={"game_type": "space", "difficulty": "easy"}).json()
+    assert [(e["player"], e["score"]) for e in space] == [("ben", 50), ("ana", 30)]
+    weekly = client.get("/api/leaderboard", params={"period": "weekly"}).json()
+    assert [e["score"] for e in weekly] == [60, 50]
+
+    rank = client.get(f"/api/leaderboard/rank/{ben_id}").json()
+    assert rank["rank"] == 2 and rank["total_players"] == 2
+    assert [n["player"] for n in rank["neighbours"]] == ["ana", "ben"]
+
+    assert client.get("/api/leaderboard", params={"period": "monthly"}).status_code == 400
+    assert client.get("/api/leaderboard/rank/999").status_code == 404
+
+
+def test_rebuild_matches_incremental(client, db_session):
+    token, user_id = _login(client, "cy@example.com")
+    _post_session(client, token, user_id, 40)
+    _post_session(client, token, user_id, 15, difficulty="hard")
+    incremental = sorted(
+        (r.board, r.total_score, r.sessions) for r in db_session.query(models.LeaderboardScore).all()
+    )
+    assert leaderboard.rebuild(db_session) == len(incremental)
+    rebuilt = sorted(
+        (r.board, r.total_score, r.sessions) for r in db_session.query(models.LeaderboardScore).all()
+    )
+    assert rebuilt == incremental
+    assert ("game:space:hard", 15, 1) in rebuilt
+
+
+def test_reload_between_commit_and_apply_counts_once(db_session):
+    store = leaderboard.LeaderboardStore(session_factory=lambda: db_session, refresh_seconds=3600)
+    first = models.TherapySession(user_id=1, game_type="space", difficulty="easy", score=30)
+    db_session.add(first)
+    db_session.flush()
+    leaderboard.record_session(db_session, first)
+    db_session.commit()
+    assert store.board("all").totals == {1: 30}
+
+    session = models.TherapySession(user_id=1, game_type="space", difficulty="easy", score=20)
+    db_session.add(session)
+    db_session.flush()
+    totals = leaderboard.record_session(db_session, session)
+    db_session.commit()
+    assert totals["all"] == (50, 2)
+    # Another thread reloads the board after the commit, before this apply
+    store._boards["all"] = store._load("all")
+    store.apply(1, totals)
+    assert store.board("all").top(1) == [(1, 1, 50)]
+
+    # An older write applied late doesn't move the total back
+    store.apply(1, {"all": (30, 1)})
+    assert store.board("all").totals == {1: 50}
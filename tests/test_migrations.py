@@ -0,0 +1,73 @@
+import os
+import re
+import subprocess
+import sys
+
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, inspect, text
+
+from backend import migrate, models
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_migrations_build_the_model_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    migrate.upgrade(engine)
+    with engine.connect() as conn:
+        diff = compare_metadata(MigrationContext.configure(conn), models.Base.metadata)
+        assert diff == []
+        assert conn.execute(text("SELECT version_num FROM alembic_version")).scalar() is not None
+    # Re-running on an up-to-date database is a no-op
+    migrate.upgrade(engine)
+    engine.dispose()
+
+
+def test_legacy_database_is_adopted(tmp_path):
+    # Shaped like a database from the old import-time create_all(): baseline
+    # tables without migration history, missing a newer table and column
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    migrate.upgrade(engine, "0001")
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE alembic_version"))
+        conn.execute(text("DROP TABLE job_queue"))
+        conn.execute(text("ALTER TABLE users DROP COLUMN is_active"))
+        conn.execute(text("ALTER TABLE therapy_sessions DROP COLUMN dichoptic_contrast_level"))
+        conn.execute(text("INSERT INTO users (id, email, role) VALUES (1, 'a@b.c', 'PATIENT')"))
+        conn.execute(text("INSERT INTO patient_profiles (id, user_id) VALUES (7, 1)"))
+        conn.execute(text("INSERT INTO therapy_sessions (patient_id, score) VALUES (7, 10), (7, 20)"))
+
+    migrate.upgrade(engine)
+    migrate.run_backfills(engine)
+
+    assert "job_queue" in inspect(engine).get_table_names()
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT is_active FROM users")).scalar() == 1
+        assert conn.execute(text("SELECT DISTINCT dichoptic_contrast_level FROM therapy_sessions")).scalar() == 1.0
+        assert conn.execute(text("SELECT count(*) FROM therapy_sessions WHERE user_id = 1")).scalar() == 2
+    engine.dispose()
+
+
+def test_migrations_do_not_depend_on_live_code():
+    # A migration must behave the same after the application code changes
+    versions = os.path.join(ROOT, "backend", "migrations", "versions")
+    for name in os.listdir(versions):
+        if name.endswith(".py"):
+            with open(os.path.join(versions, name)) as f:
+                source = f.read()
+            assert not re.search(r"^\s*(from|import)\s+backend\b", source, re.M), name
+
+
+def test_app_import_is_side_effect_free(tmp_path):
+    # No DDL at import, and the auth libraries load on first use
+    db_path = tmp_path / "untouched.db"
+    code = (
+        "import sys, backend.main; "
+        "print(','.join(m for m in ('jose', 'bcrypt', 'dotenv') if m in sys.modules))"
+    )
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}", "SCHEDULER_ENABLED": "0"}
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True,
+                         capture_output=True, text=True).stdout
+    assert out.strip() == ""
+    assert not db_path.exists()
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from backend import models, notifications
+
+
+class FlakySender:
+    def __init__(self, failures_per_recipient=0):
+        self.failures = failures_per_recipient
+        self.calls = {}
+        self.delivered = []
+
+    def send(self, note):
+        self.calls[note.recipient] = self.calls.get(note.recipient, 0) + 1
+        if self.calls[note.recipient] <= self.failures:
+            raise ConnectionError("smtp down")
+        self.delivered.append(note.recipient)
+
+
+def _statuses(db):
+    return {n.recipient: n for n in db.query(models.NotificationOutbox).populate_existing().all()}
+
+
+def test_batched_delivery(db_session):
+    for i in range(5):
+        notifications.enqueue_notification(db_session, f"p{i}@test.com", "Hi", "Come back")
+    db_session.commit()
+
+    sender = FlakySender()
+    counts = notifications.deliver_pending(db_session, sender=sender, batch_size=2, concurrency=2)
+    assert counts == {"sent": 5, "retried": 0, "failed": 0}
+    assert sorted(sender.delivered) == [f"p{i}@test.com" for i in range(5)]
+    assert all(n.status == "sent" for n in _statuses(db_session).values())
+    # Nothing left to claim
+    assert notifications.claim_batch(db_session) == []
+
+
+def test_retry_with_backoff_then_give_up(db_session, monkeypatch):
+    monkeypatch.setattr(notifications, "MAX_ATTEMPTS", 2)
+    notifications.enqueue_notification(db_session, "flaky@test.com", "Hi", "Body")
+    db_session.commit()
+
+    sender = FlakySender(failures_per_recipient=10)
+    assert notifications.deliver_pending(db_session, sender=sender)["retried"] == 1
+    note = _statuses(db_session)["flaky@test.com"]
+    assert note.status == "pending"
+    assert note.next_attempt_at > datetime.utcnow() + timedelta(seconds=20)
+
+    # Not due yet
+    assert notifications.deliver_pending(db_session, sender=sender)["retried"] == 0
+
+    note.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db_session.commit()
+    assert notifications.deliver_pending(db_session, sender=sender)["failed"] == 1
+    assert _statuses(db_session)["flaky@test.com"].status == "failed"
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from backend import database, models
+from backend.replicas import ReplicaSet, RoutingSession, AsyncRoutingSession
+
+
+@pytest.fixture
+def two_databases(tmp_path):
+    """A primary and a 'replica' file holding different data, so routing is observable."""
+    urls = {}
+    for name in ("primary", "replica"):
+        urls[name] = f"sqlite:///{tmp_path / (name + '.db')}"
+        engine = create_engine(urls[name])
+        models.Base.metadata.create_all(bind=engine)
+        with sessionmaker(bind=engine)() as db:
+            db.add(models.User(email=f"{name}@test.com", full_name=name))
+            db.commit()
+        engine.dispose()
+    return urls
+
+
+def _names(db):
+    return [u.full_name for u in db.query(models.User).all()]
+
+
+def test_reads_go_to_replica_writes_to_primary(two_databases):
+    replicas = ReplicaSet([two_databases["replica"]], sticky_seconds=60)
+    primary = database.make_engine(two_databases["primary"])
+    Read = sessionmaker(class_=RoutingSession, bind=primary)
+
+    db = Read(info={"read_only": True, "principal": "alice", "replica_set": replicas})
+    assert _names(db) == ["replica"]
+    db.add(models.User(email="new@test.com", full_name="new"))
+    db.commit()
+    db.close()
+    with sessionmaker(bind=primary)() as check:
+        assert "new" in _names(check)
+
+    # Read-your-writes: alice is pinned to the primary, bob is not
+    replicas.mark_write("alice")
+    with Read(info={"read_only": True, "principal": "alice", "replica_set": replicas}) as db:
+        assert "primary" in _names(db)
+    with Read(info={"read_only": True, "principal": "bob", "replica_set": replicas}) as db:
+        assert _names(db) == ["replica"]
+
+    # Unhealthy replica: fall back to the primary
+    replicas.replicas[0].healthy = False
+    with Read(info={"read_only": True, "principal": "bob", "replica_set": replicas}) as db:
+        assert "primary" in _names(db)
+    replicas.check_all()
+    assert replicas.replicas[0].healthy
+
+
+def test_round_robin(two_databases):
+    replicas = ReplicaSet([two_databases["replica"], two_databases["primary"]])
+    picks = [replicas.pick().url for _ in range(4)]
+    assert picks[0] != picks[1] and picks[0] == picks[2]
+
+
+def test_async_routing(two_databases):
+    replicas = ReplicaSet([two_databases["replica"]])
+
+    async def read():
+        engine = database.make_async_engine(two_databases["primary"])
+        Read = async_sessionmaker(bind=engine, sync_session_class=AsyncRoutingSession)
+        async with Read(info={"read_only": True, "replica_set": replicas}) as db:
+            names = (await db.execute(select(models.User.full_name))).scalars().all()
+        await engine.dispose()
+        await replicas.replicas[0].async_engine.dispose()
+        return names
+
+    assert asyncio.run(read()) == ["replica"]
+
+
+def test_writes_and_locks_go_to_primary(two_databases):
+    from sqlalchemy import update
+
+    replicas = ReplicaSet([two_databases["replica"]])
+    primary = database.make_engine(two_databases["primary"])
+    Read = sessionmaker(class_=RoutingSession, bind=primary)
+
+    with Read(info={"read_only": True, "replica_set": replicas}) as db:
+        db.execute(update(models.User).values(full_name="renamed"))
+        db.commit()
+        # The rest of the session reads its own write from the primary
+        assert _names(db) == ["renamed"]
+    with Read(info={"read_only": True, "replica_set": replicas}) as db:
+        locked = db.execute(select(models.User.full_name).with_for_update()).scalars().all()
+        assert locked == ["renamed"]
+
+
+def test_read_your_writes_is_shared_between_workers(two_databases):
+    from backend.cache import SharedBackend
+    from tests.test_cache import StandInClient
+
+    store = SharedBackend(StandInClient())
+    worker_a = ReplicaSet([two_databases["replica"]], sticky_seconds=60, sticky_store=store)
+    worker_b = ReplicaSet([two_databases["replica"]], sticky_seconds=60, sticky_store=store)
+    worker_a.mark_write("alice")
+    assert worker_b.is_sticky("alice") and not worker_b.is_sticky("bob")
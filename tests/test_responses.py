@@ -0,0 +1,44 @@
+from pydantic import TypeAdapter
+
+from backend import compression, schemas
+
+
+def test_session_history_fast_path_matches_schema_and_is_compressed(client, patient_token):
+    auth = {"Authorization": f"Bearer {patient_token}"}
+    me = client.get("/users/me", headers=auth).json()
+    for score in range(40):
+        client.post("/api/sessions", headers=auth, json={
+            "user_id": me["id"], "game_type": "space", "difficulty": "hard", "duration_seconds": 90,
+            "score": score, "fixation_accuracy": 0.75,
+        })
+
+    res = client.get(f"/api/sessions/{me['id']}", headers={**auth, "Accept-Encoding": "gzip"})
+    assert res.status_code == 200
+    assert res.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in res.headers["vary"].lower()
+    assert int(res.headers["content-length"]) < len(res.content)
+    assert res.headers["etag"].startswith('W/"sessions-')
+
+    # Byte-for-byte what response_model validation would have produced
+    adapter = TypeAdapter(list[schemas.SessionResponse])
+    assert res.content == adapter.dump_json(adapter.validate_json(res.content))
+    assert len(res.json()) == 40 and res.json()[0]["fixation_accuracy"] == 0.75
+
+    plain = client.get(f"/api/sessions/{me['id']}", headers={**auth, "Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.content == res.content
+
+    small = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+
+
+def test_negotiation(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert compression.negotiate("gzip, deflate, br") == "gzip"
+    assert compression.negotiate("br;q=1.0, gzip;q=0") is None
+    assert compression.negotiate("*") == "gzip"
+    assert compression.negotiate("") is None
+
+    monkeypatch.setattr(compression, "brotli", object())
+    assert compression.negotiate("gzip, deflate, br") == "br"
+    assert compression.negotiate("gzip, br;q=0") == "gzip"
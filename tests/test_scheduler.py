@@ -0,0 +1,54 @@
+import asyncio
+from datetime import timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base
+from backend.scheduler import Scheduler
+
+
+def _session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'scheduler.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def _register(scheduler, calls):
+    @scheduler.job("count", every=timedelta(hours=1))
+    def count():
+        calls.append(scheduler.owner)
+
+
+def test_job_runs_on_exactly_one_worker(tmp_path):
+    factory = _session_factory(tmp_path)
+    calls = []
+    workers = [Scheduler(session_factory=factory) for _ in range(3)]
+    for worker in workers:
+        _register(worker, calls)
+
+    async def tick_all():
+        for _ in range(2):
+            for worker in workers:
+                await asyncio.gather(*await worker.run_due())
+        for worker in workers:
+            await worker.stop()
+
+    asyncio.run(tick_all())
+    assert len(calls) == 1
+    winner = next(w for w in workers if w.owner == calls[0])
+    metrics = winner.metrics()["jobs"]["count"]
+    assert metrics["runs"] == 1
+    assert metrics["last_duration_seconds"] is not None
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    factory = _session_factory(tmp_path)
+    calls = []
+    crashed, healthy = Scheduler(session_factory=factory, lease_seconds=-1), Scheduler(session_factory=factory)
+    _register(crashed, calls)
+    _register(healthy, calls)
+
+    # A worker claims the job and dies without releasing it
+    assert crashed.try_acquire(crashed.jobs["count"])
+    assert healthy.try_acquire(healthy.jobs["count"])
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend import singleflight
+from backend.cache import Cache, LocalLRU, NullBackend
+
+
+def test_threads_share_one_call():
+    group = singleflight.Group()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "stats"
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: group.do("stats:1", slow), range(8)))
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert {value for value, _ in results} == {"stats"}
+    assert group.in_flight() == 0
+
+
+def test_errors_are_shared_and_not_remembered():
+    group = singleflight.Group()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("db down")
+
+    errors = []
+
+    def follower():
+        started.wait()
+        try:
+            group.do("k", lambda: "unused")
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=follower)
+    thread.start()
+    with pytest.raises(RuntimeError):
+        group.do("k", failing)
+    thread.join()
+    assert len(errors) == 1
+    assert group.do("k", lambda: "ok") == ("ok", False)
+
+
+def test_async_tasks_share_one_call():
+    group = singleflight.AsyncGroup()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def main():
+        return await asyncio.gather(*(group.do("board", slow) for _ in range(10)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [value for value, _ in results] == [42] * 10
+    assert group.in_flight() == 0
+
+
+def test_cancelled_leader_hands_over_to_a_waiter():
+    group = singleflight.AsyncGroup()
+
+    async def slow(value):
+        await asyncio.sleep(0.05)
+        return value
+
+    async def main():
+        leader = asyncio.create_task(group.do("k", lambda: slow("leader")))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(group.do("k", lambda: slow("waiter")))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await waiter
+
+    assert asyncio.run(main()) == ("waiter", False)
+
+
+@pytest.mark.parametrize("backend", [LocalLRU(), NullBackend()])
+def test_cache_stampede_collapses_to_one_query(backend):
+    cache = Cache(backend)
+    queries = []
+
+    def aggregate():
+        queries.append(1)
+        time.sleep(0.2)
+        return {"total_sessions": 3}
+
+    with ThreadPoolExecutor(6) as pool:
+        results = list(pool.map(lambda _: cache.get_or_set("stats:7", "", aggregate), range(6)))
+    assert results == [{"total_sessions": 3}] * 6
+    assert len(queries) == 1
+    assert cache.metrics()["namespaces"]["stats"]["coalesced"] == 5
@@ -0,0 +1,79 @@
+import random
+import time
+
+from backend import models, sketches
+
+
+def test_kll_ranks_within_bounds_and_merges():
+    rng = random.Random(3)
+    values = [rng.gauss(100, 15) for _ in range(100_000)]
+    left, right = sketches.KLL(), sketches.KLL()
+    for v in values[:50_000]:
+        left.update(v)
+    for v in values[50_000:]:
+        right.update(v)
+    left.merge(right)
+
+    assert left.n == 100_000
+    assert sum(len(level) for level in left.levels) < 1000
+    assert left._distribution()[2] == 100_000  # weights add up exactly
+    ordered = sorted(values)
+    for q in (0.05, 0.25, 0.5, 0.75, 0.95):
+        below, _ = left.counts(ordered[int(q * len(ordered))])
+        assert abs(below / left.n - q) < 0.02
+
+    restored = sketches.KLL.from_dict(left.to_dict())
+    assert restored.counts(100.0) == left.counts(100.0)
+
+
+def _add(db, n, start=0, game_type="space", difficulty="easy"):
+    sessions = [models.TherapySession(user_id=1, game_type=game_type, difficulty=difficulty,
+                                      score=start + i, accuracy=50.0, avg_response_time=0)
+                for i in range(n)]
+    db.add_all(sessions)
+    db.commit()
+    return sessions
+
+
+def test_persisted_and_pending_values_are_counted_once(db_session):
+    store = sketches.SketchStore(session_factory=lambda: db_session, refresh_seconds=0)
+    _add(db_session, 100)
+    sketches.persist_sketches(db_session)
+    assert store.percentile("space", "easy", "score", 90)["session_percentile"] == 90.5
+    assert store.percentile("space", "easy", "avg_response_time", 1.0) is None  # 0 = not measured
+    assert store.percentile("space", "hard", "score", 90) is None
+
+    # A new session is visible in its own process right away...
+    new, = _add(db_session, 1, start=1000)
+    store.record(new)
+    assert store.percentile("space", "easy", "score", 1000)["sessions"] == 101
+    # ...and still counted once after the scheduled job has persisted it (two runs: ids lag one run)
+    sketches.persist_sketches(db_session)
+    sketches.persist_sketches(db_session)
+    assert db_session.get(models.SketchCheckpoint, sketches.CHECKPOINT).last_id == new.id
+    assert store.percentile("space", "easy", "score", 1000)["sessions"] == 101
+
+    store.refresh_seconds = 60
+    started = time.perf_counter()
+    for _ in range(1000):
+        store.percentile("space", "easy", "score", 50)
+    assert (time.perf_counter() - started) / 1000 < 0.001
+
+
+def test_session_percentiles_endpoint(client, patient_token):
+    auth = {"Authorization": f"Bearer {patient_token}"}
+    me = client.get("/users/me", headers=auth).json()
+    ids = [
+        client.post("/api/sessions", headers=auth, json={
+            "user_id": me["id"], "game_type": "neural", "difficulty": "hard", "duration_seconds": 60,
+            "score": score, "avg_response_time": 0.5 + score / 100,
+        }).json()["id"]
+        for score in (10, 20, 30, 40)
+    ]
+    res = client.get(f"/api/sessions/{ids[-1]}/percentiles", headers=auth)
+    assert res.status_code == 200
+    metrics = res.json()["metrics"]
+    assert metrics["score"] == {"session_percentile": 87.5, "sessions": 4}
+    # Slowest response time: lower is better
+    assert metrics["avg_response_time"]["session_percentile"] == 12.5
+    assert "fixation_accuracy" not in metrics  # never sent, so not ranked at a default of 0
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend import models, tasks
+
+
+def _patient(db, email, created_days_ago, played_days_ago=None, with_profile=True):
+    user = models.User(email=email, full_name=email, role=models.UserRole.PATIENT,
+                       created_at=datetime.utcnow() - timedelta(days=created_days_ago))
+    db.add(user)
+    db.flush()
+    if with_profile:
+        profile = models.PatientProfile(user_id=user.id, diagnosis="x", affected_eye="LE")
+        db.add(profile)
+        db.flush()
+        if played_days_ago is not None:
+            db.add(models.TherapySession(patient_id=profile.id, game_type="balloon", difficulty="easy",
+                                         start_time=datetime.utcnow() - timedelta(days=played_days_ago)))
+    db.flush()
+    return user
+
+
+def test_find_inactive_patients(db_session):
+    _patient(db_session, "new@test.com", created_days_ago=1)
+    _patient(db_session, "active@test.com", created_days_ago=30, played_days_ago=1)
+    _patient(db_session, "lapsed@test.com", created_days_ago=30, played_days_ago=5)
+    _patient(db_session, "never@test.com", created_days_ago=10)
+    # Used to crash the old per-patient loop
+    _patient(db_session, "noprofile@test.com", created_days_ago=10, with_profile=False)
+
+    batches = list(tasks.find_inactive_patients(db_session, batch_size=2))
+    emails = sorted(row.email for batch in batches for row in batch)
+    assert emails == ["lapsed@test.com", "never@test.com", "noprofile@test.com"]
+    assert all(len(batch) <= 2 for batch in batches)
+
+
+def test_check_inactivity_and_notify(db_session):
+    _patient(db_session, "lapsed2@test.com", created_days_ago=30, played_days_ago=5)
+    assert tasks.check_inactivity_and_notify(db_session) == 1
+    queued = db_session.query(models.NotificationOutbox).filter_by(recipient="lapsed2@test.com").one()
+    assert queued.status == "pending"
+
+
+def test_one_reminder_per_lapse(db_session):
+    user = _patient(db_session, "lapsed3@test.com", created_days_ago=30, played_days_ago=5)
+    assert tasks.check_inactivity_and_notify(db_session) == 1
+    # The next daily run doesn't remind them again...
+    assert tasks.check_inactivity_and_notify(db_session) == 0
+
+    # ...until they have played again and lapsed again
+    profile = db_session.query(models.PatientProfile).filter_by(user_id=user.id).one()
+    reminder = db_session.query(models.NotificationOutbox).filter_by(user_id=user.id).one()
+    reminder.created_at = datetime.utcnow() - timedelta(days=10)
+    db_session.add(models.TherapySession(patient_id=profile.id, game_type="balloon", difficulty="easy",
+                                         start_time=datetime.utcnow() - timedelta(days=4)))
+    db_session.commit()
+    assert tasks.check_inactivity_and_notify(db_session) == 1
+
+
+def test_failures_reach_the_scheduler(db_session, monkeypatch):
+    _patient(db_session, "lapsed4@test.com", created_days_ago=30, played_days_ago=5)
+
+    def broken(db, notifications):
+        raise RuntimeError("outbox unavailable")
+    monkeypatch.setattr(tasks, "enqueue_many", broken)
+    with pytest.raises(RuntimeError):
+        tasks.check_inactivity_and_notify(db_session)
@@ -0,0 +1,69 @@
+import numpy as np
+
+from backend import models, trends
+
+
+def test_running_sums_match_a_full_fit_and_rebuild(db_session):
+    rng = np.random.default_rng(5)
+    accuracy = 60 + 0.8 * np.arange(40) + rng.normal(0, 3, 40)
+    for i, value in enumerate(accuracy):
+        session = models.TherapySession(user_id=7, game_type="space", accuracy=float(value),
+                                        avg_response_time=0.0 if i % 2 else 2.0 - 0.01 * i)
+        db_session.add(session)
+        db_session.flush()
+        trends.record_session(db_session, session)
+    db_session.commit()
+
+    result = trends.patient_trends(db_session, 7)
+    slope, intercept = np.polyfit(np.arange(1, 41), accuracy, 1)
+    fit = result["accuracy"]
+    assert fit["sessions"] == 40
+    assert abs(fit["slope"] - slope) < 1e-5
+    assert fit["slope_ci95"][0] < slope < fit["slope_ci95"][1]
+    assert fit["confidence"] > 0.99
+    assert abs(fit["current"] - (intercept + slope * 40)) < 1e-3
+    assert fit["sessions_to_goal"] == int(np.ceil((90 - fit["current"]) / fit["slope"]))
+    # Only the 20 sessions that measured a response time count, and faster is better
+    assert result["avg_response_time"]["sessions"] == 20
+    assert result["avg_response_time"]["slope"] < 0 and result["avg_response_time"]["confidence"] == 1.0
+
+    stored = {(r.metric, r.n, round(r.sum_xy, 6)) for r in db_session.query(models.PatientTrend)}
+    trends.rebuild(db_session)
+    assert {(r.metric, r.n, round(r.sum_xy, 6)) for r in db_session.query(models.PatientTrend)} == stored
+
+
+def test_estimate_projections():
+    def sums(ys):
+        xs = range(1, len(ys) + 1)
+        return (len(ys), sum(xs), sum(ys), sum(x * x for x in xs), sum(x * y for x, y in zip(xs, ys)),
+                sum(y * y for y in ys))
+
+    assert trends.estimate(*sums([50, 60]), True, 90)["slope"] is None  # too few sessions
+    rising = trends.estimate(*sums([50, 60, 70]), True, 90)
+    assert rising["slope"] == 10 and rising["sessions_to_goal"] == 2
+    assert trends.estimate(*sums([50, 60, 70]), True, 65)["sessions_to_goal"] == 0
+    falling = trends.estimate(*sums([70, 60, 50]), True, 90)
+    assert falling["confidence"] == 0.0 and falling["sessions_to_goal"] is None
+    assert trends.estimate(*sums([50, 50, 50]), True, 90)["confidence"] == 0.5
+
+
+def test_trends_endpoint(client, patient_token):
+    auth = {"Authorization": f"Bearer {patient_token}"}
+    me = client.get("/users/me", headers=auth).json()
+    for i in range(5):
+        assert client.post("/api/sessions", headers=auth, json={
+            "user_id": me["id"], "game_type": "balloon", "difficulty": "easy", "duration_seconds": 60, "score": 100,
+            "accuracy": 50 + 5 * i, "dichoptic_contrast_level": 0.5 + 0.05 * i,
+        }).status_code == 200
+
+    res = client.get(f"/api/patients/{me['id']}/trends?goal_accuracy=80", headers=auth)
+    assert res.status_code == 200
+    metrics = res.json()["metrics"]
+    assert metrics["accuracy"]["slope"] == 5.0
+    assert metrics["accuracy"]["goal"] == 80 and metrics["accuracy"]["sessions_to_goal"] == 2
+    assert metrics["dichoptic_contrast_level"]["sessions_to_goal"] == 6
+    # Never sent, so never measured; not a flat trend at the schema's default
+    assert "avg_response_time" not in metrics and "fixation_accuracy" not in metrics
+
+    assert client.get(f"/api/patients/{me['id']}/trends?goal_accuracy=high", headers=auth).status_code == 400
+    assert client.get(f"/api/patients/{me['id'] + 100}/trends", headers=auth).status_code == 403
@@ -0,0 +1,70 @@
+import random
+
+import numpy as np
+
+from backend import trials
+
+
+def _session_trials(n=300, seed=7):
+    rng = random.Random(seed)
+    t, events = 0, {"t_ms": [], "x": [], "y": [], "hit": [], "rt_ms": []}
+    for i in range(n):
+        t += rng.randint(800, 2500)
+        hit = rng.random() < 0.8
+        events["t_ms"].append(t)
+        events["x"].append(rng.random())
+        events["y"].append(rng.random())
+        events["hit"].append(hit)
+        events["rt_ms"].append(int(400 + i * 0.5 + rng.gauss(0, 60)) if hit else None)
+    return events
+
+
+def test_blob_round_trips_in_a_few_kb():
+    events = _session_trials()
+    arrays = trials.to_arrays(**events)
+    blob = trials.encode(arrays)
+    assert len(blob) < 4096
+
+    decoded = trials.as_lists(trials.decode(blob))
+    assert decoded["t_ms"] == events["t_ms"]
+    assert decoded["hit"] == events["hit"]
+    assert decoded["rt_ms"] == events["rt_ms"]
+    assert max(abs(a - b) for a, b in zip(decoded["x"], events["x"])) < 1e-4
+
+
+def test_metrics():
+    # Reaction time grows by exactly 10 ms per minute; every 4th trial is a miss
+    t_ms = [i * 6000 for i in range(40)]
+    hit = [i % 4 != 3 for i in range(40)]
+    rt_ms = [300 + t // 6000 if h else None for t, h in zip(t_ms, hit)]
+    metrics = trials.compute_metrics(trials.to_arrays(t_ms, [0.5] * 40, [0.5] * 40, hit, rt_ms))
+
+    assert metrics["trials"] == 40 and metrics["hits"] == 30
+    assert metrics["hit_rate"] == 0.75
+    assert metrics["fatigue_slope_ms_per_min"] == 10.0
+    answered = sorted(rt for rt in rt_ms if rt is not None)
+    assert metrics["rt_percentiles_ms"]["p50"] == float(np.percentile(answered, 50))
+    assert metrics["hit_rate_curve"] == [0.75] * 10
+    assert sum(metrics["rt_histogram"]["counts"]) == 30
+
+
+def test_trials_are_ingested_with_the_session(client, patient_token):
+    auth = {"Authorization": f"Bearer {patient_token}"}
+    me = client.get("/users/me", headers=auth).json()
+    body = {"user_id": me["id"], "game_type": "space", "difficulty": "easy", "duration_seconds": 600, "score": 40}
+
+    bad = {**body, "trials": {"t_ms": [1, 2], "x": [0.1], "y": [0.1], "hit": [True], "rt_ms": [300]}}
+    assert client.post("/api/sessions", headers=auth, json=bad).status_code == 422
+
+    session = client.post("/api/sessions", headers=auth, json={**body, "trials": _session_trials()}).json()
+    res = client.get(f"/api/sessions/{session['id']}/trials", headers=auth)
+    assert res.status_code == 200
+    assert res.json()["n_trials"] == 300
+    assert res.json()["metrics"]["fatigue_slope_ms_per_min"] > 0
+    assert "events" not in res.json() or res.json()["events"] is None
+
+    full = client.get(f"/api/sessions/{session['id']}/trials", headers=auth, params={"include_events": True}).json()
+    assert full["events"]["rt_ms"] == _session_trials()["rt_ms"]
+
+    plain = client.post("/api/sessions", headers=auth, json=body).json()
+    assert client.get(f"/api/sessions/{plain['id']}/trials", headers=auth).status_code == 404